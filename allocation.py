@@ -0,0 +1,85 @@
+"""Batch-aware allocation of dispatches.
+
+A product's stock is held in lots, one stock item per bin and batch. A
+dispatch is split across as many lots as it needs, in one of two orders:
+
+* ``fefo``: the earliest expiry date first, and lots without one last.
+* ``fifo``: the oldest lot first, by order of receipt.
+
+Expired lots are never allocated.
+
+Lots are read a page at a time in allocation order through
+``ix_stock_item_product_expiry`` (product_id, expiry_date, id) or
+``ix_stock_item_product_id`` (product_id, id). A product with thousands of
+lots therefore costs a short range scan over the lots that are actually
+used, not a scan and sort of all of them.
+"""
+
+from collections import namedtuple
+from datetime import date
+
+from db import db
+from models import StockItem
+
+POLICIES = ('fefo', 'fifo')
+PAGE_SIZE = 50
+
+Lot = namedtuple('Lot', 'id bin_id batch expiry_date quantity')
+
+
+def _after(columns, values):
+    """Keyset condition: (columns) > (values), spelled out for every backend."""
+    clause = columns[-1] > values[-1]
+    for column, value in zip(reversed(columns[:-1]), reversed(values[:-1])):
+        clause = (column > value) | ((column == value) & clause)
+    return clause
+
+
+def lots(product_id, policy='fefo', bin_id=None, today=None, batch=None):
+    """Yield the product's allocatable lots (optionally in one bin, or of one batch) in `policy` order."""
+    if policy not in POLICIES:
+        raise ValueError(f'policy must be one of {", ".join(POLICIES)}')
+    today = today or date.today()
+    query = db.session.query(
+        StockItem.id, StockItem.bin_id, StockItem.batch, StockItem.expiry_date, StockItem.quantity
+    ).filter(StockItem.product_id == product_id, StockItem.quantity > 0)
+    if bin_id is not None:
+        query = query.filter(StockItem.bin_id == bin_id)
+    if batch is not None:
+        query = query.filter(StockItem.batch == batch)
+
+    if policy == 'fefo':
+        stages = [
+            (query.filter(StockItem.expiry_date >= today), [StockItem.expiry_date, StockItem.id]),
+            (query.filter(StockItem.expiry_date.is_(None)), [StockItem.id]),
+        ]
+    else:
+        fresh = StockItem.expiry_date.is_(None) | (StockItem.expiry_date >= today)
+        stages = [(query.filter(fresh), [StockItem.id])]
+
+    for stage, keys in stages:
+        after = None
+        while True:
+            page = stage if after is None else stage.filter(_after(keys, after))
+            rows = page.order_by(*keys).limit(PAGE_SIZE).all()
+            for row in rows:
+                yield Lot(*row)
+            if len(rows) < PAGE_SIZE:
+                break
+            after = [getattr(rows[-1], key.key) for key in keys]
+
+
+def allocate(product_id, qty, policy='fefo', bin_id=None, today=None, batch=None):
+    """Split `qty` over the product's lots.
+
+    Returns ``[(lot, quantity), ...]`` in allocation order; the quantities add
+    up to less than `qty` when there is not enough stock.
+    """
+    splits = []
+    for lot in lots(product_id, policy, bin_id, today, batch):
+        if qty <= 0:
+            break
+        take = min(lot.quantity, qty)
+        splits.append((lot, take))
+        qty -= take
+    return splits
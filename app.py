@@ -1,27 +1,89 @@
 from flask import Flask, jsonify, request, send_from_directory
 from db import init_db
 from flask_jwt_extended import JWTManager
+from sqlalchemy.exc import DBAPIError
+import click
 import os
 
 def create_app():
     app = Flask(__name__, static_folder='.', static_url_path='')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///wms.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['DB_ENGINE_PROFILE'] = os.environ.get('DB_ENGINE_PROFILE', 'default')  # default, production
     app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'change-me')
+    app.config['RESOLVER_CACHE_SIZE'] = int(os.environ.get('RESOLVER_CACHE_SIZE', 10000))
+    app.config['RESOLVER_PRELOAD'] = os.environ.get('RESOLVER_PRELOAD', '0') == '1'
+    app.config['MOVEMENT_LEDGER'] = os.environ.get('MOVEMENT_LEDGER', 'off')  # off, wait, async
+    app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('RESPONSE_CACHE_SIZE', 256))
+    app.config['TOKEN_CACHE_SIZE'] = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+    app.config['TOKEN_CACHE_TTL'] = int(os.environ.get('TOKEN_CACHE_TTL', 60))  # seconds
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))  # 0 = request thread
+    app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 32))
+    app.config['DISPATCH_POLICY'] = os.environ.get('DISPATCH_POLICY', 'fefo')  # fefo, fifo
 
     db = init_db(app)
     JWTManager(app)
 
     # register blueprints
-    from auth import bp as auth_bp
+    from auth import bp as auth_bp, token_cache, password_hasher
     from routes_products import bp as products_bp
     from routes_bins import bp as bins_bp
     from routes_stock import bp as stock_bp
+    from routes_search import bp as search_bp, product_search
+    from routes_import import bp as import_bp
+    from routes_sync import bp as sync_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(products_bp)
     app.register_blueprint(bins_bp)
     app.register_blueprint(stock_bp)
+    app.register_blueprint(search_bp)
+    app.register_blueprint(import_bp)
+    app.register_blueprint(sync_bp)
+
+    from models import product_resolver, bin_resolver, movement_ledger, table_versions
+    movement_ledger.init_app(app, db)
+    table_versions.init_app(app, db)
+    from delta_sync import track_deletes
+    track_deletes(db)
+    from models import User
+    token_cache.maxsize = app.config['TOKEN_CACHE_SIZE']
+    token_cache.ttl = app.config['TOKEN_CACHE_TTL']
+    token_cache.watch(db, User)
+    from password_hashing import WerkzeugScheme
+    password_hasher.scheme = WerkzeugScheme(app.config['PASSWORD_HASH_METHOD'])
+    password_hasher.init_app(app)
+    for resolver in (product_resolver, bin_resolver):
+        resolver.cache.maxsize = app.config['RESOLVER_CACHE_SIZE']
+        resolver.watch(db)
+    if app.config['RESOLVER_PRELOAD']:
+        with app.app_context():
+            try:
+                product_resolver.preload()
+                bin_resolver.preload()
+            except DBAPIError:
+                # tables not created yet; /api/init-db fills the caches lazily
+                db.session.rollback()
+
+    @app.cli.command('snapshot-stock')
+    def snapshot_stock_command():
+        """Record a stock snapshot for point-in-time queries; run periodically (e.g. from cron)."""
+        from stock_snapshots import take_snapshot
+        snapshot = take_snapshot()
+        click.echo(f'snapshot {snapshot.id} taken at {snapshot.taken_at.isoformat()}')
+
+    @app.cli.command('import-csv')
+    @click.argument('kind', type=click.Choice(['products', 'bins', 'stock']))
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    def import_csv_command(kind, path):
+        """Bulk import products, bins or opening stock from a CSV file."""
+        from importer import run_import
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            report = run_import(kind, f)
+        click.echo(f"{report['inserted']} {kind} row(s) imported, {report['merged']} merged, {report['failed']} failed")
+        for error in report['errors']:
+            click.echo(f"  line {error['line']}: {error['error']}", err=True)
 
     @app.route('/')
     def index():
@@ -45,6 +107,9 @@ def create_app():
                 b = BinLocation(code='A-12-04', capacity=100)
                 db.session.add(b)
             db.session.commit()
+            product_search.install()
+            product_resolver.invalidate()
+            bin_resolver.invalidate()
         return jsonify({'msg': 'db initialized'})
 
     return app
@@ -1,11 +1,25 @@
-from flask import Blueprint, request, jsonify, current_app
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, current_app, g
+from flask_jwt_extended import create_access_token, get_jwt, get_jwt_identity, verify_jwt_in_request
 from models import User
 from db import db
+from token_cache import TokenCache
+from password_hashing import HashingBusy, PasswordHasher, WerkzeugScheme
 
 bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
+# verified token -> identity with the user's current role; see create_app
+token_cache = TokenCache()
+# slow password hashing on its own bounded pool; see create_app
+password_hasher = PasswordHasher(WerkzeugScheme())
+
+
+@bp.errorhandler(HashingBusy)
+def hashing_busy(e):
+    response = jsonify({'error': 'server busy, retry later'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
 
 @bp.route('/register', methods=['POST'])
 def register():
@@ -20,7 +34,8 @@ def register():
     if User.query.filter_by(username=username).first():
         return jsonify({'error': 'user exists'}), 400
 
-    user = User(username=username, password_hash=generate_password_hash(password), role=role)
+    db.session.rollback()  # don't hold a pooled connection while waiting for the hash
+    user = User(username=username, password_hash=password_hasher.hash(password), role=role)
     db.session.add(user)
     db.session.commit()
     return jsonify({'msg': 'user created', 'username': username}), 201
@@ -36,11 +51,56 @@ def login():
         return jsonify({'error': 'username and password required'}), 400
 
     user = User.query.filter_by(username=username).first()
-    if not user or not check_password_hash(user.password_hash, password):
+    if not user:
         return jsonify({'error': 'invalid credentials'}), 401
-
-    token = create_access_token(identity={'id': user.id, 'username': user.username, 'role': user.role})
-    return jsonify({'access_token': token, 'role': user.role})
+    # the rollback expires `user`, so keep what the token needs
+    stored_hash = user.password_hash
+    identity = {'id': user.id, 'username': user.username, 'role': user.role}
+    db.session.rollback()  # don't hold a pooled connection while waiting for the hash
+    ok, new_hash = password_hasher.verify(stored_hash, password)
+    if not ok:
+        return jsonify({'error': 'invalid credentials'}), 401
+    if new_hash:
+        # hashed with older cost parameters; upgrade while we have the password,
+        # unless the password was changed meanwhile
+        User.query.filter_by(id=identity['id'], password_hash=stored_hash)\
+            .update({'password_hash': new_hash}, synchronize_session=False)
+        db.session.commit()
+
+    token = create_access_token(identity=identity)
+    return jsonify({'access_token': token, 'role': identity['role']})
+
+
+def _verified_identity():
+    """Identity of the request's bearer token, with the role as currently stored.
+
+    A cache hit skips both token verification and the user lookup. Returns
+    None when the token's user no longer exists; invalid tokens raise the
+    usual flask_jwt_extended errors.
+    """
+    header = request.headers.get('Authorization', '')
+    token = header[7:] if header.startswith('Bearer ') else None
+    if token:
+        identity = token_cache.get(token)
+        if identity is not None:
+            return identity
+
+    verify_jwt_in_request()
+    identity = get_jwt_identity() or {}
+    user = db.session.get(User, identity.get('id'))
+    if user is None:
+        return None
+    identity = dict(identity, role=user.role)
+    if token:
+        # only bearer headers are looked up in the cache; tokens from other
+        # JWT_TOKEN_LOCATIONs (cookies, query string) are verified every time
+        token_cache.put(token, user.id, identity, get_jwt().get('exp'))
+    return identity
+
+
+def current_identity():
+    """Identity set by `role_required` for the current request."""
+    return g.get('identity') or {}
 
 
 def role_required(required_roles):
@@ -51,14 +111,27 @@ def role_required(required_roles):
         from functools import wraps
 
         @wraps(fn)
-        @jwt_required()
         def wrapper(*args, **kwargs):
-            identity = get_jwt_identity() or {}
-            role = identity.get('role')
-            if role not in required_roles:
+            identity = _verified_identity()
+            if identity is None:
+                return jsonify({'error': 'user not found'}), 401
+            if identity.get('role') not in required_roles:
                 return jsonify({'error': 'forbidden'}), 403
+            g.identity = identity
             return fn(*args, **kwargs)
 
         return wrapper
 
     return decorator
+
+
+@bp.route('/cache-stats', methods=['GET'])
+@role_required('admin')
+def cache_stats():
+    from models import product_resolver, bin_resolver, table_versions
+    return jsonify({
+        'tokens': token_cache.stats(),
+        'products': product_resolver.cache.stats(),
+        'bins': bin_resolver.cache.stats(),
+        'responses': table_versions.bodies.stats(),
+    })
@@ -0,0 +1,86 @@
+"""Readers against one writer on a SQLite file, for each DB_ENGINE_PROFILE.
+
+Four threads run ``SELECT count(*)`` while a fifth inserts and commits, for
+a few seconds per profile, and the read and write rates are printed:
+
+    python benchmarks/engine_profiles.py [seconds]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
+
+from db import ENGINE_PROFILES, configure_engine, install_pragmas
+
+READERS = 4
+SEED_ROWS = 5000
+
+
+def run(profile, seconds):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app.config['DB_ENGINE_PROFILE'] = profile
+    configure_engine(app)
+    db = SQLAlchemy(app)
+    install_pragmas(app, db)
+    with app.app_context():
+        db.session.execute(text('CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)'))
+        db.session.execute(text(
+            'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :rows) '
+            "INSERT INTO t (v) SELECT 'x' FROM n"
+        ), {'rows': SEED_ROWS})
+        db.session.commit()
+        journal = db.session.execute(text('PRAGMA journal_mode')).scalar()
+
+    stop = time.perf_counter() + seconds
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def bump(key):
+        with lock:
+            counts[key] += 1
+
+    def writer():
+        with app.app_context():
+            while time.perf_counter() < stop:
+                try:
+                    db.session.execute(text("INSERT INTO t (v) VALUES ('y')"))
+                    time.sleep(0.001)  # hold the write lock for a moment, like a request would
+                    db.session.commit()
+                    bump('writes')
+                except Exception:
+                    db.session.rollback()
+                    bump('errors')
+
+    def reader():
+        with app.app_context():
+            while time.perf_counter() < stop:
+                try:
+                    db.session.execute(text('SELECT count(*) FROM t')).scalar()
+                    db.session.commit()
+                    bump('reads')
+                except Exception:
+                    db.session.rollback()
+                    bump('errors')
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(READERS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(f"{profile:<12} journal={journal:<8} reads/s={counts['reads'] / seconds:>8.0f} "
+          f"writes/s={counts['writes'] / seconds:>6.0f} errors={counts['errors']}")
+
+
+if __name__ == '__main__':
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    for name in ENGINE_PROFILES:
+        run(name, seconds)
@@ -0,0 +1,94 @@
+"""Login storm against stock.py while a stock read is probed.
+
+Fires LOGINS concurrent logins at ``/api/auth/login`` while another thread
+times ``GET /api/bins`` every 10 ms, and prints login latency, how many were
+turned away with 503, and the read latency before and during the storm:
+
+    python benchmarks/login_storm.py [workers] [max_pending] [logins]
+
+`workers` and `max_pending` set PASSWORD_HASH_WORKERS and
+PASSWORD_HASH_MAX_PENDING (0 workers hashes on the request thread).
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+args = sys.argv[1:]
+workers = args[0] if len(args) > 0 else '2'
+max_pending = args[1] if len(args) > 1 else '32'
+logins = args[2] if len(args) > 2 else '200'
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['BCRYPT_LOG_ROUNDS'] = '10'
+os.environ['PASSWORD_HASH_WORKERS'] = workers
+os.environ['PASSWORD_HASH_MAX_PENDING'] = max_pending
+
+import jwt  # noqa: E402
+
+import stock  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[max(0, int(len(values) * p) - 1)] * 1000 if values else float('nan')
+
+
+def main():
+    client = stock.app.test_client()
+    client.post('/api/init-db')
+    with stock.app.app_context():
+        user = stock.User.query.filter_by(username='admin').one()
+        token = jwt.encode({'user_id': user.id, 'exp': datetime.utcnow() + timedelta(hours=1)},
+                           stock.app.config['SECRET_KEY'], algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+    client.post('/api/auth/login', json={'username': 'admin', 'password': 'admin123'})  # settle the hash
+
+    latencies, codes, probe = [], [], []
+    stop = threading.Event()
+
+    def login():
+        c = stock.app.test_client()
+        start = time.perf_counter()
+        response = c.post('/api/auth/login', json={'username': 'admin', 'password': 'admin123'})
+        latencies.append(time.perf_counter() - start)
+        codes.append(response.status_code)
+
+    def prober():
+        c = stock.app.test_client()
+        while not stop.is_set():
+            start = time.perf_counter()
+            c.get('/api/bins?limit=1', headers=headers)
+            probe.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    probing = threading.Thread(target=prober)
+    probing.start()
+    time.sleep(0.3)
+    idle = list(probe)
+    probe.clear()
+
+    threads = [threading.Thread(target=login) for _ in range(int(logins))]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    storm = time.perf_counter() - start
+    stop.set()
+    probing.join()
+
+    ok = [lat for lat, code in zip(latencies, codes) if code == 200]
+    print(f'workers={workers} max_pending={max_pending}: {logins} logins in {storm:.1f} s, '
+          f'{len(ok)} ok, {codes.count(503)} turned away (503)')
+    print(f'  login p50 {percentile(ok, .5):.0f} ms, p99 {percentile(ok, .99):.0f} ms')
+    print(f'  stock read p50 idle {percentile(idle, .5):.1f} ms, during the storm '
+          f'p50 {percentile(probe, .5):.1f} ms, p99 {percentile(probe, .99):.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""Walk distance and planning time of pick routes on a synthetic warehouse.
+
+Four zones of 20 aisles by 40 shelves. For each order size, random orders
+are planned and compared with walking them in the order given and in bin
+code order; the planning time is printed too:
+
+    python benchmarks/pick_route_walk.py [orders per size]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pick_route import Layout, plan, walk_length
+
+ZONES = 'ABCD'
+SIZES = (10, 50, 200)
+
+
+def run(lines, orders, rng):
+    layout = Layout(ZONES, aisles_per_zone=20, shelves_per_aisle=40)
+    bins = [(z, a, s) for z in ZONES for a in range(1, 21) for s in range(1, 41)]
+    times, vs_input, vs_code = [], [], []
+    for _ in range(orders):
+        order = rng.sample(bins, lines)
+        start = time.perf_counter()
+        index, distance = plan(order, layout)
+        times.append(time.perf_counter() - start)
+        vs_input.append(distance / walk_length(order, layout))
+        by_code = sorted(order, key=lambda b: (ZONES.index(b[0]), b[1], b[2]))
+        vs_code.append(distance / walk_length(by_code, layout))
+    print(f"{lines:>4} lines  plan ms mean={1000 * sum(times) / orders:>6.1f} max={1000 * max(times):>6.1f}  "
+          f"route/input order={sum(vs_input) / orders:.2f}  route/code order={sum(vs_code) / orders:.2f}")
+
+
+if __name__ == '__main__':
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    rng = random.Random(1)
+    for lines in SIZES:
+        run(lines, orders, rng)
@@ -0,0 +1,170 @@
+"""ABC cycle-count scheduling.
+
+Products are ranked by how much they move over the last
+``CYCLE_COUNT_WINDOW_DAYS`` days. Each product's score is half its share of
+movement value (quantity times ``unit_price``) and half its share of the
+number of movements. Walking down the ranking, the products that make up
+the first ``CYCLE_COUNT_CUTOFFS[0]`` of the total score are class A, those up
+to ``CYCLE_COUNT_CUTOFFS[1]`` are class B, and the rest are class C.
+
+Each class is due for a count every ``CYCLE_COUNT_INTERVALS`` days, e.g.
+A monthly and C twice a year. The daily list takes, per class, its share of
+the workload, ``ceil(products / interval)``, from the due products that were
+counted longest ago. A items are therefore counted several times for every
+count of a C item, and every day's list is about the same size.
+
+Movement history is read through a per-product, per-day rollup that
+:meth:`CycleCountScheduler.refresh_rollup` keeps current incrementally, run
+from cron rather than per request. A classification sums at most ``window``
+rows per product, however many movements there were, and reads everything it
+needs per product in one query. The scoring, classing and scheduling are
+NumPy array operations over the columns of that result.
+"""
+
+import math
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, text
+
+CLASSES = ('A', 'B', 'C')
+NEVER = -1  # last-counted day number for products never counted
+ORDINAL_ONE = np.datetime64('0001-01-01', 'D')  # date.fromordinal(1)
+
+
+class CycleCountScheduler:
+    def __init__(self, db, product_model, movement_model, rollup_model, stocktake_model, total_model):
+        self.db = db
+        self.Product = product_model
+        self.Movement = movement_model
+        self.Rollup = rollup_model
+        self.Stocktake = stocktake_model
+        self.Total = total_model
+        self.window = 90
+        self.cutoffs = (0.8, 0.95)
+        self.intervals = (30, 90, 180)
+        self.lag = 7
+
+    def init_app(self, app):
+        self.window = app.config.get('CYCLE_COUNT_WINDOW_DAYS', self.window)
+        self.cutoffs = tuple(app.config.get('CYCLE_COUNT_CUTOFFS', self.cutoffs))
+        self.intervals = tuple(app.config.get('CYCLE_COUNT_INTERVALS', self.intervals))
+        self.lag = app.config.get('CYCLE_COUNT_ROLLUP_LAG_DAYS', self.lag)
+
+    # Rollup
+
+    def refresh_rollup(self, full=False):
+        """Bring the rollup up to date; returns the number of (product, day) rows written.
+
+        The last ``lag`` rolled-up days (``CYCLE_COUNT_ROLLUP_LAG_DAYS``) are
+        rebuilt along with anything newer, so movements that are written late
+        or dated a few days back are still counted. Older back-dated
+        movements need a `full` rebuild. It is safe to run at any time and as
+        often as wanted (e.g. from cron); on Postgres concurrent refreshes
+        wait for each other on an advisory lock.
+        """
+        session = self.db.session
+        M, R = self.Movement, self.Rollup
+        if session.get_bind().dialect.name == 'postgresql':
+            session.execute(text("SELECT pg_advisory_xact_lock(hashtext('movement_rollup'))"))
+        last = None if full else session.query(func.max(R.day)).scalar()
+        start = last - timedelta(days=self.lag) if last is not None else None
+        stale = session.query(R)
+        if start is not None:
+            stale = stale.filter(R.day >= start)
+        stale.delete(synchronize_session=False)
+
+        day = func.date(M.movement_date)
+        rows = session.query(M.product_id, day, func.sum(M.quantity), func.count())
+        if start is not None:
+            rows = rows.filter(M.movement_date >= datetime.combine(start, datetime.min.time()))
+        rows = rows.group_by(M.product_id, day)
+        written = session.execute(R.__table__.insert().from_select(
+            ['product_id', 'day', 'quantity', 'movements'], rows
+        )).rowcount
+        session.commit()
+        return written
+
+    # Classification
+
+    def classify(self, today=None):
+        """Score and class every product with stock on hand.
+
+        Returns a dict of NumPy arrays: ``product_id``, ``score``, ``abc``
+        (0 = A, 1 = B, 2 = C) and ``last_counted`` (day ordinal, or -1).
+        """
+        session = self.db.session
+        P, R, S, T = self.Product, self.Rollup, self.Stocktake, self.Total
+        today = today or date.today()
+        since = today - timedelta(days=self.window)
+
+        activity = session.query(R.product_id, func.sum(R.quantity).label('quantity'),
+                                 func.sum(R.movements).label('movements'))\
+            .filter(R.day > since, R.day <= today)\
+            .group_by(R.product_id).subquery()
+        counted = session.query(S.product_id, func.max(S.stocktake_date).label('last'))\
+            .group_by(S.product_id).subquery()
+        rows = session.query(P.id, func.coalesce(P.unit_price, 0.0),
+                             func.coalesce(activity.c.quantity, 0), func.coalesce(activity.c.movements, 0),
+                             counted.c.last)\
+            .join(T, T.product_id == P.id)\
+            .outerjoin(activity, activity.c.product_id == P.id)\
+            .outerjoin(counted, counted.c.product_id == P.id)\
+            .filter(T.quantity > 0).all()
+        if not rows:
+            return {key: np.array([]) for key in ('product_id', 'score', 'abc', 'last_counted')}
+
+        ids, price, quantity, moves, last = zip(*rows)
+        ids = np.array(ids, dtype=object)
+        price, quantity, moves = (np.array(column, dtype=float) for column in (price, quantity, moves))
+        # day ordinals as date.toordinal() numbers them; None becomes NaT
+        last = np.array(last, dtype='datetime64[D]')
+        last = np.where(np.isnat(last), NEVER, (last - ORDINAL_ONE).astype(np.int64) + 1)
+
+        value = quantity * price
+        score = 0.5 * value / max(value.sum(), 1e-9) + 0.5 * moves / max(moves.sum(), 1e-9)
+        if score.sum() == 0:
+            # nothing moved: everything is C
+            score[:] = 1.0 / len(score)
+            abc = np.full(len(score), len(CLASSES) - 1)
+        else:
+            order = np.argsort(-score, kind='stable')
+            # share of the total score held by strictly better-ranked products
+            before = np.empty_like(score)
+            before[order] = np.cumsum(score[order]) - score[order]
+            abc = np.searchsorted(np.array(self.cutoffs), before / score.sum(), side='right')
+        return {'product_id': ids, 'score': score, 'abc': abc, 'last_counted': last}
+
+    def schedule(self, today=None, classes=None):
+        """The day's count list: ``[(product_id, class letter, last counted date or None), ...]``.
+
+        `classes` is a :meth:`classify` result to reuse, computed for `today`.
+        """
+        today = today or date.today()
+        c = classes if classes is not None else self.classify(today)
+        if not len(c['product_id']):
+            return []
+        intervals = np.array(self.intervals)[c['abc']]
+        age = np.where(c['last_counted'] == NEVER, np.iinfo(np.int64).max // 2,
+                       today.toordinal() - c['last_counted'])
+        due = age >= intervals
+
+        picked = []
+        for k in range(len(CLASSES)):
+            members = c['abc'] == k
+            quota = math.ceil(members.sum() / self.intervals[k])
+            candidates = np.flatnonzero(members & due)
+            # longest since counted first, then the bigger movers
+            candidates = candidates[np.lexsort((-c['score'][candidates], -age[candidates]))]
+            picked.extend(candidates[:quota])
+
+        return [(
+            c['product_id'][i],
+            CLASSES[c['abc'][i]],
+            date.fromordinal(c['last_counted'][i]) if c['last_counted'][i] != NEVER else None,
+        ) for i in picked]
+
+    @staticmethod
+    def summary(classes):
+        """Number of products in each class of a :meth:`classify` result."""
+        return {letter: int((classes['abc'] == k).sum()) for k, letter in enumerate(CLASSES)}
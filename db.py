@@ -1,7 +1,85 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
 db = SQLAlchemy()
 
+# Engine profiles, selected with the DB_ENGINE_PROFILE config key. Individual
+# settings can be overridden through DB_ENGINE_OVERRIDES, e.g.
+# {'sqlite_synchronous': 'FULL', 'pool_size': 20}.
+ENGINE_PROFILES = {
+    # driver defaults: rollback journal on SQLite, default pool elsewhere
+    'default': {},
+    # several workers sharing one database: readers never block on the
+    # writer (WAL), writers wait instead of failing with "database is locked"
+    'production': {
+        'sqlite_journal_mode': 'WAL',
+        'sqlite_synchronous': 'NORMAL',
+        'sqlite_busy_timeout': 5000,        # ms
+        'sqlite_mmap_size': 256 * 1024 * 1024,
+        'sqlite_cache_size': -64 * 1024,    # negative = KiB, i.e. 64 MiB per connection
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,               # s
+    },
+}
+
+SQLITE_PRAGMAS = {
+    'sqlite_journal_mode': 'journal_mode',
+    'sqlite_synchronous': 'synchronous',
+    'sqlite_busy_timeout': 'busy_timeout',
+    'sqlite_mmap_size': 'mmap_size',
+    'sqlite_cache_size': 'cache_size',
+}
+POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_pre_ping', 'pool_recycle')
+
+
+def engine_profile(app):
+    name = app.config.get('DB_ENGINE_PROFILE', 'default')
+    if name not in ENGINE_PROFILES:
+        raise ValueError(f'unknown DB_ENGINE_PROFILE {name!r}')
+    profile = dict(ENGINE_PROFILES[name])
+    profile.update(app.config.get('DB_ENGINE_OVERRIDES') or {})
+    return profile
+
+
+def configure_engine(app):
+    """Put the profile's pool settings into SQLALCHEMY_ENGINE_OPTIONS.
+
+    Must run before the SQLAlchemy extension is initialised on `app`.
+    """
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI', '')
+    if uri.startswith('sqlite'):
+        return
+    profile = engine_profile(app)
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    for key in POOL_OPTIONS:
+        if key in profile:
+            options.setdefault(key, profile[key])
+
+
+def install_pragmas(app, database):
+    """Apply the profile's SQLite pragmas to every new connection of `database`."""
+    profile = engine_profile(app)
+    pragmas = [(SQLITE_PRAGMAS[k], v) for k, v in profile.items() if k in SQLITE_PRAGMAS]
+    if not pragmas:
+        return
+
+    with app.app_context():
+        engine = database.engine
+        if engine.dialect.name != 'sqlite':
+            return
+
+        @event.listens_for(engine, 'connect')
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma, value in pragmas:
+                cursor.execute(f'PRAGMA {pragma}={value}')
+            cursor.close()
+
+
 def init_db(app):
+    configure_engine(app)
     db.init_app(app)
+    install_pragmas(app, db)
     return db
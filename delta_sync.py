@@ -0,0 +1,106 @@
+"""Delta sync for offline scanners.
+
+Products, bins and stock items carry an indexed ``updated_at`` that is set on
+insert and on every update (including the Core updates of the atomic stock
+operations), and deletes leave a :class:`~models.SyncTombstone`. A sync reads
+each entity with an index range scan on ``updated_at`` between the client's
+cursor and the moment the sync started, paged on ``(updated_at, id)``.
+
+Rows are stamped when written but only become visible at commit, so each
+sync re-reads ``SYNC_OVERLAP`` before its cursor; clients apply rows as
+upserts, which makes the repeats harmless.
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from db import db
+from list_query import decode_cursor, encode_cursor
+from models import BinLocation, Product, StockItem, SyncTombstone
+
+SYNC_OVERLAP = timedelta(seconds=10)
+DEFAULT_SYNC_LIMIT = 1000
+MAX_SYNC_LIMIT = 5000
+
+# (name in the response, model, fields sent for each row)
+ENTITIES = [
+    ('products', Product, ['id', 'part_number', 'description']),
+    ('bins', BinLocation, ['id', 'code', 'capacity']),
+    ('items', StockItem, ['id', 'product_id', 'bin_id', 'quantity', 'batch', 'expiry_date']),
+]
+_NAMES = {model: name for name, model, _ in ENTITIES}
+
+
+def _record_deletes(session, flush_context, instances):
+    for obj in session.deleted:
+        name = _NAMES.get(type(obj))
+        if name is not None:
+            session.add(SyncTombstone(entity=name, entity_id=obj.id, deleted_at=datetime.utcnow()))
+
+
+def track_deletes(database):
+    """Record tombstones for ORM deletes of synced rows made through `database`'s session."""
+    event.listen(database.session, 'before_flush', _record_deletes)
+
+
+def _plain(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def _stages():
+    for name, model, fields in ENTITIES:
+        yield name, model, [getattr(model, f) for f in fields], model.updated_at
+    yield 'deleted', SyncTombstone, [SyncTombstone.entity, SyncTombstone.entity_id], SyncTombstone.deleted_at
+
+
+def sync_page(cursor=None, limit=DEFAULT_SYNC_LIMIT):
+    """Return one page of changes after `cursor` (None for a full download).
+
+    The result carries ``cursor`` to send next time and ``more``, which is
+    true while the current sync has further pages.
+    """
+    state = decode_cursor(cursor) if cursor else {}
+    if not isinstance(state, dict):
+        raise ValueError('invalid cursor')
+    since = datetime.fromisoformat(state['since']) if state.get('since') else None
+    until = datetime.fromisoformat(state['until']) if state.get('until') else datetime.utcnow()
+    stage = state.get('stage', 0)
+    after = state.get('after')
+    if not isinstance(stage, int) or not (
+            after is None or isinstance(after, list) and len(after) == 2 and isinstance(after[1], int)):
+        raise ValueError('invalid cursor')
+
+    result = {name: {'fields': fields, 'rows': []} for name, _, fields in ENTITIES}
+    result['deleted'] = []
+    budget = limit
+    for index, (name, model, columns, stamp) in enumerate(_stages()):
+        if index < stage:
+            continue
+        if name == 'deleted' and since is None:
+            break  # a full download has nothing to delete
+        query = db.session.query(*columns, stamp, model.id).filter(stamp <= until)
+        if since is not None:
+            query = query.filter(stamp > since - SYNC_OVERLAP)
+        if after and index == stage:
+            last_stamp, last_id = datetime.fromisoformat(after[0]), after[1]
+            query = query.filter((stamp > last_stamp) | ((stamp == last_stamp) & (model.id > last_id)))
+        rows = query.order_by(stamp, model.id).limit(budget + 1).all()
+
+        target = result['deleted'] if name == 'deleted' else result[name]['rows']
+        for row in rows[:budget]:
+            target.append([_plain(v) for v in row[:len(columns)]])
+        if len(rows) > budget:
+            last = rows[budget - 1] if budget else None
+            state = {
+                'since': state.get('since'),
+                'until': until.isoformat(),
+                'stage': index,
+                'after': [last[-2].isoformat(), last[-1]] if last else None,
+            }
+            result.update(cursor=encode_cursor(state), more=True)
+            return result
+        budget -= len(rows)
+
+    result.update(cursor=encode_cursor({'since': until.isoformat()}), more=False)
+    return result
@@ -0,0 +1,210 @@
+"""Streaming CSV import for products, bins and opening stock.
+
+The CSV is read row by row and processed in chunks of ``CHUNK_SIZE`` rows:
+each chunk is validated, checked against existing rows with one IN query,
+inserted with a single executemany and committed, so memory stays bounded by
+the chunk size whatever the file size. Rows that fail validation are skipped
+and reported with their line number, as are products and bins that already
+exist. Stock for a lot (product, bin and batch) that already exists is added
+to it, as a receive would.
+"""
+
+import csv
+from datetime import datetime
+
+from sqlalchemy import bindparam
+
+from db import db
+from models import BinLocation, Product, StockItem, bin_resolver, movement_ledger, product_resolver
+
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = 0
+        self.merged = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def to_dict(self):
+        errors = sorted(self.errors, key=lambda e: e['line'])
+        return {'inserted': self.inserted, 'merged': self.merged, 'failed': self.error_count, 'errors': errors}
+
+
+def _chunks(reader):
+    chunk = []
+    for row in reader:
+        # line_num is the physical line the row ended on; header is line 1
+        chunk.append((reader.line_num, row))
+        if len(chunk) >= CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _text(row, field):
+    value = (row.get(field) or '').strip()
+    return value or None
+
+
+def _int(row, field, required=False):
+    value = _text(row, field)
+    if value is None:
+        if required:
+            raise ValueError(f'{field} required')
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'invalid {field}')
+
+
+def _date(row, field):
+    value = _text(row, field)
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'invalid {field}, expected YYYY-MM-DD')
+
+
+def _import_catalogue(reader, model, key_field, build):
+    """Shared path for products and bins: validate, dedupe on `key_field`, insert."""
+    report = ImportReport()
+    key_column = getattr(model, key_field)
+    for chunk in _chunks(reader):
+        rows = {}
+        for line, row in chunk:
+            key = _text(row, key_field)
+            if key is None:
+                report.error(line, f'{key_field} required')
+                continue
+            if key in rows:
+                report.error(line, f'duplicate {key_field} in file')
+                continue
+            try:
+                rows[key] = (line, build(key, row))
+            except ValueError as exc:
+                report.error(line, str(exc))
+
+        existing = {k for (k,) in db.session.query(key_column).filter(key_column.in_(list(rows)))}
+        values = []
+        for key, (line, value) in rows.items():
+            if key in existing:
+                report.error(line, f'{key_field} exists')
+            else:
+                values.append(value)
+        if values:
+            db.session.execute(model.__table__.insert(), values)
+            db.session.commit()
+            report.inserted += len(values)
+    return report
+
+
+def import_products(reader):
+    return _import_catalogue(reader, Product, 'part_number', lambda key, row: {
+        'part_number': key,
+        'description': _text(row, 'description'),
+    })
+
+
+def import_bins(reader):
+    return _import_catalogue(reader, BinLocation, 'code', lambda key, row: {
+        'code': key,
+        'capacity': _int(row, 'capacity'),
+    })
+
+
+def import_stock(reader, user_id=None):
+    """Import opening stock; lines for an existing (product, bin, batch) lot are added to it."""
+    report = ImportReport()
+    for chunk in _chunks(reader):
+        products = product_resolver.resolve_many(_text(row, 'part_number') for _, row in chunk)
+        bins = bin_resolver.resolve_many(_text(row, 'bin_code') for _, row in chunk)
+
+        rows = {}
+        for line, row in chunk:
+            try:
+                product = products.get(_text(row, 'part_number'))
+                if product is None:
+                    raise ValueError('product not found')
+                binloc = bins.get(_text(row, 'bin_code'))
+                if binloc is None:
+                    raise ValueError('bin not found')
+                qty = _int(row, 'quantity', required=True)
+                if qty <= 0:
+                    raise ValueError('quantity must be positive')
+                item = {
+                    'product_id': product.id,
+                    'bin_id': binloc.id,
+                    'quantity': qty,
+                    'batch': _text(row, 'batch'),
+                    'expiry_date': _date(row, 'expiry_date'),
+                }
+            except ValueError as exc:
+                report.error(line, str(exc))
+                continue
+            key = (item['product_id'], item['bin_id'], item['batch'])
+            if key in rows:
+                report.error(line, 'duplicate stock line in file')
+                continue
+            rows[key] = (line, item)
+
+        existing = {}
+        if rows:
+            query = db.session.query(StockItem.product_id, StockItem.bin_id, StockItem.batch, StockItem.id).filter(
+                StockItem.product_id.in_({k[0] for k in rows}),
+                StockItem.bin_id.in_({k[1] for k in rows}),
+            )
+            existing = {(r.product_id, r.bin_id, r.batch): r.id for r in query}
+        items = []
+        merges = []
+        for key, (line, item) in rows.items():
+            if key in existing:
+                merges.append({'item_id': existing[key], 'qty': item['quantity']})
+            else:
+                items.append(item)
+        if items:
+            db.session.execute(StockItem.__table__.insert(), items)
+        if merges:
+            db.session.execute(
+                StockItem.__table__.update().where(StockItem.id == bindparam('item_id'))
+                .values(quantity=StockItem.quantity + bindparam('qty')),
+                merges
+            )
+        if rows:
+            movement_ledger.add_rows(db.session, [
+                {'product_id': it['product_id'], 'from_bin_id': None, 'to_bin_id': it['bin_id'],
+                 'quantity': it['quantity'], 'user_id': user_id, 'reason': 'import', 'batch': it['batch']}
+                for _, it in rows.values()
+            ])
+            db.session.commit()
+            report.inserted += len(items)
+            report.merged += len(merges)
+    return report
+
+
+KINDS = ('products', 'bins', 'stock')
+
+
+def run_import(kind, text_stream, user_id=None):
+    """Import CSV text from `text_stream` as `kind` and return the report dict."""
+    reader = csv.DictReader(text_stream)
+    if kind == 'products':
+        report = import_products(reader)
+    elif kind == 'bins':
+        report = import_bins(reader)
+    elif kind == 'stock':
+        report = import_stock(reader, user_id)
+    else:
+        raise ValueError(f'unknown import kind {kind!r}')
+    return report.to_dict()
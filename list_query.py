@@ -0,0 +1,154 @@
+"""Shared layer behind the list endpoints.
+
+A :class:`ListSpec` describes one listing: the output fields and the column
+expression behind each, the sort keys and the filters it accepts. It turns
+request arguments into one query:
+
+    fields=a,b       only these fields; only their columns are selected
+    sort=key, -key   one of the spec's sort keys, '-' for descending
+    limit, cursor    keyset pagination on (sort key, id); the cursor for the
+                     next page is returned in the ``X-Next-Cursor`` header
+    <filter>=value   any of the spec's filters; other arguments are rejected
+
+Sort expressions must be numbers or strings, so they round-trip through the
+cursor, and never NULL (wrap nullable columns in ``coalesce``), or rows would
+be skipped when paging across them.
+"""
+
+import base64
+import json
+from datetime import date, datetime
+
+from flask import jsonify
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+LIST_ARGUMENTS = ('fields', 'sort', 'limit', 'cursor')
+
+
+def encode_cursor(values):
+    """Pack the sort key of the last row on a page into an opaque cursor."""
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Inverse of `encode_cursor`; returns None for a missing or malformed cursor."""
+    if not cursor:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+
+
+def page_size(value):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+class ListError(ValueError):
+    """Bad list arguments (unknown field or sort key, malformed filter value)."""
+
+
+def int_filter(build):
+    """Wrap a filter builder so it receives the value parsed as an int."""
+    def parse(value, name):
+        try:
+            return build(int(value))
+        except ValueError:
+            raise ListError(f'{name} must be an integer')
+    return parse
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+class ListSpec:
+    def __init__(self, query, columns, sorts, filters=None, default_sort='id', id_field='id'):
+        """
+        query    -- callable taking the column expressions to select and
+                    returning a Query with the listing's joins applied
+        columns  -- ordered ``{field: column expression}``
+        sorts    -- ``{sort key: expression}``
+        filters  -- ``{argument: builder}``; a builder takes ``(value, name)``
+                    and returns a filter clause
+        """
+        self.query = query
+        self.columns = columns
+        self.sorts = sorts
+        self.filters = filters or {}
+        self.default_sort = default_sort
+        self.id_column = columns[id_field]
+
+    def fields(self, value):
+        if not value:
+            return list(self.columns)
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.columns]
+        if unknown:
+            raise ListError(f"unknown field(s): {', '.join(unknown)}")
+        return names
+
+    def page(self, args):
+        """Return ``(rows, next_cursor)`` for the request arguments `args`."""
+        unknown = sorted(name for name in args if name not in LIST_ARGUMENTS and name not in self.filters)
+        if unknown:
+            raise ListError(f"unknown filter(s): {', '.join(unknown)}")
+        fields = self.fields(args.get('fields'))
+        sort = args.get('sort') or self.default_sort
+        descending = sort.startswith('-')
+        key = sort.lstrip('-')
+        if key not in self.sorts:
+            raise ListError(f"sort must be one of: {', '.join(self.sorts)}")
+        sort_expr = self.sorts[key]
+
+        query = self.query(
+            *(self.columns[name].label(name) for name in fields),
+            sort_expr.label('sort_key_'),
+            self.id_column.label('row_id_'),
+        )
+        for name, build in self.filters.items():
+            value = args.get(name)
+            if value not in (None, ''):
+                query = query.filter(build(value, name))
+
+        cursor = decode_cursor(args.get('cursor'))
+        if cursor:
+            if not isinstance(cursor, list) or len(cursor) != 3 or cursor[0] != sort:
+                raise ListError('cursor does not match this sort')
+            _, last_key, last_id = cursor
+            if descending:
+                query = query.filter((sort_expr < last_key) | ((sort_expr == last_key) & (self.id_column < last_id)))
+            else:
+                query = query.filter((sort_expr > last_key) | ((sort_expr == last_key) & (self.id_column > last_id)))
+        if descending:
+            query = query.order_by(sort_expr.desc(), self.id_column.desc())
+        else:
+            query = query.order_by(sort_expr, self.id_column)
+
+        limit = page_size(args.get('limit'))
+        rows = query.limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]._mapping
+            next_cursor = encode_cursor([sort, _plain(last['sort_key_']), last['row_id_']])
+        out = []
+        for row in rows[:limit]:
+            mapping = row._mapping
+            out.append({name: _plain(mapping[name]) for name in fields})
+        return out, next_cursor
+
+    def response(self, args):
+        """Run :meth:`page` and wrap the result as a JSON list response."""
+        rows, next_cursor = self.page(args)
+        response = jsonify(rows)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
@@ -1,5 +1,8 @@
 from datetime import datetime
 from db import db
+from resolvers import CodeResolver
+from movement_ledger import MovementLedger
+from table_versions import TableVersions
 
 
 class User(db.Model):
@@ -14,6 +17,7 @@ class Product(db.Model):
     part_number = db.Column(db.String(120), unique=True, nullable=False)
     description = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 
 class BinLocation(db.Model):
@@ -21,6 +25,7 @@ class BinLocation(db.Model):
     code = db.Column(db.String(80), unique=True, nullable=False)
     capacity = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 
 class StockItem(db.Model):
@@ -30,10 +35,20 @@ class StockItem(db.Model):
     quantity = db.Column(db.Integer, nullable=False, default=0)
     batch = db.Column(db.String(120), nullable=True)
     expiry_date = db.Column(db.Date, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     product = db.relationship('Product')
     bin = db.relationship('BinLocation')
 
+    __table_args__ = (
+        # allocation order for dispatches, see allocation.py
+        db.Index('ix_stock_item_product_expiry', 'product_id', 'expiry_date', 'id'),
+        db.Index('ix_stock_item_product_id', 'product_id', 'id'),
+        # one stock item per lot, so concurrent receives cannot both insert
+        # one; a missing batch counts as a batch of its own
+        db.Index('uq_stock_item_lot', 'product_id', 'bin_id', db.func.coalesce(batch, ''), unique=True),
+    )
+
 
 class StockMovement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -43,7 +58,8 @@ class StockMovement(db.Model):
     quantity = db.Column(db.Integer, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     reason = db.Column(db.String(255), nullable=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    batch = db.Column(db.String(120), nullable=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     product = db.relationship('Product')
     from_bin = db.relationship('BinLocation', foreign_keys=[from_bin_id])
@@ -61,3 +77,42 @@ class StocktakeRecord(db.Model):
 
     product = db.relationship('Product')
     bin = db.relationship('BinLocation')
+
+
+class StockSnapshot(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # highest StockMovement id included; see stock_snapshots.py
+    movement_id = db.Column(db.Integer, nullable=True, index=True)
+    taken_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class StockSnapshotLine(db.Model):
+    snapshot_id = db.Column(db.Integer, db.ForeignKey('stock_snapshot.id'), primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    bin_id = db.Column(db.Integer, db.ForeignKey('bin_location.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False)
+
+
+class SyncTombstone(db.Model):
+    # deleted products, bins and stock items, for the delta sync
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(32), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class TableVersion(db.Model):
+    # a table's version is the sum over its shards; see table_versions.py
+    name = db.Column(db.String(64), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, default=0)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+# part_number / bin code -> id lookups shared by the stock routes
+product_resolver = CodeResolver(Product, 'part_number', ['id', 'part_number'])
+bin_resolver = CodeResolver(BinLocation, 'code', ['id', 'code'])
+
+movement_ledger = MovementLedger(StockMovement)
+
+# bumped on every committed write; drive ETags of the list endpoints
+table_versions = TableVersions(TableVersion, ['product', 'bin_location', 'stock_item'])
@@ -0,0 +1,232 @@
+"""Write-behind ledger for StockMovement rows.
+
+With ``MOVEMENT_LEDGER = 'off'`` (the default) movements are added to the
+request's session and committed with the stock change, as before.
+
+In ledger mode the request transaction only carries the StockItem change.
+Movement rows are held on the session until it commits, then queued for a
+background writer that inserts whatever has accumulated (up to
+``MOVEMENT_LEDGER_BATCH`` rows, waiting at most ``MOVEMENT_LEDGER_LINGER_MS``
+for more) in one transaction, so concurrent requests share a commit:
+
+* ``'wait'``  - the request blocks after its own commit until its movements
+  are durable (group commit), for at most ``MOVEMENT_LEDGER_WAIT_MS``;
+* ``'async'`` - fire-and-forget; rows still queued are lost if the process
+  dies, but a normal shutdown drains the queue.
+
+A rolled-back request discards its queued movements. A batch the writer
+cannot insert is logged and queued again, up to ``REQUEUE_LIMIT`` times,
+before it is dropped; the stock change it belongs to is already committed,
+so the request is never failed for it.
+
+The writer thread is started on first use in each process, so it survives a
+fork (e.g. ``gunicorn --preload``) and a restart after :meth:`drain`.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+MODES = ('off', 'wait', 'async')
+WRITE_ATTEMPTS = 3
+REQUEUE_LIMIT = 5
+
+_STOP = object()
+
+
+class _Ticket:
+    __slots__ = ('rows', 'done', 'error', 'requeues')
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.done = threading.Event()
+        self.error = None
+        self.requeues = 0
+
+
+class MovementLedger:
+    def __init__(self, model):
+        self.model = model
+        self.table = model.__table__
+        self.mode = 'off'
+        self._reset()
+
+    def _reset(self):
+        # per-process writer state; a forked child starts over with its own
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._conn = None
+        self._pid = os.getpid()
+
+    def init_app(self, app, database):
+        self.mode = app.config.get('MOVEMENT_LEDGER', 'off')
+        if self.mode not in MODES:
+            raise ValueError(f'MOVEMENT_LEDGER must be one of {MODES}')
+        if self.mode == 'off':
+            return
+        self.app = app
+        self.db = database
+        self.batch_size = app.config.get('MOVEMENT_LEDGER_BATCH', 500)
+        self.linger = app.config.get('MOVEMENT_LEDGER_LINGER_MS', 5) / 1000.0
+        self.wait_timeout = app.config.get('MOVEMENT_LEDGER_WAIT_MS', 10000) / 1000.0
+
+        event.listen(database.session, 'after_commit', self._after_commit)
+        event.listen(database.session, 'after_rollback', self._after_rollback)
+        os.register_at_fork(after_in_child=self._reset)
+        atexit.register(self.drain)
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    # Producers
+
+    def _values(self, movement):
+        values = {}
+        for column in self.table.columns:
+            value = getattr(movement, column.key)
+            default = column.default
+            if value is None and default is not None:
+                # evaluate defaults now so the row carries the time of the operation
+                if default.is_scalar:
+                    value = default.arg
+                elif default.is_callable:
+                    value = default.arg(None)
+            if value is not None or not (column.primary_key and column.autoincrement):
+                values[column.key] = value
+        return values
+
+    def add(self, session, movement):
+        """Record `movement` (a model instance) as part of `session`'s transaction."""
+        if not self.enabled:
+            session.add(movement)
+            return
+        session.info.setdefault('movement_ledger', []).append(self._values(movement))
+
+    def add_rows(self, session, rows):
+        """Record already-built movement row dicts (e.g. from a bulk operation)."""
+        if not rows:
+            return
+        if not self.enabled:
+            session.execute(self.table.insert(), rows)
+            return
+        pending = session.info.setdefault('movement_ledger', [])
+        pending.extend(self._values(self.model(**row)) for row in rows)
+
+    def _after_commit(self, session):
+        rows = session.info.pop('movement_ledger', None)
+        if not rows:
+            return
+        ticket = _Ticket(rows)
+        self._start_writer()
+        self._queue.put(ticket)
+        if self.mode == 'wait' and not ticket.done.wait(self.wait_timeout):
+            # the stock change is committed; the rows stay queued for the writer
+            logger.warning('%d stock movement(s) not yet written after %.1f s', len(rows), self.wait_timeout)
+
+    def _after_rollback(self, session):
+        session.info.pop('movement_ledger', None)
+
+    # Writer
+
+    def _start_writer(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='movement-ledger', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            tickets = [first]
+            rows = len(first.rows)
+            deadline = time.monotonic() + self.linger
+            while rows < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    ticket = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if ticket is _STOP:
+                    stopping = True
+                    break
+                tickets.append(ticket)
+                rows += len(ticket.rows)
+            self._write(tickets)
+        # stopping: whatever was queued again meanwhile gets one last try
+        leftovers = []
+        while True:
+            try:
+                ticket = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if ticket is not _STOP:
+                leftovers.append(ticket)
+        if leftovers:
+            self._write(leftovers, requeue=False)
+
+    def _connection(self):
+        # The writer keeps its own connection: in 'wait' mode every blocked
+        # request still holds a pooled one, so borrowing from the pool here
+        # could starve.
+        if self._conn is None:
+            with self.app.app_context():
+                self._conn = self.db.engine.connect()
+        return self._conn
+
+    def _write(self, tickets, requeue=True):
+        rows = [row for ticket in tickets for row in ticket.rows]
+        error = None
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                conn = self._connection()
+                with conn.begin():
+                    conn.execute(self.table.insert(), rows)
+                error = None
+                break
+            except Exception as exc:  # keep the writer alive whatever the driver raises
+                error = exc
+                if self._conn is not None:
+                    self._conn.invalidate()
+                    self._conn = None
+                time.sleep(0.05 * (attempt + 1))
+        for ticket in tickets:
+            if error is not None and requeue and ticket.requeues < REQUEUE_LIMIT:
+                ticket.requeues += 1
+                logger.warning('queueing %d stock movement(s) again after %d failed attempts: %s',
+                               len(ticket.rows), WRITE_ATTEMPTS, error)
+                self._queue.put(ticket)
+                continue
+            if error is not None:
+                logger.error('dropping %d stock movement(s) after %d attempts: %s',
+                             len(ticket.rows), WRITE_ATTEMPTS * (ticket.requeues + 1), error)
+            ticket.error = error
+            ticket.done.set()
+
+    def drain(self, timeout=None):
+        """Flush everything queued so far and stop the writer.
+
+        The next commit with movements starts a new one.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
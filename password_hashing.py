@@ -0,0 +1,139 @@
+"""Password hashing off the request threads.
+
+Password hashes are deliberately slow. Run on request threads, a burst of
+logins (shift change) takes every CPU and stock operations queue behind it.
+A :class:`PasswordHasher` runs hashing on a small dedicated pool instead and
+refuses work once ``max_pending`` jobs are queued or running, raising
+:class:`HashingBusy` so the caller can answer 503 with a ``Retry-After``
+estimated from the backlog.
+
+Verification also reports when the stored hash was made with other cost
+parameters than the configured ones, so logins can transparently rehash.
+"""
+
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashingBusy(Exception):
+    def __init__(self, retry_after):
+        super().__init__('password hashing queue is full')
+        self.retry_after = retry_after
+
+
+class WerkzeugScheme:
+    """werkzeug.security hashes, e.g. ``scrypt:32768:8:1$salt$hash``."""
+
+    def __init__(self, method='scrypt'):
+        self.method = method
+        # the parameter prefix werkzeug writes for `method`, defaults filled in
+        self.prefix = generate_password_hash('', method).split('$', 1)[0]
+
+    def hash(self, password):
+        return generate_password_hash(password, self.method)
+
+    def verify(self, stored, password):
+        return check_password_hash(stored, password)
+
+    def needs_rehash(self, stored):
+        return stored.split('$', 1)[0] != self.prefix
+
+
+class BcryptScheme:
+    """bcrypt hashes made through a Flask-Bcrypt extension, e.g. ``$2b$12$...``."""
+
+    def __init__(self, bcrypt, rounds=12):
+        self.bcrypt = bcrypt
+        self.rounds = rounds
+
+    def hash(self, password):
+        return self.bcrypt.generate_password_hash(password, self.rounds).decode('utf-8')
+
+    def verify(self, stored, password):
+        return self.bcrypt.check_password_hash(stored, password)
+
+    def needs_rehash(self, stored):
+        try:
+            return int(stored.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+
+class PasswordHasher:
+    def __init__(self, scheme, workers=2, max_pending=32):
+        self.scheme = scheme
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._avg = 0.1  # seconds per job, moving average
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def init_app(self, app):
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', self.max_pending)
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+        return self._executor
+
+    def _timed(self, fn, args):
+        start = time.monotonic()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self._avg += (elapsed - self._avg) * 0.2
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            # PASSWORD_HASH_WORKERS = 0 hashes on the request thread
+            return fn(*args)
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HashingBusy(max(1, math.ceil(self.pending * self._avg / self.workers)))
+            self.pending += 1
+        try:
+            return self._pool().submit(self._timed, fn, args).result()
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def hash(self, password):
+        return self._run(self.scheme.hash, password)
+
+    def _verify(self, stored, password):
+        if not self.scheme.verify(stored, password):
+            return False, None
+        if self.scheme.needs_rehash(stored):
+            return True, self.scheme.hash(password)
+        return True, None
+
+    def verify(self, stored, password):
+        """Check `password` against `stored`.
+
+        Returns ``(ok, new_hash)``; `new_hash` is set when `stored` used other
+        cost parameters than the current scheme and should replace it.
+        """
+        return self._run(self._verify, stored, password)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'pending': self.pending,
+                'max_pending': self.max_pending,
+                'rejected': self.rejected,
+                'avg_ms': round(self._avg * 1000, 1),
+            }
@@ -0,0 +1,135 @@
+"""Walking order for picking a multi-line order.
+
+Bins sit in parallel aisles of ``shelves_per_aisle`` shelves. Zones are laid
+side by side in the configured zone order, each ``aisles_per_zone`` aisles
+wide. Every aisle can be left at the front or the back cross aisle. A bin's
+position is therefore (lane, depth): the lane is its zone's offset plus its
+aisle number, and the depth is its shelf number. Walking between bins in
+one aisle is the depth difference. Walking between aisles is the lane gap
+plus the shorter way round, through the front or through the back.
+
+The depot (where pickers start and drop off) is at the front of lane 0. A
+route starts from the best of the order as given, an S-shaped sweep, which
+goes up one visited aisle and down the next, and a nearest-neighbour tour.
+It is then improved by 2-opt until no reversal helps or the time budget runs
+out, so it is never longer than walking the order as given.
+"""
+
+import re
+import time
+
+import numpy as np
+
+MAX_ROUTE_LINES = 1000
+
+_DIGITS = re.compile(r'\d+')
+
+
+def _position(value):
+    match = _DIGITS.search(str(value or ''))
+    return int(match.group()) if match else 0
+
+
+class Layout:
+    def __init__(self, zone_order=(), aisles_per_zone=None, shelves_per_aisle=None,
+                 aisle_width=3.0, shelf_pitch=1.0):
+        # the sizes default to what the bins being routed show
+        self.zone_order = list(zone_order)
+        self.aisles_per_zone = aisles_per_zone
+        self.shelves_per_aisle = shelves_per_aisle
+        self.aisle_width = aisle_width
+        self.shelf_pitch = shelf_pitch
+
+    def coordinates(self, bins):
+        """(lane, depth) arrays for `bins`, a list of (zone, aisle, shelf); the depot is row 0."""
+        aisles = [_position(b[1]) for b in bins]
+        width = self.aisles_per_zone or max(aisles, default=0) + 1
+        zones = self.zone_order + sorted({b[0] for b in bins} - set(self.zone_order), key=str)
+        offset = {z: i * width for i, z in enumerate(zones)}
+        lanes = np.array([0] + [offset[b[0]] + a for b, a in zip(bins, aisles)], dtype=float)
+        depths = np.array([0] + [_position(b[2]) for b in bins], dtype=float)
+        return lanes, depths
+
+    def distances(self, lanes, depths):
+        """Full walking-distance matrix between the positions, in metres."""
+        length = max(self.shelves_per_aisle or 0, depths.max()) + 1  # the back cross aisle
+        gap = np.abs(lanes[:, None] - lanes[None, :]) * self.aisle_width
+        same = gap == 0
+        across = np.minimum(depths[:, None] + depths[None, :], 2 * length - depths[:, None] - depths[None, :])
+        along = np.where(same, np.abs(depths[:, None] - depths[None, :]), across)
+        return gap + along * self.shelf_pitch
+
+
+def tour_length(tour, dist):
+    """Length of the closed walk depot -> `tour` -> depot."""
+    path = np.concatenate(([0], tour, [0]))
+    return float(dist[path[:-1], path[1:]].sum())
+
+
+def serpentine(lanes, depths):
+    """Visit aisles left to right, alternately up and down each one."""
+    stops = np.arange(1, len(lanes))
+    order = []
+    for i, lane in enumerate(np.unique(lanes[stops])):
+        in_lane = stops[lanes[stops] == lane]
+        in_lane = in_lane[np.argsort(depths[in_lane], kind='stable')]
+        order.extend(in_lane if i % 2 == 0 else in_lane[::-1])
+    return np.array(order, dtype=int)
+
+
+def nearest_neighbour(dist):
+    n = len(dist)
+    unvisited = np.ones(n, dtype=bool)
+    unvisited[0] = False
+    order = []
+    here = 0
+    for _ in range(n - 1):
+        row = np.where(unvisited, dist[here], np.inf)
+        here = int(row.argmin())
+        unvisited[here] = False
+        order.append(here)
+    return np.array(order, dtype=int)
+
+
+def two_opt(tour, dist, deadline=None):
+    """Reverse segments of `tour` while that shortens the closed walk."""
+    path = np.concatenate(([0], tour, [0]))
+    n = len(path)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(n - 3):
+            if deadline is not None and time.perf_counter() > deadline:
+                return path[1:-1]
+            a, b = path[i], path[i + 1]
+            c, d = path[i + 2:n - 1], path[i + 3:n]
+            delta = dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+            j = int(delta.argmin())
+            if delta[j] < -1e-9:
+                path[i + 1:i + j + 3] = path[i + 1:i + j + 3][::-1].copy()
+                improved = True
+    return path[1:-1]
+
+
+def plan(bins, layout, budget=0.03):
+    """Order `bins`, a list of (zone, aisle, shelf), into a short walk.
+
+    Returns ``(order, distance)`` where `order` indexes into `bins`.
+    """
+    if not bins:
+        return [], 0.0
+    deadline = time.perf_counter() + budget
+    lanes, depths = layout.coordinates(bins)
+    dist = layout.distances(lanes, depths)
+    starts = [np.arange(1, len(bins) + 1), serpentine(lanes, depths), nearest_neighbour(dist)]
+    tour = min(starts, key=lambda t: tour_length(t, dist))
+    tour = two_opt(tour.copy(), dist, deadline)
+    return [int(i) - 1 for i in tour], tour_length(tour, dist)
+
+
+def walk_length(bins, layout):
+    """Length of the closed walk visiting `bins` in the given order."""
+    if not bins:
+        return 0.0
+    lanes, depths = layout.coordinates(bins)
+    return tour_length(np.arange(1, len(bins) + 1), layout.distances(lanes, depths))
@@ -0,0 +1,154 @@
+"""Full-text product search.
+
+SQLite gets a contentless FTS5 table using the trigram tokenizer, kept in sync
+with the product table by triggers, so substring matches are served by the
+index and ranked with bm25. The product primary key is not an integer, so its
+implicit rowid may change (VACUUM, dump and restore); the FTS rows are instead
+numbered by ``<fts>_ids``, which gives every product id an ``INTEGER PRIMARY
+KEY`` of its own.
+
+On Postgres a generated ``tsvector`` column with a GIN index plays the same
+role. It matches word prefixes, not substrings: every word of the term must
+start a word of the part number or description, so ``bear`` finds "Ball
+Bearing" but ``earing`` does not.
+
+Both backends are exposed through :meth:`ProductSearch.matches`, a subquery of
+``(product_id, rank)`` rows that callers join against; lower rank sorts first.
+"""
+
+import re
+import sqlite3
+
+from sqlalchemy import Float, column, text
+
+# The trigram tokenizer needs SQLite 3.34+ and cannot match terms shorter
+# than one trigram; those fall back to a LIKE scan.
+TRIGRAM_SQLITE = (3, 34, 0)
+MIN_TRIGRAM_TERM = 3
+
+
+class ProductSearch:
+    def __init__(self, db, model, fts_table=None):
+        self.db = db
+        self.model = model
+        self.table = model.__tablename__
+        self.fts_table = fts_table or f'{self.table}_fts'
+
+    @property
+    def dialect(self):
+        return self.db.engine.dialect.name
+
+    def _sqlite_has_trigram(self):
+        return sqlite3.sqlite_version_info >= TRIGRAM_SQLITE
+
+    def install(self):
+        """Create the search index and its sync machinery, then index existing rows.
+
+        Safe to call repeatedly; call it after ``db.create_all()``.
+        """
+        if self.dialect == 'sqlite':
+            if self._sqlite_has_trigram():
+                self._install_sqlite()
+        elif self.dialect == 'postgresql':
+            self._install_postgres()
+        self.db.session.commit()
+
+    def _install_sqlite(self):
+        # rebuilt from scratch every time, which also replaces the earlier
+        # external-content table keyed by the product rowid
+        t, fts, ids = self.table, self.fts_table, f'{self.fts_table}_ids'
+        statements = [
+            f"DROP TRIGGER IF EXISTS {fts}_ai",
+            f"DROP TRIGGER IF EXISTS {fts}_ad",
+            f"DROP TRIGGER IF EXISTS {fts}_au",
+            f"DROP TABLE IF EXISTS {fts}",
+            f"DROP TABLE IF EXISTS {ids}",
+            f"CREATE TABLE {ids} (id INTEGER PRIMARY KEY, product_id NOT NULL UNIQUE)",
+            f"CREATE VIRTUAL TABLE {fts} USING fts5("
+            f"part_number, description, content='', tokenize='trigram')",
+            f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {t} BEGIN "
+            f"INSERT INTO {ids}(product_id) VALUES (new.id); "
+            f"INSERT INTO {fts}(rowid, part_number, description) "
+            f"SELECT id, new.part_number, new.description FROM {ids} WHERE product_id = new.id; END",
+            f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {t} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, part_number, description) "
+            f"SELECT 'delete', id, old.part_number, old.description FROM {ids} WHERE product_id = old.id; "
+            f"DELETE FROM {ids} WHERE product_id = old.id; END",
+            f"CREATE TRIGGER {fts}_au AFTER UPDATE OF id, part_number, description ON {t} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, part_number, description) "
+            f"SELECT 'delete', id, old.part_number, old.description FROM {ids} WHERE product_id = old.id; "
+            f"UPDATE {ids} SET product_id = new.id WHERE product_id = old.id; "
+            f"INSERT INTO {fts}(rowid, part_number, description) "
+            f"SELECT id, new.part_number, new.description FROM {ids} WHERE product_id = new.id; END",
+            f"INSERT INTO {ids}(product_id) SELECT id FROM {t}",
+            f"INSERT INTO {fts}(rowid, part_number, description) "
+            f"SELECT {ids}.id, {t}.part_number, {t}.description FROM {ids} JOIN {t} ON {t}.id = {ids}.product_id",
+        ]
+        for statement in statements:
+            self.db.session.execute(text(statement))
+
+    def _install_postgres(self):
+        t = self.table
+        statements = [
+            f"ALTER TABLE {t} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('simple', "
+            f"coalesce(part_number, '') || ' ' || coalesce(description, ''))) STORED",
+            f"CREATE INDEX IF NOT EXISTS ix_{t}_search_vector ON {t} USING GIN (search_vector)",
+        ]
+        for statement in statements:
+            self.db.session.execute(text(statement))
+
+    def matches(self, term):
+        """Return a subquery of ``(product_id, rank)`` for products matching `term`.
+
+        Returns None when `term` has nothing searchable in it.
+        """
+        term = (term or '').strip()
+        if not term:
+            return None
+
+        if self.dialect == 'postgresql':
+            return self._matches_postgres(term)
+        if self.dialect == 'sqlite' and self._sqlite_has_trigram() and len(term) >= MIN_TRIGRAM_TERM:
+            return self._matches_fts5(term)
+        return self._matches_like(term)
+
+    def _columns(self, stmt):
+        return stmt.columns(
+            column('product_id', self.model.id.type),
+            column('rank', Float),
+        ).subquery(f'{self.table}_search')
+
+    def _matches_fts5(self, term):
+        fts, ids = self.fts_table, f'{self.fts_table}_ids'
+        # A quoted FTS5 string is matched as a literal substring by the trigram tokenizer
+        phrase = '"' + term.replace('"', '""') + '"'
+        stmt = text(
+            f"SELECT {ids}.product_id AS product_id, {fts}.rank AS rank "
+            f"FROM {fts} JOIN {ids} ON {ids}.id = {fts}.rowid "
+            f"WHERE {fts} MATCH :phrase"
+        ).bindparams(phrase=phrase)
+        return self._columns(stmt)
+
+    def _matches_postgres(self, term):
+        # word-prefix matching, see the module docstring
+        words = re.findall(r'\w+', term.lower())
+        if not words:
+            return None
+        t = self.table
+        stmt = text(
+            f"SELECT {t}.id AS product_id, -ts_rank({t}.search_vector, q) AS rank "
+            f"FROM {t}, to_tsquery('simple', :tsquery) AS q "
+            f"WHERE {t}.search_vector @@ q"
+        ).bindparams(tsquery=' & '.join(f'{w}:*' for w in words))
+        return self._columns(stmt)
+
+    def _matches_like(self, term):
+        t = self.table
+        pattern = '%' + term.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        stmt = text(
+            f"SELECT {t}.id AS product_id, 0.0 AS rank FROM {t} "
+            f"WHERE lower({t}.part_number) LIKE :pattern ESCAPE '\\' "
+            f"OR lower(coalesce({t}.description, '')) LIKE :pattern ESCAPE '\\'"
+        ).bindparams(pattern=pattern)
+        return self._columns(stmt)
@@ -0,0 +1,170 @@
+"""In-memory free-capacity index for putaway suggestions.
+
+For every zone the index keeps its bins in a list sorted by free capacity,
+so the tightest bin that still takes a quantity is one ``bisect`` away, and
+it knows which bins hold each product. Suggestions prefer bins already
+holding the product, then the best fit in the zones the product is already
+stored in, then the best fit elsewhere; bins under maintenance are skipped.
+
+Stock changes are recorded with :meth:`PutawayIndex.record` inside the
+writing transaction and applied once it commits. The index follows the
+``bin_location`` and ``stock_item`` table versions: when a commit moves
+``stock_item`` on by exactly one the recorded deltas describe everything
+that changed, otherwise (another worker wrote, or a bin itself changed) the
+index is rebuilt on the next lookup.
+"""
+
+import bisect
+import threading
+
+from sqlalchemy import event, func
+
+TRACKED = ('bin_location', 'stock_item')
+
+
+class _Bin:
+    __slots__ = ('id', 'code', 'zone', 'aisle', 'shelf', 'capacity', 'usage', 'usable')
+
+    def __init__(self, id, code, zone, aisle, shelf, capacity, status):
+        self.id = id
+        self.code = code
+        self.zone = zone
+        self.aisle = aisle
+        self.shelf = shelf
+        self.capacity = capacity or 0
+        self.usage = 0
+        self.usable = status != 'maintenance' and capacity is not None
+
+    @property
+    def free(self):
+        return self.capacity - self.usage
+
+
+class PutawayIndex:
+    def __init__(self, db, bin_model, item_model, versions):
+        self.db = db
+        self.bin_model = bin_model
+        self.item_model = item_model
+        self.versions = versions
+        self._lock = threading.Lock()
+        self._seen = None  # table versions the index reflects; None = rebuild
+        self._bins = {}
+        self._zones = {}     # zone -> sorted [(free, code, bin id)]
+        self._holdings = {}  # product id -> {bin id: quantity}
+        versions.on_commit(self._after_commit)
+        event.listen(db.session, 'after_rollback', self._discard)
+
+    # Maintenance
+
+    def _load(self):
+        seen = self.versions.current(TRACKED)  # before the rows, so a race only causes a rebuild
+        B, I = self.bin_model, self.item_model
+        bins = {}
+        for row in self.db.session.query(B.id, B.bin_code, B.zone, B.aisle, B.shelf, B.capacity, B.status):
+            bins[row.id] = _Bin(*row)
+        holdings = {}
+        quantities = self.db.session.query(I.product_id, I.bin_location_id, func.sum(I.quantity))\
+            .group_by(I.product_id, I.bin_location_id)
+        for product_id, bin_id, qty in quantities:
+            if qty and bin_id in bins:
+                holdings.setdefault(product_id, {})[bin_id] = qty
+                bins[bin_id].usage += qty
+        zones = {}
+        for b in bins.values():
+            if b.usable:
+                zones.setdefault(b.zone, []).append((b.free, b.code, b.id))
+        for entries in zones.values():
+            entries.sort()
+        self._bins, self._zones, self._holdings, self._seen = bins, zones, holdings, seen
+
+    def _ensure_current(self):
+        current = self.versions.current(TRACKED)
+        with self._lock:
+            if self._seen != current:
+                self._load()
+
+    def record(self, session, product_id, bin_id, delta):
+        """Note a committed-to-be change of `delta` units of a product in a bin."""
+        if delta:
+            session.info.setdefault('putaway_deltas', []).append((product_id, bin_id, delta))
+
+    def _after_commit(self, session, committed):
+        deltas = session.info.pop('putaway_deltas', None)
+        if not any(name in committed for name in TRACKED):
+            return
+        with self._lock:
+            if self._seen is None:
+                return
+            bins_seen, items_seen = self._seen
+            if 'bin_location' in committed or committed.get('stock_item') != items_seen + 1:
+                self._seen = None
+                return
+            for product_id, bin_id, delta in deltas or ():
+                if bin_id not in self._bins:
+                    self._seen = None
+                    return
+                self._apply(product_id, bin_id, delta)
+            self._seen = (bins_seen, committed['stock_item'])
+
+    def _apply(self, product_id, bin_id, delta):
+        b = self._bins[bin_id]
+        held = self._holdings.setdefault(product_id, {})
+        qty = held.get(bin_id, 0) + delta
+        if qty:
+            held[bin_id] = qty
+        else:
+            held.pop(bin_id, None)
+        if b.usable:
+            entries = self._zones[b.zone]
+            del entries[bisect.bisect_left(entries, (b.free, b.code, b.id))]
+            b.usage += delta
+            bisect.insort(entries, (b.free, b.code, b.id))
+        else:
+            b.usage += delta
+
+    def _discard(self, session):
+        session.info.pop('putaway_deltas', None)
+
+    # Lookup
+
+    def suggest(self, product_id, qty, zone=None, limit=5):
+        """Up to `limit` bins that can take `qty` more units of `product_id`, best first."""
+        self._ensure_current()
+        with self._lock:
+            suggestions = []
+            taken = set()
+
+            def add(b, reason):
+                taken.add(b.id)
+                suggestions.append({
+                    'bin_code': b.code,
+                    'zone': b.zone,
+                    'aisle': b.aisle,
+                    'shelf': b.shelf,
+                    'free_capacity': b.free,
+                    'product_quantity': held.get(b.id, 0),
+                    'reason': reason,
+                })
+
+            held = self._holdings.get(product_id, {})
+            same = [self._bins[bin_id] for bin_id in held]
+            same = [b for b in same if b.usable and b.free >= qty and (zone is None or b.zone == zone)]
+            for b in sorted(same, key=lambda b: (b.free, b.code))[:limit]:
+                add(b, 'holds product')
+
+            if zone is not None:
+                zones = [zone]
+            else:
+                home = sorted({b.zone for b in (self._bins[i] for i in held)})
+                zones = home + sorted(z for z in self._zones if z not in home)
+            for z in zones:
+                entries = self._zones.get(z, ())
+                i = bisect.bisect_left(entries, (qty,))
+                while i < len(entries) and len(suggestions) < limit:
+                    b = self._bins[entries[i][2]]
+                    if b.id not in taken:
+                        add(b, 'free capacity')
+                    i += 1
+                if len(suggestions) >= limit:
+                    break
+            return suggestions
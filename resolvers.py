@@ -0,0 +1,175 @@
+"""Process-local caches that resolve business codes to rows.
+
+Stock operations identify products by part number and bins by code, and the
+same few hundred codes are looked up over and over. A :class:`CodeResolver`
+keeps a bounded LRU map from code to a small immutable row snapshot, so the
+lookup only reaches the database on a miss. Misses are not cached, which keeps
+newly created rows visible immediately; callers invalidate on create.
+
+Once :meth:`CodeResolver.watch` is installed, a commit that renames, changes
+or deletes a row through the ORM drops that row's codes at once. Bulk
+``UPDATE``/``DELETE`` statements bypass the session and need an explicit
+:meth:`CodeResolver.invalidate`.
+"""
+
+import threading
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import event, inspect
+
+
+class LRUCache:
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+            }
+
+
+def as_code(value):
+    """`value` if it can be a part number or bin code, else None (which never resolves).
+
+    Request bodies are untrusted JSON; a list or object where a code belongs
+    would otherwise reach :meth:`CodeResolver.resolve_many` and fail as an
+    unhashable key.
+    """
+    return value if isinstance(value, str) else None
+
+
+class CodeResolver:
+    """Resolve `code_field` values of `model` to namedtuples of `fields`."""
+
+    def __init__(self, model, code_field, fields, maxsize=10000):
+        self.model = model
+        self.code_field = code_field
+        self.fields = list(fields)
+        self.row_type = namedtuple(f'{model.__name__}Ref', self.fields)
+        self.cache = LRUCache(maxsize)
+
+    def _query(self):
+        return self.model.query.with_entities(*(getattr(self.model, f) for f in self.fields))
+
+    def _ref(self, row):
+        return self.row_type(*row)
+
+    def resolve(self, code):
+        """Return the snapshot for `code`, or None if no such row exists."""
+        if code is None:
+            return None
+        ref = self.cache.get(code)
+        if ref is None:
+            row = self._query().filter(getattr(self.model, self.code_field) == code).first()
+            if row is None:
+                return None
+            ref = self._ref(row)
+            self.cache.put(code, ref)
+        return ref
+
+    def resolve_many(self, codes):
+        """Return ``{code: snapshot}`` for the codes that exist, one query for all misses."""
+        found = {}
+        missing = []
+        for code in set(codes):
+            if code is None:
+                continue
+            ref = self.cache.get(code)
+            if ref is None:
+                missing.append(code)
+            else:
+                found[code] = ref
+        if missing:
+            column = getattr(self.model, self.code_field)
+            for row in self._query().filter(column.in_(missing)):
+                ref = self._ref(row)
+                code = getattr(ref, self.code_field)
+                self.cache.put(code, ref)
+                found[code] = ref
+        return found
+
+    def preload(self):
+        """Fill the cache with up to `maxsize` rows. Returns the number loaded."""
+        loaded = 0
+        for row in self._query().limit(self.cache.maxsize):
+            ref = self._ref(row)
+            self.cache.put(getattr(ref, self.code_field), ref)
+            loaded += 1
+        return loaded
+
+    def invalidate(self, code=None):
+        self.cache.invalidate(code)
+
+    # Invalidation on row changes
+
+    def watch(self, database):
+        """Drop the codes of `model` rows that a commit through `database` changes or deletes."""
+        key = f'resolver_codes_{self.model.__tablename__}'
+
+        def codes(obj):
+            # old and new code of a rename; None if the code was never loaded
+            history = inspect(obj).attrs[self.code_field].history
+            return set(history.sum()) or {None}
+
+        def after_flush(session, flush_context):
+            for obj in session.dirty:
+                if isinstance(obj, self.model):
+                    attrs = inspect(obj).attrs
+                    if any(attrs[f].history.has_changes() for f in self.fields):
+                        session.info.setdefault(key, set()).update(codes(obj))
+            for obj in session.deleted:
+                if isinstance(obj, self.model):
+                    session.info.setdefault(key, set()).update(codes(obj))
+
+        def after_commit(session):
+            stale = session.info.pop(key, ())
+            if None in stale:
+                self.invalidate()
+            else:
+                for code in stale:
+                    self.invalidate(code)
+
+        def after_rollback(session):
+            session.info.pop(key, None)
+
+        event.listen(database.session, 'after_flush', after_flush)
+        event.listen(database.session, 'after_commit', after_commit)
+        event.listen(database.session, 'after_rollback', after_rollback)
@@ -1,15 +1,38 @@
 from flask import Blueprint, request, jsonify
-from models import BinLocation
+from sqlalchemy import func
+from models import BinLocation, bin_resolver, table_versions
 from db import db
 from auth import role_required
+from list_query import ListError, ListSpec, int_filter
 
 bp = Blueprint('bins', __name__, url_prefix='/api/bins')
 
+bin_list = ListSpec(
+    query=lambda *cols: db.session.query(*cols).select_from(BinLocation),
+    columns={
+        'id': BinLocation.id,
+        'code': BinLocation.code,
+        'capacity': BinLocation.capacity,
+    },
+    sorts={
+        'id': BinLocation.id,
+        'code': BinLocation.code,
+        'capacity': func.coalesce(BinLocation.capacity, 0),
+    },
+    filters={
+        'code': lambda v, name: BinLocation.code.startswith(v, autoescape=True),
+        'min_capacity': int_filter(lambda v: BinLocation.capacity >= v),
+    },
+)
+
 
 @bp.route('', methods=['GET'])
+@table_versions.cached('bin_location')
 def list_bins():
-    bins = BinLocation.query.all()
-    return jsonify([{'id': b.id, 'code': b.code, 'capacity': b.capacity} for b in bins])
+    try:
+        return bin_list.response(request.args)
+    except ListError as e:
+        return jsonify({'error': str(e)}), 400
 
 
 @bp.route('', methods=['POST'])
@@ -20,9 +43,10 @@ def create_bin():
     capacity = data.get('capacity')
     if not code:
         return jsonify({'error': 'code required'}), 400
-    if BinLocation.query.filter_by(code=code).first():
+    if bin_resolver.resolve(code):
         return jsonify({'error': 'bin exists'}), 400
     b = BinLocation(code=code, capacity=capacity)
     db.session.add(b)
     db.session.commit()
+    bin_resolver.invalidate(code)
     return jsonify({'id': b.id, 'code': b.code}), 201
@@ -0,0 +1,31 @@
+import io
+
+from flask import Blueprint, request, jsonify
+from auth import current_identity, role_required
+from db import db
+from importer import KINDS, run_import
+
+bp = Blueprint('import', __name__, url_prefix='/api/import')
+
+
+@bp.route('/<kind>', methods=['POST'])
+@role_required(['admin', 'manager'])
+def import_csv(kind):
+    """Import a CSV, sent either as a multipart `file` field or as the raw request body."""
+    if kind not in KINDS:
+        return jsonify({'error': f'unknown import {kind}'}), 404
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        if upload is None:
+            return jsonify({'error': 'file required'}), 400
+        raw = upload.stream
+    else:
+        raw = request.stream
+    # utf-8-sig drops the BOM spreadsheet exports tend to add
+    text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+    try:
+        report = run_import(kind, text, current_identity().get('id'))
+    except UnicodeDecodeError:
+        db.session.rollback()
+        return jsonify({'error': 'file must be UTF-8 encoded CSV'}), 400
+    return jsonify(report)
@@ -1,15 +1,37 @@
 from flask import Blueprint, request, jsonify
-from models import Product
+from sqlalchemy import func
+from models import Product, product_resolver, table_versions
 from db import db
 from auth import role_required
+from list_query import ListError, ListSpec
 
 bp = Blueprint('products', __name__, url_prefix='/api/products')
 
+product_list = ListSpec(
+    query=lambda *cols: db.session.query(*cols).select_from(Product),
+    columns={
+        'id': Product.id,
+        'part_number': Product.part_number,
+        'description': Product.description,
+    },
+    sorts={
+        'id': Product.id,
+        'part_number': Product.part_number,
+        'description': func.coalesce(Product.description, ''),
+    },
+    filters={
+        'part_number': lambda v, name: Product.part_number.startswith(v, autoescape=True),
+    },
+)
+
 
 @bp.route('', methods=['GET'])
+@table_versions.cached('product')
 def list_products():
-    q = Product.query.all()
-    return jsonify([{'id': p.id, 'part_number': p.part_number, 'description': p.description} for p in q])
+    try:
+        return product_list.response(request.args)
+    except ListError as e:
+        return jsonify({'error': str(e)}), 400
 
 
 @bp.route('', methods=['POST'])
@@ -20,9 +42,10 @@ def create_product():
     desc = data.get('description')
     if not part:
         return jsonify({'error': 'part_number required'}), 400
-    if Product.query.filter_by(part_number=part).first():
+    if product_resolver.resolve(part):
         return jsonify({'error': 'part exists'}), 400
     p = Product(part_number=part, description=desc)
     db.session.add(p)
     db.session.commit()
+    product_resolver.invalidate(part)
     return jsonify({'id': p.id, 'part_number': p.part_number}), 201
@@ -0,0 +1,38 @@
+from flask import Blueprint, request, jsonify
+from sqlalchemy.orm import contains_eager
+from models import Product, StockItem
+from db import db
+from product_search import ProductSearch
+
+bp = Blueprint('search', __name__, url_prefix='/api/search')
+
+product_search = ProductSearch(db, Product)
+
+MAX_RESULTS = 100
+
+
+@bp.route('', methods=['GET'])
+def search():
+    matches = product_search.matches(request.args.get('q'))
+    if matches is None:
+        return jsonify({'results': []})
+
+    rows = db.session.query(StockItem)\
+        .join(matches, matches.c.product_id == StockItem.product_id)\
+        .join(StockItem.product)\
+        .join(StockItem.bin)\
+        .options(contains_eager(StockItem.product), contains_eager(StockItem.bin))\
+        .order_by(matches.c.rank, Product.part_number, StockItem.id)\
+        .limit(MAX_RESULTS)\
+        .all()
+
+    # this app has no slotting, so there is no correct bin to check against
+    results = []
+    for it in rows:
+        results.append({
+            'partNumber': it.product.part_number,
+            'description': it.product.description or '',
+            'currentBin': it.bin.code,
+            'quantity': it.quantity,
+        })
+    return jsonify({'results': results})
@@ -1,106 +1,545 @@
-from flask import Blueprint, request, jsonify
-from models import Product, BinLocation, StockItem, StockMovement
+from datetime import date, datetime
+from flask import Blueprint, current_app, request, jsonify
+from models import Product, BinLocation, StockItem, StockMovement, product_resolver, bin_resolver, movement_ledger, table_versions
 from db import db
-from auth import role_required
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from auth import current_identity, role_required
+from stock_atomic import StockConflict, adjust, put, retry_on_conflict, take
+from stock_snapshots import stock_as_of
+from streaming import FORMATS, stream_response
+from list_query import ListError, ListSpec, int_filter
+from allocation import POLICIES, allocate
+from resolvers import as_code
 
 bp = Blueprint('stock', __name__, url_prefix='/api/stock')
 
 
+def _expiry(value):
+    """Parse an optional ``YYYY-MM-DD`` expiry date; raises ValueError or TypeError."""
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
 @bp.route('/receive', methods=['POST'])
 @role_required(['admin', 'manager', 'employee'])
+@retry_on_conflict(db.session)
 def receive_stock():
     data = request.get_json() or {}
     part = data.get('part_number')
     bin_code = data.get('bin_code')
     qty = int(data.get('quantity', 0))
     batch = data.get('batch')
+    try:
+        expiry = _expiry(data.get('expiry_date'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'invalid expiry_date, expected YYYY-MM-DD'}), 400
 
-    product = Product.query.filter_by(part_number=part).first()
+    product = product_resolver.resolve(part)
     if not product:
         return jsonify({'error': 'product not found'}), 404
-    binloc = BinLocation.query.filter_by(code=bin_code).first()
+    binloc = bin_resolver.resolve(bin_code)
     if not binloc:
         return jsonify({'error': 'bin not found'}), 404
 
-    item = StockItem.query.filter_by(product_id=product.id, bin_id=binloc.id, batch=batch).first()
-    if not item:
-        item = StockItem(product_id=product.id, bin_id=binloc.id, quantity=qty, batch=batch)
-        db.session.add(item)
+    item_id = db.session.query(StockItem.id).filter_by(product_id=product.id, bin_id=binloc.id, batch=batch).limit(1).scalar()
+    if item_id:
+        quantity = put(db.session, StockItem, item_id, qty)
     else:
-        item.quantity += qty
+        db.session.add(StockItem(product_id=product.id, bin_id=binloc.id, quantity=qty, batch=batch, expiry_date=expiry))
+        quantity = qty
 
-    movement = StockMovement(product_id=product.id, from_bin_id=None, to_bin_id=binloc.id, quantity=qty, user_id=get_jwt_identity().get('id'), reason='receive')
-    db.session.add(movement)
+    movement = StockMovement(product_id=product.id, from_bin_id=None, to_bin_id=binloc.id, quantity=qty, user_id=current_identity().get('id'), reason='receive', batch=batch)
+    movement_ledger.add(db.session, movement)
     db.session.commit()
-    return jsonify({'msg': 'received', 'product': product.part_number, 'bin': binloc.code, 'quantity': item.quantity})
+    return jsonify({'msg': 'received', 'product': product.part_number, 'bin': binloc.code, 'quantity': quantity})
 
 
 @bp.route('/dispatch', methods=['POST'])
 @role_required(['admin', 'manager', 'employee'])
 def dispatch_stock():
+    """Dispatch `quantity` of a product, split across its lots.
+
+    Lots are taken in ``policy`` order (``fefo`` or ``fifo``, default
+    ``DISPATCH_POLICY``), from `bin_code` only when given, and every split is
+    recorded as its own movement.
+    """
     data = request.get_json() or {}
     part = data.get('part_number')
     bin_code = data.get('bin_code')
     qty = int(data.get('quantity', 0))
+    policy = data.get('policy') or current_app.config.get('DISPATCH_POLICY', 'fefo')
+    if qty <= 0:
+        return jsonify({'error': 'quantity must be positive'}), 400
+    if policy not in POLICIES:
+        return jsonify({'error': f'policy must be one of {", ".join(POLICIES)}'}), 400
 
-    product = Product.query.filter_by(part_number=part).first()
+    product = product_resolver.resolve(part)
     if not product:
         return jsonify({'error': 'product not found'}), 404
-    binloc = BinLocation.query.filter_by(code=bin_code).first()
-    if not binloc:
-        return jsonify({'error': 'bin not found'}), 404
+    binloc = None
+    if bin_code:
+        binloc = bin_resolver.resolve(bin_code)
+        if not binloc:
+            return jsonify({'error': 'bin not found'}), 404
 
-    item = StockItem.query.filter_by(product_id=product.id, bin_id=binloc.id).first()
-    if not item or item.quantity < qty:
+    try:
+        splits = _dispatch(product, binloc, qty, policy, current_identity().get('id'))
+    except StockConflict:
+        return jsonify({'error': 'stock changed during dispatch, please retry'}), 409
+    if splits is None:
         return jsonify({'error': 'insufficient stock'}), 400
+    return jsonify({
+        'msg': 'dispatched',
+        'remaining': sum(s['remaining'] for s in splits),
+        'allocations': splits,
+    })
+
+
+@retry_on_conflict(db.session)
+def _dispatch(product, binloc, qty, policy, user_id):
+    splits = allocate(product.id, qty, policy, bin_id=binloc.id if binloc else None)
+    if sum(n for _, n in splits) < qty:
+        db.session.rollback()
+        return None
 
-    item.quantity -= qty
-    movement = StockMovement(product_id=product.id, from_bin_id=binloc.id, to_bin_id=None, quantity=qty, user_id=get_jwt_identity().get('id'), reason='dispatch')
-    db.session.add(movement)
+    bin_codes = {}
+    if binloc is None:
+        bin_codes = dict(db.session.query(BinLocation.id, BinLocation.code)
+                         .filter(BinLocation.id.in_({lot.bin_id for lot, _ in splits})))
+    result = []
+    movements = []
+    for lot, n in splits:
+        # another dispatch may have drained the lot since it was read
+        remaining = take(db.session, StockItem, lot.id, n)
+        if remaining is None:
+            raise StockConflict(lot.id)
+        movements.append({'product_id': product.id, 'from_bin_id': lot.bin_id, 'to_bin_id': None, 'quantity': n,
+                          'user_id': user_id, 'reason': 'dispatch', 'batch': lot.batch})
+        result.append({
+            'bin': binloc.code if binloc else bin_codes.get(lot.bin_id),
+            'batch': lot.batch,
+            'expiry_date': lot.expiry_date.isoformat() if lot.expiry_date else None,
+            'quantity': n,
+            'remaining': remaining,
+        })
+    movement_ledger.add_rows(db.session, movements)
     db.session.commit()
-    return jsonify({'msg': 'dispatched', 'remaining': item.quantity})
+    return result
 
 
 @bp.route('/transfer', methods=['POST'])
 @role_required(['admin', 'manager', 'employee'])
 def transfer_stock():
+    """Move `quantity` of a product from one bin to another, lot by lot.
+
+    The source lots are chosen like ``/dispatch`` chooses them (only `batch`
+    when given), and each keeps its batch and expiry date in the destination
+    bin. Every split is recorded as its own movement.
+    """
     data = request.get_json() or {}
     part = data.get('part_number')
     from_bin_code = data.get('from_bin')
     to_bin_code = data.get('to_bin')
     qty = int(data.get('quantity', 0))
+    batch = data.get('batch')
+    policy = data.get('policy') or current_app.config.get('DISPATCH_POLICY', 'fefo')
+    if qty <= 0:
+        return jsonify({'error': 'quantity must be positive'}), 400
+    if batch is not None and not isinstance(batch, str):
+        return jsonify({'error': 'invalid batch'}), 400
+    if policy not in POLICIES:
+        return jsonify({'error': f'policy must be one of {", ".join(POLICIES)}'}), 400
 
-    product = Product.query.filter_by(part_number=part).first()
+    product = product_resolver.resolve(part)
     if not product:
         return jsonify({'error': 'product not found'}), 404
-    from_bin = BinLocation.query.filter_by(code=from_bin_code).first()
-    to_bin = BinLocation.query.filter_by(code=to_bin_code).first()
+    from_bin = bin_resolver.resolve(from_bin_code)
+    to_bin = bin_resolver.resolve(to_bin_code)
     if not from_bin or not to_bin:
         return jsonify({'error': 'bin not found'}), 404
 
-    item_from = StockItem.query.filter_by(product_id=product.id, bin_id=from_bin.id).first()
-    if not item_from or item_from.quantity < qty:
+    try:
+        splits = _transfer(product, from_bin, to_bin, qty, policy, batch, current_identity().get('id'))
+    except StockConflict:
+        return jsonify({'error': 'stock changed during transfer, please retry'}), 409
+    if splits is None:
         return jsonify({'error': 'insufficient stock in source bin'}), 400
+    return jsonify({
+        'msg': 'transferred',
+        'from_remaining': sum(s['from_remaining'] for s in splits),
+        'to_quantity': sum(s['to_quantity'] for s in splits),
+        'allocations': splits,
+    })
 
-    item_from.quantity -= qty
-    item_to = StockItem.query.filter_by(product_id=product.id, bin_id=to_bin.id).first()
-    if not item_to:
-        item_to = StockItem(product_id=product.id, bin_id=to_bin.id, quantity=qty)
-        db.session.add(item_to)
-    else:
-        item_to.quantity += qty
 
-    movement = StockMovement(product_id=product.id, from_bin_id=from_bin.id, to_bin_id=to_bin.id, quantity=qty, user_id=get_jwt_identity().get('id'), reason='transfer')
-    db.session.add(movement)
+@retry_on_conflict(db.session)
+def _transfer(product, from_bin, to_bin, qty, policy, batch, user_id):
+    splits = allocate(product.id, qty, policy, bin_id=from_bin.id, batch=batch)
+    if sum(n for _, n in splits) < qty:
+        db.session.rollback()
+        return None
+
+    result = []
+    movements = []
+    for lot, n in splits:
+        from_remaining = take(db.session, StockItem, lot.id, n)
+        if from_remaining is None:
+            raise StockConflict(lot.id)
+        # into the same lot at the destination, so batch and expiry stay with the units
+        to_id = db.session.query(StockItem.id)\
+            .filter_by(product_id=product.id, bin_id=to_bin.id, batch=lot.batch).limit(1).scalar()
+        if to_id:
+            to_quantity = put(db.session, StockItem, to_id, n)
+        else:
+            db.session.add(StockItem(product_id=product.id, bin_id=to_bin.id, quantity=n,
+                                     batch=lot.batch, expiry_date=lot.expiry_date))
+            to_quantity = n
+        movements.append({'product_id': product.id, 'from_bin_id': from_bin.id, 'to_bin_id': to_bin.id, 'quantity': n,
+                          'user_id': user_id, 'reason': 'transfer', 'batch': lot.batch})
+        result.append({
+            'batch': lot.batch,
+            'expiry_date': lot.expiry_date.isoformat() if lot.expiry_date else None,
+            'quantity': n,
+            'from_remaining': from_remaining,
+            'to_quantity': to_quantity,
+        })
+    movement_ledger.add_rows(db.session, movements)
     db.session.commit()
-    return jsonify({'msg': 'transferred', 'from_remaining': item_from.quantity, 'to_quantity': item_to.quantity})
+    return result
+
+
+MAX_BATCH_LINES = 5000
+
+
+@bp.route('/batch', methods=['POST'])
+@role_required(['admin', 'manager', 'employee'])
+def batch_stock():
+    """Apply a list of receive/dispatch/transfer lines in one transaction.
+
+    By default the batch is all-or-nothing; with ``"atomic": false`` every
+    valid line is applied and failures are reported per line. Dispatch and
+    transfer lines are allocated like ``/dispatch`` and ``/transfer``: across
+    lots in the line's ``policy`` order (default ``DISPATCH_POLICY``).
+    """
+    data = request.get_json() or {}
+    lines = data.get('lines') or []
+    atomic = data.get('atomic', True)
+    if not isinstance(lines, list) or not lines:
+        return jsonify({'error': 'lines required'}), 400
+    if len(lines) > MAX_BATCH_LINES:
+        return jsonify({'error': f'at most {MAX_BATCH_LINES} lines per batch'}), 400
+
+    try:
+        results, failed, applied = _apply_batch(lines, atomic, current_identity().get('id'))
+    except StockConflict:
+        return jsonify({'error': 'stock changed during batch, please retry'}), 409
+
+    if failed and atomic:
+        return jsonify({'error': 'batch rejected', 'applied': 0, 'failed': failed,
+                        'results': [r for r in results if 'error' in r]}), 400
+    return jsonify({'msg': 'batch applied', 'applied': applied, 'failed': failed, 'results': results})
+
+
+class _Slot:
+    """Working copy of one stock item while a batch is applied."""
+
+    __slots__ = ('id', 'product_id', 'bin_id', 'batch', 'expiry_date', 'quantity', 'delta')
+
+    def __init__(self, id, product_id, bin_id, batch, expiry_date, quantity, delta=0):
+        self.id = id
+        self.product_id = product_id
+        self.bin_id = bin_id
+        self.batch = batch
+        self.expiry_date = expiry_date
+        self.quantity = quantity
+        self.delta = delta
+
+
+@retry_on_conflict(db.session)
+def _apply_batch(lines, atomic, user_id):
+    lines = [line if isinstance(line, dict) else {} for line in lines]
+
+    # resolve every part number and bin code up front, one query each
+    parts = {as_code(line.get('part_number')) for line in lines}
+    codes = set()
+    for line in lines:
+        codes.update(as_code(line.get(key)) for key in ('bin_code', 'from_bin', 'to_bin'))
+    products = product_resolver.resolve_many(parts)
+    bins = bin_resolver.resolve_many(codes)
+
+    # and every stock item those products hold in those bins
+    items = {}
+    by_id = {}
+    if products and bins:
+        existing = db.session.query(
+            StockItem.id, StockItem.product_id, StockItem.bin_id, StockItem.batch, StockItem.expiry_date,
+            StockItem.quantity
+        ).filter(
+            StockItem.product_id.in_([p.id for p in products.values()]),
+            StockItem.bin_id.in_([b.id for b in bins.values()]),
+        ).order_by(StockItem.id)
+        for row in existing:
+            it = _Slot(*row)
+            items.setdefault((row.product_id, row.bin_id), []).append(it)
+            by_id[it.id] = it
+    bin_codes = {b.id: b.code for b in bins.values()}
+    dirty = {}  # slots changed since the last write, in order
+
+    def find_item(product, binloc, batch=None):
+        for it in items.get((product.id, binloc.id), []):
+            if it.batch == batch:
+                return it
+        return None
+
+    def new_item(product, binloc, qty, batch=None, expiry=None):
+        it = _Slot(None, product.id, binloc.id, batch, expiry, qty, qty)
+        items.setdefault((product.id, binloc.id), []).append(it)
+        dirty[it] = None
+        return it
+
+    def lot_item(product, lot):
+        it = by_id.get(lot.id)
+        if it is None:
+            it = _Slot(lot.id, product.id, lot.bin_id, lot.batch, lot.expiry_date, lot.quantity)
+            items.setdefault((product.id, lot.bin_id), []).append(it)
+            by_id[it.id] = it
+        return it
+
+    def move(item, qty):
+        item.quantity += qty
+        item.delta += qty
+        dirty[item] = None
+
+    def write():
+        # Net changes are written as conditional increments, so stock moved
+        # by another request since it was read surfaces as a conflict (and a
+        # retry) instead of being overwritten.
+        created = [it for it in dirty if it.id is None]
+        for it in dirty:
+            if it.id is not None and it.delta:
+                if adjust(db.session, StockItem, it.id, it.delta) is None:
+                    raise StockConflict(it.id)
+                it.delta = 0
+        if created:
+            rows = [StockItem(product_id=it.product_id, bin_id=it.bin_id, batch=it.batch,
+                              expiry_date=it.expiry_date, quantity=it.quantity) for it in created]
+            db.session.add_all(rows)
+            db.session.flush()
+            for it, row in zip(created, rows):
+                it.id, it.delta = row.id, 0
+                by_id[it.id] = it
+        dirty.clear()
+
+    def apply(line):
+        op = line.get('op')
+        if op not in ('receive', 'dispatch', 'transfer'):
+            return {'error': 'op must be receive, dispatch or transfer'}
+        try:
+            qty = int(line.get('quantity', 0))
+        except (TypeError, ValueError):
+            return {'error': 'invalid quantity'}
+        if qty <= 0:
+            return {'error': 'quantity must be positive'}
+        product = products.get(as_code(line.get('part_number')))
+        if not product:
+            return {'error': 'product not found'}
+
+        if op == 'receive':
+            binloc = bins.get(as_code(line.get('bin_code')))
+            if not binloc:
+                return {'error': 'bin not found'}
+            batch = line.get('batch')
+            if batch is not None and not isinstance(batch, str):
+                return {'error': 'invalid batch'}
+            try:
+                expiry = _expiry(line.get('expiry_date'))
+            except (TypeError, ValueError):
+                return {'error': 'invalid expiry_date, expected YYYY-MM-DD'}
+            item = find_item(product, binloc, batch)
+            if item:
+                move(item, qty)
+            else:
+                item = new_item(product, binloc, qty, batch, expiry)
+            movements.append({'product_id': product.id, 'from_bin_id': None, 'to_bin_id': binloc.id, 'quantity': qty, 'user_id': user_id, 'reason': 'receive', 'batch': batch})
+            return {'quantity': item.quantity}
+
+        if op == 'dispatch':
+            binloc = None
+            if line.get('bin_code'):
+                binloc = bins.get(as_code(line.get('bin_code')))
+                if not binloc:
+                    return {'error': 'bin not found'}
+            policy = line.get('policy') or default_policy
+            if policy not in POLICIES:
+                return {'error': f'policy must be one of {", ".join(POLICIES)}'}
+            # allocate() reads the lots from the database, earlier lines included
+            write()
+            splits = allocate(product.id, qty, policy, bin_id=binloc.id if binloc else None, today=today)
+            if sum(n for _, n in splits) < qty:
+                return {'error': 'insufficient stock'}
+            unknown = {lot.bin_id for lot, _ in splits} - bin_codes.keys()
+            if unknown:
+                bin_codes.update(db.session.query(BinLocation.id, BinLocation.code).filter(BinLocation.id.in_(unknown)))
+            allocations = []
+            for lot, n in splits:
+                item = lot_item(product, lot)
+                move(item, -n)
+                movements.append({'product_id': product.id, 'from_bin_id': lot.bin_id, 'to_bin_id': None, 'quantity': n, 'user_id': user_id, 'reason': 'dispatch', 'batch': lot.batch})
+                allocations.append({
+                    'bin': bin_codes.get(lot.bin_id),
+                    'batch': item.batch,
+                    'expiry_date': item.expiry_date.isoformat() if item.expiry_date else None,
+                    'quantity': n,
+                    'remaining': item.quantity,
+                })
+            return {'remaining': sum(a['remaining'] for a in allocations), 'allocations': allocations}
+
+        from_bin = bins.get(as_code(line.get('from_bin')))
+        to_bin = bins.get(as_code(line.get('to_bin')))
+        if not from_bin or not to_bin:
+            return {'error': 'bin not found'}
+        batch = line.get('batch')
+        if batch is not None and not isinstance(batch, str):
+            return {'error': 'invalid batch'}
+        policy = line.get('policy') or default_policy
+        if policy not in POLICIES:
+            return {'error': f'policy must be one of {", ".join(POLICIES)}'}
+        write()
+        splits = allocate(product.id, qty, policy, bin_id=from_bin.id, today=today, batch=batch)
+        if sum(n for _, n in splits) < qty:
+            return {'error': 'insufficient stock in source bin'}
+        allocations = []
+        for lot, n in splits:
+            item_from = lot_item(product, lot)
+            move(item_from, -n)
+            item_to = find_item(product, to_bin, lot.batch)
+            if item_to:
+                move(item_to, n)
+            else:
+                item_to = new_item(product, to_bin, n, lot.batch, lot.expiry_date)
+            movements.append({'product_id': product.id, 'from_bin_id': from_bin.id, 'to_bin_id': to_bin.id, 'quantity': n, 'user_id': user_id, 'reason': 'transfer', 'batch': lot.batch})
+            allocations.append({
+                'batch': lot.batch,
+                'expiry_date': lot.expiry_date.isoformat() if lot.expiry_date else None,
+                'quantity': n,
+                'from_remaining': item_from.quantity,
+                'to_quantity': item_to.quantity,
+            })
+        return {
+            'from_remaining': sum(a['from_remaining'] for a in allocations),
+            'to_quantity': sum(a['to_quantity'] for a in allocations),
+            'allocations': allocations,
+        }
+
+    default_policy = current_app.config.get('DISPATCH_POLICY', 'fefo')
+    today = date.today()
+    movements = []
+    results = []
+    failed = 0
+    for i, line in enumerate(lines):
+        result = apply(line)
+        result['line'] = i
+        if 'error' in result:
+            failed += 1
+        results.append(result)
+
+    if failed and atomic:
+        db.session.rollback()
+        return results, failed, 0
+
+    write()
+    movement_ledger.add_rows(db.session, movements)
+    db.session.commit()
+    return results, failed, len(movements)
+
+
+def _item_joins(query):
+    return query.select_from(StockItem)\
+        .join(Product, Product.id == StockItem.product_id)\
+        .join(BinLocation, BinLocation.id == StockItem.bin_id)
+
+
+item_list = ListSpec(
+    query=lambda *cols: _item_joins(db.session.query(*cols)),
+    columns={
+        'id': StockItem.id,
+        'part_number': Product.part_number,
+        'bin': BinLocation.code,
+        'quantity': StockItem.quantity,
+        'batch': StockItem.batch,
+        'expiry_date': StockItem.expiry_date,
+    },
+    sorts={
+        'id': StockItem.id,
+        'part_number': Product.part_number,
+        'bin': BinLocation.code,
+        'quantity': StockItem.quantity,
+    },
+    filters={
+        'part_number': lambda v, name: Product.part_number == v,
+        'bin': lambda v, name: BinLocation.code == v,
+        'min_quantity': int_filter(lambda v: StockItem.quantity >= v),
+    },
+)
 
 
 @bp.route('/items', methods=['GET'])
+@table_versions.cached('stock_item', 'product', 'bin_location')
 def list_items():
-    items = StockItem.query.all()
-    out = []
-    for it in items:
-        out.append({'id': it.id, 'part_number': it.product.part_number, 'bin': it.bin.code, 'quantity': it.quantity, 'batch': it.batch})
-    return jsonify(out)
+    try:
+        return item_list.response(request.args)
+    except ListError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+EXPORT_FIELDS = ['id', 'part_number', 'bin', 'quantity', 'batch', 'expiry_date']
+
+
+def _export_row(it):
+    row = dict(it._mapping)
+    if it.expiry_date:
+        row['expiry_date'] = it.expiry_date.isoformat()
+    return row
+
+
+@bp.route('/export', methods=['GET'])
+@role_required(['admin', 'manager'])
+def export_items():
+    """Stream the full stock position as CSV or NDJSON (gzipped if the client accepts it)."""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    # yield_per streams from a server-side cursor where the driver supports it
+    columns = [item_list.columns[name].label(name) for name in EXPORT_FIELDS]
+    query = _item_joins(db.session.query(*columns)).order_by(StockItem.id)
+    rows = (_export_row(it) for it in query.yield_per(1000))
+    return stream_response(rows, fmt, EXPORT_FIELDS, filename='stock')
+
+
+@bp.route('/as-of', methods=['GET'])
+def items_as_of():
+    try:
+        ts = datetime.fromisoformat(request.args.get('ts', ''))
+    except ValueError:
+        return jsonify({'error': 'ts must be an ISO 8601 timestamp'}), 400
+
+    product_id = bin_id = None
+    part = request.args.get('part_number')
+    bin_code = request.args.get('bin_code')
+    if part:
+        product = product_resolver.resolve(part)
+        if not product:
+            return jsonify({'error': 'product not found'}), 404
+        product_id = product.id
+    if bin_code:
+        binloc = bin_resolver.resolve(bin_code)
+        if not binloc:
+            return jsonify({'error': 'bin not found'}), 404
+        bin_id = binloc.id
+
+    snapshot, position = stock_as_of(ts, product_id, bin_id)
+    parts = dict(db.session.query(Product.id, Product.part_number).filter(Product.id.in_({p for p, _ in position})))
+    codes = dict(db.session.query(BinLocation.id, BinLocation.code).filter(BinLocation.id.in_({b for _, b in position})))
+    return jsonify({
+        'as_of': ts.isoformat(),
+        'snapshot': snapshot.taken_at.isoformat() if snapshot else None,
+        'items': [{'part_number': parts[p], 'bin': codes[b], 'quantity': qty} for (p, b), qty in sorted(position.items())],
+    })
@@ -0,0 +1,19 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from delta_sync import DEFAULT_SYNC_LIMIT, MAX_SYNC_LIMIT, sync_page
+
+bp = Blueprint('sync', __name__, url_prefix='/api/sync')
+
+
+@bp.route('', methods=['GET'])
+@jwt_required()
+def sync():
+    """Products, bins and stock items changed since `cursor` (everything without one)."""
+    try:
+        limit = max(1, min(int(request.args.get('limit', DEFAULT_SYNC_LIMIT)), MAX_SYNC_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    try:
+        return jsonify(sync_page(request.args.get('cursor'), limit))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'invalid cursor'}), 400
@@ -0,0 +1,213 @@
+"""Slotting: which bin each product belongs in.
+
+Usable bins are ranked by pick convenience: zone in ``SLOTTING_ZONE_ORDER``,
+then aisle, then shelf. Products are ranked by pick velocity, and the fastest
+movers get the best bins that can hold their stock and that their category
+may use (``SLOTTING_ZONE_RULES``, e.g. ``{"Chemicals": ["D"]}``). The result
+is persisted one row per bin, with a unique index on the product, so "where
+does this product belong" is an indexed lookup.
+
+Velocity is an exponentially decayed pick volume with half-life
+``SLOTTING_HALF_LIFE_DAYS``, stored as a forward-decayed log score: a pick of
+``qty`` at time ``t`` adds ``qty * e^(t/tau)``. Scores never need aging
+because decay is the same for everyone, so only the picked product can change
+rank, and :meth:`SlottingEngine.record_pick` re-slots just that product in
+the pick's transaction by swapping it with the slowest mover holding a
+better bin. :meth:`SlottingEngine.recompute` redoes the whole assignment
+(after bin or zone rule changes).
+
+A pick changes the score with one conditional UPDATE that only matches the
+score it was computed from, and the re-slot locks the slot rows it rewrites.
+A pick that races another on the same product raises
+:class:`~stock_atomic.StockConflict` (or an ``IntegrityError`` when both
+create the score row), so callers run it under
+:func:`~stock_atomic.retry_on_conflict`.
+
+Only dispatches through ``stock.py`` are recorded. The blueprint app
+(``app.py``) has no slotting and its picks do not count towards velocity.
+"""
+
+import math
+from datetime import datetime
+
+from sqlalchemy import bindparam, func, update
+
+from stock_atomic import StockConflict
+
+EPOCH = datetime(2000, 1, 1)
+NO_SCORE = -1e300  # never picked
+
+
+def _number(value):
+    try:
+        return (0, int(value), '')
+    except (TypeError, ValueError):
+        return (1, 0, value or '')
+
+
+def _log_add(a, b):
+    if a is None or a <= NO_SCORE:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+class SlottingEngine:
+    def __init__(self, db, product_model, bin_model, total_model, slot_model, velocity_model):
+        self.db = db
+        self.Product = product_model
+        self.Bin = bin_model
+        self.Total = total_model
+        self.Slot = slot_model
+        self.Velocity = velocity_model
+        self.zone_order = []
+        self.zone_rules = {}
+        self.tau = 14 / math.log(2)
+
+    def init_app(self, app):
+        self.zone_order = list(app.config.get('SLOTTING_ZONE_ORDER') or [])
+        self.zone_rules = dict(app.config.get('SLOTTING_ZONE_RULES') or {})
+        self.tau = app.config.get('SLOTTING_HALF_LIFE_DAYS', 14) / math.log(2)
+
+    # Rules
+
+    def _bin_key(self, zone, aisle, shelf, code):
+        zone_rank = self.zone_order.index(zone) if zone in self.zone_order else len(self.zone_order)
+        return (zone_rank, zone, _number(aisle), _number(shelf), code)
+
+    def _allowed(self, category, zone):
+        zones = self.zone_rules.get(category)
+        return zones is None or zone in zones
+
+    def velocity(self, score, now=None):
+        """Decayed picks per day for a stored `score`."""
+        if score is None or score <= NO_SCORE:
+            return 0.0
+        now = (now or datetime.utcnow()) - EPOCH
+        return math.exp(score - now.total_seconds() / 86400 / self.tau) / self.tau
+
+    # Full assignment
+
+    def recompute(self):
+        """Reassign every product from scratch; returns the number of products whose bin changed."""
+        session = self.db.session
+        B, P, T, S, V = self.Bin, self.Product, self.Total, self.Slot, self.Velocity
+        bins = session.query(B.id, B.zone, B.aisle, B.shelf, B.bin_code, B.capacity)\
+            .filter(B.capacity.isnot(None), func.coalesce(B.status, '') != 'maintenance').all()
+        bins.sort(key=lambda b: self._bin_key(b.zone, b.aisle, b.shelf, b.bin_code))
+        ranks = {b.id: rank for rank, b in enumerate(bins)}
+
+        score = func.coalesce(V.score, NO_SCORE)
+        products = session.query(P.id, P.category, func.coalesce(T.quantity, 0))\
+            .outerjoin(V, V.product_id == P.id)\
+            .outerjoin(T, T.product_id == P.id)\
+            .order_by(score.desc(), P.part_number).all()
+
+        free = list(bins)
+        assigned = {}
+        for product_id, category, stock in products:
+            need = max(stock, 1)
+            for i, b in enumerate(free):
+                if b.capacity >= need and self._allowed(category, b.zone):
+                    assigned[b.id] = product_id
+                    del free[i]
+                    break
+
+        previous = dict(session.query(S.product_id, S.bin_location_id).filter(S.product_id.isnot(None)))
+        session.query(S).delete(synchronize_session=False)
+        session.execute(S.__table__.insert(), [
+            {'bin_location_id': b.id, 'rank': ranks[b.id], 'product_id': assigned.get(b.id)}
+            for b in bins
+        ])
+        session.commit()
+        return sum(1 for bin_id, product_id in assigned.items() if previous.get(product_id) != bin_id)
+
+    # Incremental
+
+    def record_pick(self, session, product_id, qty, when=None):
+        """Add a pick of `qty` to the product's velocity and re-slot it if it now outranks others.
+
+        Runs in the caller's transaction, which must be retried on
+        :class:`~stock_atomic.StockConflict` and ``IntegrityError``.
+        """
+        if qty <= 0:
+            return
+        V = self.Velocity
+        days = ((when or datetime.utcnow()) - EPOCH).total_seconds() / 86400
+        weight = math.log(qty) + days / self.tau
+        old = session.query(V.score).filter(V.product_id == product_id).first()
+        if old is None:
+            score = weight
+            # a concurrent first pick inserts the same key and one of us fails
+            session.execute(V.__table__.insert().values(product_id=product_id, score=score))
+        else:
+            score = _log_add(old.score, weight)
+            unchanged = V.score.is_(None) if old.score is None else V.score == old.score
+            result = session.execute(
+                update(V).where(V.product_id == product_id, unchanged).values(score=score),
+                execution_options={'synchronize_session': False},
+            )
+            if result.rowcount != 1:
+                raise StockConflict(f'velocity of product {product_id} changed concurrently')
+        self._promote(session, product_id, score)
+
+    def _promote(self, session, product_id, score):
+        B, P, T, S, V = self.Bin, self.Product, self.Total, self.Slot, self.Velocity
+        current = session.query(S.bin_location_id, S.rank)\
+            .filter(S.product_id == product_id).first()
+        if current is not None and current.rank == 0:
+            return
+        category, stock = session.query(P.category, func.coalesce(T.quantity, 0))\
+            .outerjoin(T, T.product_id == P.id).filter(P.id == product_id).one()
+        need = max(stock, 1)
+
+        # the best bin that fits and is free or held by a slower mover
+        query = session.query(S.rank)\
+            .join(B, B.id == S.bin_location_id)\
+            .outerjoin(V, V.product_id == S.product_id)\
+            .filter(B.capacity >= need)\
+            .filter(S.product_id.is_(None) | (func.coalesce(V.score, NO_SCORE) < score))
+        if current is not None:
+            query = query.filter(S.rank < current.rank)
+        if category in self.zone_rules:
+            query = query.filter(B.zone.in_(self.zone_rules[category]))
+        target = query.order_by(S.rank).limit(1).scalar()
+        if target is None:
+            return
+
+        # Insert the product at `target` and let everyone between it and the
+        # old bin shift down, exactly as recompute would place them
+        rows = session.query(S.bin_location_id, S.product_id, B.capacity, B.zone,
+                             func.coalesce(V.score, NO_SCORE), P.category, func.coalesce(T.quantity, 0))\
+            .join(B, B.id == S.bin_location_id)\
+            .outerjoin(V, V.product_id == S.product_id)\
+            .outerjoin(P, P.id == S.product_id)\
+            .outerjoin(T, T.product_id == S.product_id)\
+            .filter(S.rank >= target)
+        if current is not None:
+            rows = rows.filter(S.rank <= current.rank)
+        # overlapping re-slots wait for each other instead of overwriting
+        rows = rows.with_for_update(of=S)
+        moves = {current.bin_location_id: None} if current is not None else {}
+        carry = (product_id, score, category, need)
+        for bin_id, occupant, capacity, zone, occ_score, occ_category, occ_stock in rows.order_by(S.rank):
+            if occupant == product_id:
+                occupant = None
+            if capacity < carry[3] or not self._allowed(carry[2], zone):
+                continue
+            if occupant is None or occ_score < carry[1]:
+                moves[bin_id] = carry[0]
+                carry = (occupant, occ_score, occ_category, max(occ_stock, 1)) if occupant else None
+                if carry is None:
+                    break
+        # a product left over in `carry` fitted nowhere lower and stays
+        # unslotted until it is picked again or a recompute
+
+        # clear first: product_id is unique
+        session.query(S).filter(S.bin_location_id.in_(list(moves)))\
+            .update({'product_id': None}, synchronize_session=False)
+        session.execute(
+            S.__table__.update().where(S.bin_location_id == bindparam('slot_bin'))
+                .values(product_id=bindparam('slot_product')),
+            [{'slot_bin': bin_id, 'slot_product': pid} for bin_id, pid in moves.items() if pid is not None],
+        )
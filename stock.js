@@ -38,6 +38,8 @@ async function searchStock(query) {
         // Build HTML
         resultsContainer.innerHTML = '';
         matches.forEach(item => {
+            // the placement check is only shown when the backend reports one
+            const checked = item.correctBin !== undefined && item.status !== undefined;
             const statusClass = item.status === 'correct' ? 'status-correct' : 'status-incorrect';
             const statusText = item.status === 'correct' ? 'Correct Location' : 'Incorrect Location';
 
@@ -45,7 +47,7 @@ async function searchStock(query) {
                 <div class="result-card">
                     <div class="result-header">
                         <div class="result-title">${escapeHtml(item.partNumber)} - ${escapeHtml(item.description)}</div>
-                        <div class="result-status ${statusClass}">${statusText}</div>
+                        ${checked ? `<div class="result-status ${statusClass}">${statusText}</div>` : ''}
                     </div>
                     
                     <div class="result-details">
@@ -53,17 +55,17 @@ async function searchStock(query) {
                             <div class="detail-label">Current Bin Location</div>
                             <div class="detail-value">${escapeHtml(item.currentBin)}</div>
                         </div>
-                        <div class="detail-item">
+                        ${checked ? `<div class="detail-item">
                             <div class="detail-label">Correct Bin Location</div>
                             <div class="detail-value">${escapeHtml(item.correctBin)}</div>
-                        </div>
+                        </div>` : ''}
                         <div class="detail-item">
                             <div class="detail-label">Quantity in Stock</div>
                             <div class="detail-value">${escapeHtml(String(item.quantity))} units</div>
                         </div>
                     </div>
                     
-                    <div class="bin-location">
+                    ${checked ? `<div class="bin-location">
                         <div class="bin-title">Correct Placement Location:</div>
                         <div class="bin-info">
                             <div class="bin-number">${escapeHtml(item.correctBin)}</div>
@@ -77,7 +79,7 @@ async function searchStock(query) {
                                 <i class="fas fa-check-circle"></i> This item is in the correct location.
                             </p>`
                         }
-                    </div>
+                    </div>` : ''}
                 </div>
             `;
 
@@ -2,18 +2,69 @@ from flask import Flask, request, jsonify, session
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_cors import CORS
+from sqlalchemy import case, func, literal
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import aliased, contains_eager, joinedload
+import click
 from datetime import datetime, timedelta
+import json
 import jwt
+import os
+import threading
+import time
 import uuid
+from collections import deque, namedtuple
 from functools import wraps
+from product_search import ProductSearch
+from streaming import FORMATS, stream_response
+from list_query import ListError, ListSpec, decode_cursor, encode_cursor, int_filter, page_size
+from resolvers import CodeResolver, as_code
+from stock_atomic import StockConflict, adjust, put, retry_on_conflict, take
+from db import configure_engine, install_pragmas
+from movement_ledger import MovementLedger
+from table_versions import TableVersions
+from token_cache import TokenCache
+from putaway import PutawayIndex
+from slotting import SlottingEngine
+from pick_route import MAX_ROUTE_LINES, Layout, plan, walk_length
+from cycle_count import CycleCountScheduler
+from password_hashing import BcryptScheme, HashingBusy, PasswordHasher
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'bmg_warehouse_secret_key_2023'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///bmg_warehouse.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///bmg_warehouse.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['DB_ENGINE_PROFILE'] = os.environ.get('DB_ENGINE_PROFILE', 'default')  # default, production
+app.config['DASHBOARD_MAX_AGE'] = int(os.environ.get('DASHBOARD_MAX_AGE', 30))  # seconds
+app.config['RESOLVER_CACHE_SIZE'] = int(os.environ.get('RESOLVER_CACHE_SIZE', 10000))
+app.config['RESOLVER_PRELOAD'] = os.environ.get('RESOLVER_PRELOAD', '0') == '1'
+app.config['MOVEMENT_LEDGER'] = os.environ.get('MOVEMENT_LEDGER', 'off')  # off, wait, async
+app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('RESPONSE_CACHE_SIZE', 256))
+app.config['TOKEN_CACHE_SIZE'] = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+app.config['TOKEN_CACHE_TTL'] = int(os.environ.get('TOKEN_CACHE_TTL', 60))  # seconds
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))  # 0 = request thread
+app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 32))
+app.config['SLOTTING_ZONE_ORDER'] = os.environ.get('SLOTTING_ZONE_ORDER', 'A,B,C,D').split(',')  # nearest first
+app.config['SLOTTING_ZONE_RULES'] = json.loads(os.environ.get('SLOTTING_ZONE_RULES', '{}'))  # category -> zones
+app.config['SLOTTING_HALF_LIFE_DAYS'] = float(os.environ.get('SLOTTING_HALF_LIFE_DAYS', 14))
+app.config['PICK_AISLES_PER_ZONE'] = int(os.environ.get('PICK_AISLES_PER_ZONE', 0)) or None  # None = from the order
+app.config['PICK_SHELVES_PER_AISLE'] = int(os.environ.get('PICK_SHELVES_PER_AISLE', 0)) or None
+app.config['PICK_AISLE_WIDTH'] = float(os.environ.get('PICK_AISLE_WIDTH', 3.0))  # metres between aisles
+app.config['PICK_SHELF_PITCH'] = float(os.environ.get('PICK_SHELF_PITCH', 1.0))  # metres between shelves
+app.config['CYCLE_COUNT_WINDOW_DAYS'] = int(os.environ.get('CYCLE_COUNT_WINDOW_DAYS', 90))
+app.config['CYCLE_COUNT_CUTOFFS'] = [float(x) for x in os.environ.get('CYCLE_COUNT_CUTOFFS', '0.8,0.95').split(',')]  # A, B
+app.config['CYCLE_COUNT_INTERVALS'] = [int(x) for x in os.environ.get('CYCLE_COUNT_INTERVALS', '30,90,180').split(',')]  # days: A, B, C
+app.config['CYCLE_COUNT_ROLLUP_LAG_DAYS'] = int(os.environ.get('CYCLE_COUNT_ROLLUP_LAG_DAYS', 7))  # re-rolled each refresh
 
+configure_engine(app)
 db = SQLAlchemy(app)
+install_pragmas(app, db)
 bcrypt = Bcrypt(app)
+password_hasher = PasswordHasher(BcryptScheme(bcrypt, app.config['BCRYPT_LOG_ROUNDS']))
+password_hasher.init_app(app)
 CORS(app)
 
 # Database Models
@@ -64,12 +115,12 @@ class StockMovement(db.Model):
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     product_id = db.Column(db.String(36), db.ForeignKey('product.id'), nullable=False)
     from_bin_id = db.Column(db.String(36), db.ForeignKey('bin_location.id'))
-    to_bin_id = db.Column(db.String(36), db.ForeignKey('bin_location.id'), nullable=False)
+    to_bin_id = db.Column(db.String(36), db.ForeignKey('bin_location.id'))
     quantity = db.Column(db.Integer, nullable=False)
     movement_type = db.Column(db.String(20), nullable=False)  # receive, dispatch, transfer, adjustment
     reference_number = db.Column(db.String(100))
     user_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False)
-    movement_date = db.Column(db.DateTime, default=datetime.utcnow)
+    movement_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     notes = db.Column(db.Text)
     
     product = db.relationship('Product', backref=db.backref('movements', lazy=True))
@@ -85,8 +136,335 @@ class Stocktake(db.Model):
     user_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False)
     stocktake_date = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='pending')  # pending, reviewed, resolved
+    
+    product = db.relationship('Product')
+    bin_location = db.relationship('BinLocation')
+
+# Cycle counts: a session freezes the expected quantity of every (product,
+# bin) in a zone when it opens; counts stream in against that snapshot and
+# the variances are posted together on approval
+class StocktakeSession(db.Model):
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    zone = db.Column(db.String(10), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='open')  # open, approved, cancelled
+    opened_by = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False)
+    opened_at = db.Column(db.DateTime, default=datetime.utcnow)
+    closed_by = db.Column(db.String(36), db.ForeignKey('user.id'))
+    closed_at = db.Column(db.DateTime)
+
+class StocktakeLine(db.Model):
+    session_id = db.Column(db.String(36), db.ForeignKey('stocktake_session.id'), primary_key=True)
+    bin_location_id = db.Column(db.String(36), db.ForeignKey('bin_location.id'), primary_key=True)
+    product_id = db.Column(db.String(36), db.ForeignKey('product.id'), primary_key=True)
+    expected_quantity = db.Column(db.Integer, nullable=False, default=0)
+    counted_quantity = db.Column(db.Integer)  # None until counted; the last count wins
+    counted_by = db.Column(db.String(36), db.ForeignKey('user.id'))
+
+# Movements per product and day, for cycle-count classification; see cycle_count.py
+class MovementRollup(db.Model):
+    product_id = db.Column(db.String(36), db.ForeignKey('product.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True, index=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    movements = db.Column(db.Integer, nullable=False, default=0)
+
+# Denormalised running totals, maintained alongside every StockItem change
+class ProductStockTotal(db.Model):
+    product_id = db.Column(db.String(36), db.ForeignKey('product.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+class BinStockTotal(db.Model):
+    bin_location_id = db.Column(db.String(36), db.ForeignKey('bin_location.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+class TableVersion(db.Model):
+    # a table's version is the sum over its shards; see table_versions.py
+    name = db.Column(db.String(64), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, default=0)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# Slotting: the product each usable bin is assigned to, best bins first
+class BinSlot(db.Model):
+    bin_location_id = db.Column(db.String(36), db.ForeignKey('bin_location.id'), primary_key=True)
+    rank = db.Column(db.Integer, nullable=False, index=True)
+    product_id = db.Column(db.String(36), db.ForeignKey('product.id'), unique=True)
+
+class ProductVelocity(db.Model):
+    product_id = db.Column(db.String(36), db.ForeignKey('product.id'), primary_key=True)
+    score = db.Column(db.Float)  # forward-decayed log pick volume, see slotting.py
+
+product_search = ProductSearch(db, Product)
+
+movement_ledger = MovementLedger(StockMovement)
+movement_ledger.init_app(app, db)
+
+# bumped on every committed write; drive ETags of the list and report endpoints
+table_versions = TableVersions(TableVersion, [
+    'product', 'bin_location', 'stock_item', 'product_stock_total', 'bin_stock_total'
+])
+table_versions.init_app(app, db)
+
+# free capacity per zone for putaway suggestions; fed by adjust_stock_totals
+putaway_index = PutawayIndex(db, BinLocation, StockItem, table_versions)
+
+slotting = SlottingEngine(db, Product, BinLocation, ProductStockTotal, BinSlot, ProductVelocity)
+slotting.init_app(app)
+
+pick_layout = Layout(
+    app.config['SLOTTING_ZONE_ORDER'],
+    aisles_per_zone=app.config['PICK_AISLES_PER_ZONE'],
+    shelves_per_aisle=app.config['PICK_SHELVES_PER_AISLE'],
+    aisle_width=app.config['PICK_AISLE_WIDTH'],
+    shelf_pitch=app.config['PICK_SHELF_PITCH']
+)
+
+cycle_counts = CycleCountScheduler(db, Product, StockMovement, MovementRollup, Stocktake, ProductStockTotal)
+cycle_counts.init_app(app)
+
+@app.cli.command('refresh-movement-rollup')
+@click.option('--full', is_flag=True, help='Rebuild every day, e.g. after back-dating old movements.')
+def refresh_movement_rollup_command(full):
+    """Roll new stock movements up per product and day; run periodically (e.g. from cron)."""
+    written = cycle_counts.refresh_rollup(full)
+    click.echo(f'{written} rollup row(s) written')
+
+@app.cli.command('recompute-slotting')
+def recompute_slotting_command():
+    """Reassign every product's bin from velocity, capacity and zone rules."""
+    moved = slotting.recompute()
+    click.echo(f'{moved} product(s) assigned a new bin')
+
+# part_number / bin_code lookups; snapshots carry the columns the routes read
+product_resolver = CodeResolver(
+    Product, 'part_number', ['id', 'part_number', 'description', 'min_stock_level'],
+    maxsize=app.config['RESOLVER_CACHE_SIZE']
+)
+bin_resolver = CodeResolver(
+    BinLocation, 'bin_code', ['id', 'bin_code', 'zone'],
+    maxsize=app.config['RESOLVER_CACHE_SIZE']
+)
+product_resolver.watch(db)
+bin_resolver.watch(db)
+
+# Stock totals
+def _add_to_total(model, key_column, key, delta):
+    values = {key_column: key, 'quantity': delta}
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else pg_insert
+        stmt = insert(model).values(values).on_conflict_do_update(
+            index_elements=[key_column],
+            set_={'quantity': model.quantity + delta}
+        )
+        db.session.execute(stmt)
+        return
+    updated = db.session.query(model).filter(getattr(model, key_column) == key)\
+        .update({'quantity': model.quantity + delta}, synchronize_session=False)
+    if not updated:
+        db.session.add(model(**values))
+
+def _add_to_totals(model, key_column, deltas):
+    """Bulk _add_to_total: `deltas` maps key -> delta, applied in one executemany."""
+    rows = [{key_column: key, 'quantity': delta} for key, delta in deltas.items() if delta]
+    if not rows:
+        return
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else pg_insert
+        stmt = insert(model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[key_column],
+            set_={'quantity': model.quantity + stmt.excluded.quantity}
+        )
+        db.session.execute(stmt, rows)
+        return
+    for row in rows:
+        _add_to_total(model, key_column, row[key_column], row['quantity'])
+
+def adjust_stock_totals(product_id, bin_location_id, delta):
+    """Apply a StockItem quantity change to the product and bin totals.
+
+    Runs in the caller's transaction, so it must be called before the commit
+    that persists the matching StockItem change.
+    """
+    if delta:
+        _add_to_total(ProductStockTotal, 'product_id', product_id, delta)
+        _add_to_total(BinStockTotal, 'bin_location_id', bin_location_id, delta)
+        putaway_index.record(db.session, product_id, bin_location_id, delta)
+
+def rebuild_stock_totals():
+    """Recompute both totals tables from StockItem.
+
+    Returns a list of (scope, id, stored, actual) tuples for every total that
+    had drifted from the StockItem rows.
+    """
+    drift = []
+    for scope, model, key_column, item_column in (
+        ('product', ProductStockTotal, 'product_id', StockItem.product_id),
+        ('bin', BinStockTotal, 'bin_location_id', StockItem.bin_location_id),
+    ):
+        actual = dict(
+            db.session.query(item_column, func.coalesce(func.sum(StockItem.quantity), 0))
+            .group_by(item_column)
+            .all()
+        )
+        stored = {getattr(t, key_column): t.quantity for t in model.query.all()}
+        for key in set(actual) | set(stored):
+            if actual.get(key, 0) != stored.get(key, 0):
+                drift.append((scope, key, stored.get(key, 0), actual.get(key, 0)))
+
+        model.query.delete()
+        db.session.bulk_insert_mappings(model, [
+            {key_column: key, 'quantity': quantity} for key, quantity in actual.items()
+        ])
+    db.session.commit()
+    return drift
+
+# Dashboard snapshot
+RECENT_DISCREPANCIES = 10
+
+class DashboardSnapshot:
+    """Process-local copy of the dashboard figures.
+
+    Built once from the database, then kept current by the hooks below as this
+    process commits stock changes and stocktakes. Changes committed by other
+    workers are picked up when the snapshot is older than DASHBOARD_MAX_AGE,
+    which forces a full rebuild on the next read.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self._payload = None
+        self._built_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+            self._payload = None
+
+    def get(self, force=False):
+        with self._lock:
+            stale = time.monotonic() - self._built_at > app.config['DASHBOARD_MAX_AGE']
+            if force or stale or self._state is None:
+                self._state = self._build()
+                self._payload = None
+                self._built_at = time.monotonic()
+            if self._payload is None:
+                self._payload = self._render(self._state)
+            return self._payload
+
+    def _build(self):
+        total_stocktakes, accurate_stocktakes = db.session.query(
+            func.count(Stocktake.id),
+            func.coalesce(func.sum(case((Stocktake.variance == 0, 1), else_=0)), 0)
+        ).one()
+        recent = Stocktake.query\
+            .filter(Stocktake.variance != 0)\
+            .options(joinedload(Stocktake.product), joinedload(Stocktake.bin_location))\
+            .order_by(Stocktake.stocktake_date.desc())\
+            .limit(RECENT_DISCREPANCIES).all()
+        low_stock = db.session.query(Product, func.coalesce(ProductStockTotal.quantity, 0))\
+            .outerjoin(ProductStockTotal, ProductStockTotal.product_id == Product.id)\
+            .filter(func.coalesce(ProductStockTotal.quantity, 0) <= Product.min_stock_level)\
+            .all()
+        return {
+            'total_products': Product.query.count(),
+            'total_bins': BinLocation.query.count(),
+            'total_stocktakes': total_stocktakes,
+            'accurate_stocktakes': accurate_stocktakes,
+            'recent_discrepancies': deque(
+                (self._discrepancy(s, s.product, s.bin_location) for s in recent),
+                maxlen=RECENT_DISCREPANCIES
+            ),
+            'low_stock': {
+                product.id: self._low_stock(product, total_stock) for product, total_stock in low_stock
+            },
+        }
+
+    @staticmethod
+    def _discrepancy(stocktake, product, bin_location):
+        return {
+            'part_number': product.part_number,
+            'bin_location': bin_location.bin_code,
+            'variance': stocktake.variance,
+            'date': stocktake.stocktake_date.isoformat()
+        }
+
+    @staticmethod
+    def _low_stock(product, total_stock):
+        return {
+            'part_number': product.part_number,
+            'description': product.description,
+            'current_stock': total_stock,
+            'min_stock_level': product.min_stock_level
+        }
+
+    @staticmethod
+    def _render(state):
+        total = state['total_stocktakes']
+        accuracy_rate = (state['accurate_stocktakes'] / total * 100) if total > 0 else 100
+        return {
+            'total_products': state['total_products'],
+            'total_bins': state['total_bins'],
+            'stock_accuracy': round(accuracy_rate, 2),
+            'total_discrepancies': total - state['accurate_stocktakes'],
+            'recent_discrepancies': list(state['recent_discrepancies']),
+            'low_stock_alerts': list(state['low_stock'].values())
+        }
+
+    # Hooks, called after the corresponding change has been committed
+
+    def product_added(self, product):
+        with self._lock:
+            if self._state is None:
+                return
+            self._state['total_products'] += 1
+        self.stock_changed(product)
+
+    def stock_changed(self, product):
+        total = db.session.query(ProductStockTotal.quantity)\
+            .filter_by(product_id=product.id).scalar() or 0
+        with self._lock:
+            if self._state is None:
+                return
+            low_stock = self._state['low_stock']
+            if product.min_stock_level is not None and total <= product.min_stock_level:
+                low_stock[product.id] = self._low_stock(product, total)
+            else:
+                low_stock.pop(product.id, None)
+            self._payload = None
+
+    def stocktake_recorded(self, stocktake, product, bin_location):
+        with self._lock:
+            if self._state is None:
+                return
+            self._state['total_stocktakes'] += 1
+            if stocktake.variance == 0:
+                self._state['accurate_stocktakes'] += 1
+            else:
+                self._state['recent_discrepancies'].appendleft(
+                    self._discrepancy(stocktake, product, bin_location)
+                )
+            self._payload = None
+
+dashboard = DashboardSnapshot()
+
+@app.cli.command('rebuild-stock-totals')
+def rebuild_stock_totals_command():
+    """Rebuild product and bin stock totals from StockItem and report drift."""
+    drift = rebuild_stock_totals()
+    for scope, key, stored, actual in drift:
+        click.echo(f'{scope} {key}: stored {stored}, actual {actual}')
+    click.echo(f'{len(drift)} total(s) corrected')
 
 # Authentication Decorator
+# What routes see as current_user; a plain snapshot so it can be cached
+# across requests and sessions
+UserRef = namedtuple('UserRef', ['id', 'username', 'role'])
+
+token_cache = TokenCache(app.config['TOKEN_CACHE_SIZE'], app.config['TOKEN_CACHE_TTL'])
+token_cache.watch(db, User)
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -97,16 +475,38 @@ def token_required(f):
             
         try:
             token = token.split(' ')[1]  # Remove Bearer prefix
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = User.query.get(data['user_id'])
-        except:
+        except IndexError:
             return jsonify({'message': 'Token is invalid!'}), 401
+        
+        current_user = token_cache.get(token)
+        if current_user is None:
+            try:
+                data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+                user = db.session.get(User, data['user_id'])
+            except:
+                return jsonify({'message': 'Token is invalid!'}), 401
+            if user is None or not user.is_active:
+                return jsonify({'message': 'Token is invalid!'}), 401
+            current_user = UserRef(user.id, user.username, user.role)
+            token_cache.put(token, user.id, current_user, data.get('exp'))
             
         return f(current_user, *args, **kwargs)
         
     return decorated
 
 # Authentication Routes
+@app.errorhandler(HashingBusy)
+def hashing_busy(e):
+    response = jsonify({'message': 'Server busy, please retry shortly!'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+@app.errorhandler(StockConflict)
+def stock_conflict(e):
+    # still conflicting after retry_on_conflict's retries
+    return jsonify({'message': 'Stock changed concurrently, please retry!'}), 409
+
 @app.route('/api/auth/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -117,7 +517,8 @@ def register():
     if User.query.filter_by(email=data['email']).first():
         return jsonify({'message': 'Email already exists!'}), 400
         
-    hashed_password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+    db.session.rollback()  # don't hold a pooled connection while waiting for the hash
+    hashed_password = password_hasher.hash(data['password'])
     
     user = User(
         username=data['username'],
@@ -137,41 +538,86 @@ def login():
     data = request.get_json()
     user = User.query.filter_by(username=data['username']).first()
     
-    if user and bcrypt.check_password_hash(user.password_hash, data['password']):
+    # the rollback expires `user`, so keep what the response needs
+    stored_hash = user.password_hash if user else None
+    profile = {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'role': user.role,
+        'department': user.department
+    } if user else None
+    db.session.rollback()  # don't hold a pooled connection while waiting for the hash
+    ok, new_hash = password_hasher.verify(stored_hash, data['password']) if user else (False, None)
+    if ok:
+        if new_hash:
+            # hashed with an older cost factor; upgrade while we have the password,
+            # unless the password was changed meanwhile
+            User.query.filter_by(id=profile['id'], password_hash=stored_hash)\
+                .update({'password_hash': new_hash}, synchronize_session=False)
+            db.session.commit()
         token = jwt.encode({
-            'user_id': user.id,
+            'user_id': profile['id'],
             'exp': datetime.utcnow() + timedelta(hours=24)
         }, app.config['SECRET_KEY'], algorithm='HS256')
         
         return jsonify({
             'token': token,
-            'user': {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'role': user.role,
-                'department': user.department
-            }
+            'user': profile
         })
     
     return jsonify({'message': 'Invalid credentials!'}), 401
 
+@app.route('/api/auth/cache-stats', methods=['GET'])
+@token_required
+def cache_stats(current_user):
+    if current_user.role != 'admin':
+        return jsonify({'message': 'Insufficient permissions!'}), 403
+    return jsonify({
+        'tokens': token_cache.stats(),
+        'products': product_resolver.cache.stats(),
+        'bins': bin_resolver.cache.stats(),
+        'responses': table_versions.bodies.stats(),
+    })
+
 # Product Management
+product_list = ListSpec(
+    query=lambda *cols: db.session.query(*cols).select_from(Product)
+        .outerjoin(ProductStockTotal, ProductStockTotal.product_id == Product.id),
+    columns={
+        'id': Product.id,
+        'part_number': Product.part_number,
+        'description': Product.description,
+        'category': Product.category,
+        'manufacturer': Product.manufacturer,
+        'unit_price': Product.unit_price,
+        'min_stock_level': Product.min_stock_level,
+        'max_stock_level': Product.max_stock_level,
+        'current_stock': func.coalesce(ProductStockTotal.quantity, 0),
+    },
+    sorts={
+        'id': Product.id,
+        'part_number': Product.part_number,
+        'category': func.coalesce(Product.category, ''),
+        'unit_price': func.coalesce(Product.unit_price, 0),
+        'current_stock': func.coalesce(ProductStockTotal.quantity, 0),
+    },
+    filters={
+        'category': lambda v, name: Product.category == v,
+        'manufacturer': lambda v, name: Product.manufacturer == v,
+        'min_quantity': int_filter(lambda v: func.coalesce(ProductStockTotal.quantity, 0) >= v),
+    },
+    default_sort='part_number',
+)
+
 @app.route('/api/products', methods=['GET'])
 @token_required
+@table_versions.cached('product', 'product_stock_total')
 def get_products(current_user):
-    products = Product.query.all()
-    return jsonify([{
-        'id': p.id,
-        'part_number': p.part_number,
-        'description': p.description,
-        'category': p.category,
-        'manufacturer': p.manufacturer,
-        'unit_price': p.unit_price,
-        'min_stock_level': p.min_stock_level,
-        'max_stock_level': p.max_stock_level,
-        'current_stock': sum(si.quantity for si in p.stock_items)
-    } for p in products])
+    try:
+        return product_list.response(request.args)
+    except ListError as e:
+        return jsonify({'message': f'{e}!'}), 400
 
 @app.route('/api/products', methods=['POST'])
 @token_required
@@ -181,7 +627,7 @@ def create_product(current_user):
         
     data = request.get_json()
     
-    if Product.query.filter_by(part_number=data['part_number']).first():
+    if product_resolver.resolve(data['part_number']):
         return jsonify({'message': 'Part number already exists!'}), 400
         
     product = Product(
@@ -196,61 +642,137 @@ def create_product(current_user):
     
     db.session.add(product)
     db.session.commit()
+    product_resolver.invalidate(product.part_number)
+    dashboard.product_added(product)
     
     return jsonify({'message': 'Product created successfully!'}), 201
 
 # Stock Management
+item_list = ListSpec(
+    query=lambda *cols: db.session.query(*cols).select_from(StockItem)
+        .join(Product, Product.id == StockItem.product_id)
+        .join(BinLocation, BinLocation.id == StockItem.bin_location_id),
+    columns={
+        'id': StockItem.id,
+        'part_number': Product.part_number,
+        'description': Product.description,
+        'category': Product.category,
+        'bin_code': BinLocation.bin_code,
+        'zone': BinLocation.zone,
+        'aisle': BinLocation.aisle,
+        'bin_status': BinLocation.status,
+        'quantity': StockItem.quantity,
+        'batch_number': StockItem.batch_number,
+        'expiry_date': StockItem.expiry_date,
+    },
+    sorts={
+        'id': StockItem.id,
+        'part_number': Product.part_number,
+        'bin_code': BinLocation.bin_code,
+        'quantity': StockItem.quantity,
+    },
+    filters={
+        'part_number': lambda v, name: Product.part_number == v,
+        'bin_code': lambda v, name: BinLocation.bin_code == v,
+        'zone': lambda v, name: BinLocation.zone == v,
+        'aisle': lambda v, name: BinLocation.aisle == v,
+        'category': lambda v, name: Product.category == v,
+        'bin_status': lambda v, name: BinLocation.status == v,
+        'min_quantity': int_filter(lambda v: StockItem.quantity >= v),
+    },
+    default_sort='bin_code',
+)
+
+@app.route('/api/stock/items', methods=['GET'])
+@token_required
+@table_versions.cached('stock_item', 'product', 'bin_location')
+def list_stock_items(current_user):
+    try:
+        return item_list.response(request.args)
+    except ListError as e:
+        return jsonify({'message': f'{e}!'}), 400
+
 @app.route('/api/stock/check', methods=['POST'])
 @token_required
 def check_stock(current_user):
-    data = request.get_json()
-    search_term = data.get('search_term', '').upper()
+    data = request.get_json() or {}
+    limit = page_size(data.get('limit'))
+    cursor = decode_cursor(data.get('cursor'))
+    
+    matches = product_search.matches(data.get('search_term'))
+    if matches is None:
+        return jsonify([])
     
-    # Search by part number or description
-    products = Product.query.filter(
-        (Product.part_number.contains(search_term)) | 
-        (Product.description.contains(search_term))
-    ).all()
+    # One round trip: stock rows joined to their ranked product match and bin,
+    # ordered by (rank, part_number, stock item id) so the cursor can resume
+    # where a page ended
+    # The correct bin comes from the slotting assignment (unique index on
+    # BinSlot.product_id); products without a slot count as correctly placed
+    correct_bin = aliased(BinLocation)
+    query = db.session.query(StockItem, matches.c.rank, correct_bin.bin_code)\
+        .join(matches, matches.c.product_id == StockItem.product_id)\
+        .join(StockItem.product)\
+        .join(StockItem.bin_location)\
+        .outerjoin(BinSlot, BinSlot.product_id == StockItem.product_id)\
+        .outerjoin(correct_bin, correct_bin.id == BinSlot.bin_location_id)\
+        .options(contains_eager(StockItem.product), contains_eager(StockItem.bin_location))
+    if cursor:
+        if not (isinstance(cursor, list) and len(cursor) == 3 and isinstance(cursor[0], (int, float))
+                and isinstance(cursor[1], str) and isinstance(cursor[2], str)):
+            return jsonify({'message': 'Invalid cursor!'}), 400
+        last_rank, last_part, last_id = cursor
+        query = query.filter(
+            (matches.c.rank > last_rank) |
+            ((matches.c.rank == last_rank) & (Product.part_number > last_part)) |
+            ((matches.c.rank == last_rank) & (Product.part_number == last_part) & (StockItem.id > last_id))
+        )
+    
+    rows = query.order_by(matches.c.rank, Product.part_number, StockItem.id).limit(limit + 1).all()
     
     results = []
-    for product in products:
-        stock_items = StockItem.query.filter_by(product_id=product.id).all()
-        
-        for stock_item in stock_items:
-            results.append({
-                'part_number': product.part_number,
-                'description': product.description,
-                'current_bin': stock_item.bin_location.bin_code,
-                'correct_bin': stock_item.bin_location.bin_code,  # In real system, this might be different
-                'quantity': stock_item.quantity,
-                'status': 'correct',  # This would be determined by business logic
-                'batch_number': stock_item.batch_number,
-                'zone': stock_item.bin_location.zone
-            })
+    for stock_item, _, correct_code in rows[:limit]:
+        product = stock_item.product
+        bin_location = stock_item.bin_location
+        correct_code = correct_code or bin_location.bin_code
+        results.append({
+            'part_number': product.part_number,
+            'description': product.description,
+            'current_bin': bin_location.bin_code,
+            'correct_bin': correct_code,
+            'quantity': stock_item.quantity,
+            'status': 'correct' if correct_code == bin_location.bin_code else 'incorrect',
+            'batch_number': stock_item.batch_number,
+            'zone': bin_location.zone
+        })
     
-    return jsonify(results)
+    response = jsonify(results)
+    if len(rows) > limit:
+        last, last_rank, _ = rows[limit - 1]
+        response.headers['X-Next-Cursor'] = encode_cursor([last_rank, last.product.part_number, last.id])
+    return response
 
 @app.route('/api/stock/receive', methods=['POST'])
 @token_required
+@retry_on_conflict(db.session)
 def receive_stock(current_user):
     data = request.get_json()
     
-    product = Product.query.filter_by(part_number=data['part_number']).first()
+    product = product_resolver.resolve(data['part_number'])
     if not product:
         return jsonify({'message': 'Product not found!'}), 404
         
-    bin_location = BinLocation.query.filter_by(bin_code=data['bin_code']).first()
+    bin_location = bin_resolver.resolve(data['bin_code'])
     if not bin_location:
         return jsonify({'message': 'Bin location not found!'}), 404
     
     # Check if stock item already exists in this bin
-    stock_item = StockItem.query.filter_by(
+    stock_item_id = db.session.query(StockItem.id).filter_by(
         product_id=product.id, 
         bin_location_id=bin_location.id
-    ).first()
+    ).limit(1).scalar()
     
-    if stock_item:
-        stock_item.quantity += data['quantity']
+    if stock_item_id:
+        put(db.session, StockItem, stock_item_id, data['quantity'])
     else:
         stock_item = StockItem(
             product_id=product.id,
@@ -260,6 +782,7 @@ def receive_stock(current_user):
             expiry_date=datetime.strptime(data['expiry_date'], '%Y-%m-%d') if data.get('expiry_date') else None
         )
         db.session.add(stock_item)
+    adjust_stock_totals(product.id, bin_location.id, data['quantity'])
     
     # Record movement
     movement = StockMovement(
@@ -271,34 +794,40 @@ def receive_stock(current_user):
         user_id=current_user.id,
         notes=data.get('notes')
     )
-    db.session.add(movement)
+    movement_ledger.add(db.session, movement)
     
     db.session.commit()
+    dashboard.stock_changed(product)
     
     return jsonify({'message': 'Stock received successfully!'}), 201
 
 @app.route('/api/stock/dispatch', methods=['POST'])
 @token_required
+@retry_on_conflict(db.session)
 def dispatch_stock(current_user):
     data = request.get_json()
     
-    product = Product.query.filter_by(part_number=data['part_number']).first()
+    product = product_resolver.resolve(data['part_number'])
     if not product:
         return jsonify({'message': 'Product not found!'}), 404
         
-    bin_location = BinLocation.query.filter_by(bin_code=data['bin_code']).first()
+    bin_location = bin_resolver.resolve(data['bin_code'])
     if not bin_location:
         return jsonify({'message': 'Bin location not found!'}), 404
     
-    stock_item = StockItem.query.filter_by(
+    # Conditional decrement: fails rather than going negative if another
+    # dispatch got there first
+    stock_item_id = db.session.query(StockItem.id).filter_by(
         product_id=product.id, 
         bin_location_id=bin_location.id
-    ).first()
+    ).filter(StockItem.quantity >= data['quantity']).limit(1).scalar()
     
-    if not stock_item or stock_item.quantity < data['quantity']:
+    if not stock_item_id or take(db.session, StockItem, stock_item_id, data['quantity']) is None:
+        db.session.rollback()
         return jsonify({'message': 'Insufficient stock available!'}), 400
     
-    stock_item.quantity -= data['quantity']
+    adjust_stock_totals(product.id, bin_location.id, -data['quantity'])
+    slotting.record_pick(db.session, product.id, data['quantity'])
     
     # Record movement
     movement = StockMovement(
@@ -310,63 +839,190 @@ def dispatch_stock(current_user):
         user_id=current_user.id,
         notes=data.get('notes')
     )
-    db.session.add(movement)
+    movement_ledger.add(db.session, movement)
     
     db.session.commit()
+    dashboard.stock_changed(product)
     
     return jsonify({'message': 'Stock dispatched successfully!'}), 200
 
 # Bin Location Management
+@app.route('/api/putaway/suggest', methods=['GET'])
+@token_required
+def suggest_putaway(current_user):
+    product = product_resolver.resolve(request.args.get('part_number'))
+    if not product:
+        return jsonify({'message': 'Product not found!'}), 404
+    try:
+        qty = int(request.args.get('qty', 0))
+        limit = min(int(request.args.get('limit', 5)), 50)
+    except ValueError:
+        return jsonify({'message': 'qty and limit must be integers!'}), 400
+    if qty <= 0 or limit <= 0:
+        return jsonify({'message': 'qty and limit must be positive!'}), 400
+    
+    suggestions = putaway_index.suggest(product.id, qty, zone=request.args.get('zone'), limit=limit)
+    return jsonify({
+        'part_number': product.part_number,
+        'quantity': qty,
+        'suggestions': suggestions
+    })
+
+@app.route('/api/pick/route', methods=['POST'])
+@token_required
+def pick_route(current_user):
+    data = request.get_json() or {}
+    lines = data.get('lines')
+    if not isinstance(lines, list) or not lines:
+        return jsonify({'message': 'lines required!'}), 400
+    if len(lines) > MAX_ROUTE_LINES:
+        return jsonify({'message': f'At most {MAX_ROUTE_LINES} lines per route!'}), 400
+    try:
+        wanted = [(line['part_number'], int(line['quantity'])) for line in lines]
+        if not all(isinstance(part, str) for part, _ in wanted):
+            raise TypeError
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'message': 'Each line needs a part_number and an integer quantity!'}), 400
+    if any(qty <= 0 for _, qty in wanted):
+        return jsonify({'message': 'Quantities must be positive!'}), 400
+    
+    products = product_resolver.resolve_many(part for part, _ in wanted)
+    
+    # Every stock row of the ordered products, with its bin, in one query
+    available = {}
+    rows = db.session.query(
+        StockItem.id, StockItem.product_id, StockItem.quantity, StockItem.batch_number,
+        BinLocation.id, BinLocation.bin_code, BinLocation.zone, BinLocation.aisle, BinLocation.shelf
+    ).join(StockItem.bin_location)\
+        .filter(StockItem.product_id.in_([p.id for p in products.values()]), StockItem.quantity > 0)
+    for row in rows:
+        available.setdefault(row[1], []).append(list(row))
+    
+    # Allocate lines in order, preferring bins already on the route (fewer
+    # stops), then the fullest bin
+    stops = {}
+    shortages = []
+    for line, (part_number, qty) in enumerate(wanted):
+        product = products.get(part_number)
+        if product is None:
+            shortages.append({'line': line, 'part_number': part_number, 'requested': qty,
+                              'allocated': 0, 'reason': 'Product not found'})
+            continue
+        remaining = qty
+        candidates = sorted(available.get(product.id, ()), key=lambda r: (r[4] not in stops, -r[2]))
+        for item in candidates:
+            if remaining == 0:
+                break
+            take_qty = min(item[2], remaining)
+            if not take_qty:
+                continue
+            item[2] -= take_qty
+            remaining -= take_qty
+            stop = stops.setdefault(item[4], {
+                'bin_code': item[5], 'zone': item[6], 'aisle': item[7], 'shelf': item[8], 'picks': []
+            })
+            stop['picks'].append({'line': line, 'part_number': part_number,
+                                  'quantity': take_qty, 'batch_number': item[3]})
+        if remaining:
+            shortages.append({'line': line, 'part_number': part_number, 'requested': qty,
+                              'allocated': qty - remaining, 'reason': 'Insufficient stock'})
+    
+    # stops are in first-use order, i.e. the order the lines were typed
+    stops = list(stops.values())
+    bins = [(s['zone'], s['aisle'], s['shelf']) for s in stops]
+    order, distance = plan(bins, pick_layout)
+    route = []
+    for sequence, i in enumerate(order, 1):
+        route.append(dict(stops[i], sequence=sequence))
+    
+    return jsonify({
+        'stops': route,
+        'distance': round(distance, 1),
+        'input_order_distance': round(walk_length(bins, pick_layout), 1),
+        'shortages': shortages
+    })
+
+@app.route('/api/slotting/recompute', methods=['POST'])
+@token_required
+def recompute_slotting(current_user):
+    if current_user.role not in ['admin', 'manager']:
+        return jsonify({'message': 'Insufficient permissions!'}), 403
+    
+    moved = slotting.recompute()
+    return jsonify({'message': 'Slotting recomputed!', 'moved': moved})
+
+bin_list = ListSpec(
+    query=lambda *cols: db.session.query(*cols).select_from(BinLocation)
+        .outerjoin(BinStockTotal, BinStockTotal.bin_location_id == BinLocation.id),
+    columns={
+        'id': BinLocation.id,
+        'bin_code': BinLocation.bin_code,
+        'zone': BinLocation.zone,
+        'aisle': BinLocation.aisle,
+        'shelf': BinLocation.shelf,
+        'capacity': BinLocation.capacity,
+        'status': BinLocation.status,
+        'current_usage': func.coalesce(BinStockTotal.quantity, 0),
+    },
+    sorts={
+        'id': BinLocation.id,
+        'bin_code': BinLocation.bin_code,
+        'zone': BinLocation.zone,
+        'capacity': func.coalesce(BinLocation.capacity, 0),
+        'current_usage': func.coalesce(BinStockTotal.quantity, 0),
+    },
+    filters={
+        'zone': lambda v, name: BinLocation.zone == v,
+        'aisle': lambda v, name: BinLocation.aisle == v,
+        'status': lambda v, name: BinLocation.status == v,
+        'min_quantity': int_filter(lambda v: func.coalesce(BinStockTotal.quantity, 0) >= v),
+    },
+    default_sort='bin_code',
+)
+
 @app.route('/api/bins', methods=['GET'])
 @token_required
+@table_versions.cached('bin_location', 'bin_stock_total')
 def get_bins(current_user):
-    bins = BinLocation.query.all()
-    return jsonify([{
-        'id': b.id,
-        'bin_code': b.bin_code,
-        'zone': b.zone,
-        'aisle': b.aisle,
-        'shelf': b.shelf,
-        'capacity': b.capacity,
-        'status': b.status,
-        'current_usage': sum(si.quantity for si in b.stock_items)
-    } for b in bins])
+    try:
+        return bin_list.response(request.args)
+    except ListError as e:
+        return jsonify({'message': f'{e}!'}), 400
 
 @app.route('/api/stock/transfer', methods=['POST'])
 @token_required
+@retry_on_conflict(db.session)
 def transfer_stock(current_user):
     data = request.get_json()
     
-    product = Product.query.filter_by(part_number=data['part_number']).first()
+    product = product_resolver.resolve(data['part_number'])
     if not product:
         return jsonify({'message': 'Product not found!'}), 404
         
-    from_bin = BinLocation.query.filter_by(bin_code=data['from_bin']).first()
-    to_bin = BinLocation.query.filter_by(bin_code=data['to_bin']).first()
+    from_bin = bin_resolver.resolve(data['from_bin'])
+    to_bin = bin_resolver.resolve(data['to_bin'])
     
     if not from_bin or not to_bin:
         return jsonify({'message': 'Bin location not found!'}), 404
     
-    # Check stock in source bin
-    stock_item = StockItem.query.filter_by(
+    # Remove from source bin with a conditional decrement
+    stock_item = db.session.query(StockItem.id, StockItem.batch_number, StockItem.expiry_date).filter_by(
         product_id=product.id, 
         bin_location_id=from_bin.id
-    ).first()
+    ).filter(StockItem.quantity >= data['quantity']).first()
     
-    if not stock_item or stock_item.quantity < data['quantity']:
+    if not stock_item or take(db.session, StockItem, stock_item.id, data['quantity']) is None:
+        db.session.rollback()
         return jsonify({'message': 'Insufficient stock in source bin!'}), 400
     
-    # Remove from source bin
-    stock_item.quantity -= data['quantity']
-    
     # Add to destination bin
-    dest_stock_item = StockItem.query.filter_by(
+    dest_stock_item_id = db.session.query(StockItem.id).filter_by(
         product_id=product.id, 
         bin_location_id=to_bin.id
-    ).first()
+    ).limit(1).scalar()
     
-    if dest_stock_item:
-        dest_stock_item.quantity += data['quantity']
+    if dest_stock_item_id:
+        put(db.session, StockItem, dest_stock_item_id, data['quantity'])
     else:
         dest_stock_item = StockItem(
             product_id=product.id,
@@ -376,6 +1032,8 @@ def transfer_stock(current_user):
             expiry_date=stock_item.expiry_date
         )
         db.session.add(dest_stock_item)
+    adjust_stock_totals(product.id, from_bin.id, -data['quantity'])
+    adjust_stock_totals(product.id, to_bin.id, data['quantity'])
     
     # Record movement
     movement = StockMovement(
@@ -387,7 +1045,7 @@ def transfer_stock(current_user):
         user_id=current_user.id,
         notes=data.get('notes')
     )
-    db.session.add(movement)
+    movement_ledger.add(db.session, movement)
     
     db.session.commit()
     
@@ -399,11 +1057,11 @@ def transfer_stock(current_user):
 def perform_stocktake(current_user):
     data = request.get_json()
     
-    product = Product.query.filter_by(part_number=data['part_number']).first()
+    product = product_resolver.resolve(data['part_number'])
     if not product:
         return jsonify({'message': 'Product not found!'}), 404
         
-    bin_location = BinLocation.query.filter_by(bin_code=data['bin_code']).first()
+    bin_location = bin_resolver.resolve(data['bin_code'])
     if not bin_location:
         return jsonify({'message': 'Bin location not found!'}), 404
     
@@ -440,7 +1098,7 @@ def perform_stocktake(current_user):
             user_id=current_user.id,
             notes=f'Stocktake adjustment: {variance}'
         )
-        db.session.add(movement)
+        movement_ledger.add(db.session, movement)
         
         # Update stock quantity
         if stock_item:
@@ -452,23 +1110,348 @@ def perform_stocktake(current_user):
                 quantity=counted_quantity
             )
             db.session.add(stock_item)
+        adjust_stock_totals(product.id, bin_location.id, variance)
     
     db.session.commit()
+    dashboard.stocktake_recorded(stocktake, product, bin_location)
+    if variance != 0:
+        dashboard.stock_changed(product)
     
     return jsonify({
         'message': 'Stocktake recorded successfully!',
         'variance': variance
     }), 201
 
+MAX_COUNT_BATCH = 5000
+
+def _stocktake_session(session_id, status=None):
+    stocktake_session = db.session.get(StocktakeSession, session_id)
+    if not stocktake_session:
+        return None, (jsonify({'message': 'Stocktake session not found!'}), 404)
+    if status and stocktake_session.status != status:
+        return None, (jsonify({'message': f'Stocktake session is {stocktake_session.status}!'}), 409)
+    return stocktake_session, None
+
+@app.route('/api/stocktake/sessions', methods=['POST'])
+@token_required
+def open_stocktake_session(current_user):
+    if current_user.role not in ['admin', 'manager']:
+        return jsonify({'message': 'Insufficient permissions!'}), 403
+    
+    zone = (request.get_json() or {}).get('zone')
+    if not zone or not db.session.query(BinLocation.id).filter_by(zone=zone).limit(1).scalar():
+        return jsonify({'message': 'Zone not found!'}), 404
+    
+    stocktake_session = StocktakeSession(zone=zone, opened_by=current_user.id)
+    db.session.add(stocktake_session)
+    db.session.flush()
+    
+    # Freeze the expected quantities with one INSERT ... SELECT
+    snapshot = db.session.query(
+        literal(stocktake_session.id), StockItem.bin_location_id, StockItem.product_id,
+        func.sum(StockItem.quantity)
+    ).join(StockItem.bin_location)\
+        .filter(BinLocation.zone == zone)\
+        .group_by(StockItem.bin_location_id, StockItem.product_id)
+    lines = db.session.execute(StocktakeLine.__table__.insert().from_select(
+        ['session_id', 'bin_location_id', 'product_id', 'expected_quantity'], snapshot
+    )).rowcount
+    db.session.commit()
+    
+    return jsonify({
+        'message': 'Stocktake session opened!',
+        'id': stocktake_session.id,
+        'zone': zone,
+        'lines': lines
+    }), 201
+
+@app.route('/api/stocktake/sessions/<session_id>/counts', methods=['POST'])
+@token_required
+def record_stocktake_counts(current_user, session_id):
+    stocktake_session, error = _stocktake_session(session_id, 'open')
+    if error:
+        return error
+    
+    counts = (request.get_json() or {}).get('counts')
+    if not isinstance(counts, list) or not counts:
+        return jsonify({'message': 'counts required!'}), 400
+    if len(counts) > MAX_COUNT_BATCH:
+        return jsonify({'message': f'At most {MAX_COUNT_BATCH} counts per batch!'}), 400
+    
+    # only strings go to the resolvers; anything else is reported as not found
+    counts = [c if isinstance(c, dict) else {} for c in counts]
+    codes = [(as_code(c.get('part_number')), as_code(c.get('bin_code'))) for c in counts]
+    products = product_resolver.resolve_many(part for part, _ in codes)
+    bins = bin_resolver.resolve_many(bin_code for _, bin_code in codes)
+    
+    rows = {}
+    errors = []
+    for index, count in enumerate(counts):
+        product = products.get(codes[index][0])
+        bin_location = bins.get(codes[index][1])
+        quantity = count.get('counted_quantity')
+        if not product:
+            errors.append({'index': index, 'message': 'Product not found!'})
+        elif not bin_location or bin_location.zone != stocktake_session.zone:
+            errors.append({'index': index, 'message': 'Bin location not in this zone!'})
+        elif not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 0:
+            errors.append({'index': index, 'message': 'counted_quantity must be a non-negative integer!'})
+        else:
+            # a later count of the same product and bin replaces an earlier one
+            rows[(bin_location.id, product.id)] = {
+                'session_id': session_id, 'bin_location_id': bin_location.id, 'product_id': product.id,
+                'expected_quantity': 0, 'counted_quantity': quantity, 'counted_by': current_user.id
+            }
+    
+    # Upsert every count in one executemany; stock found where the snapshot
+    # had none is expected to be zero
+    rows = list(rows.values())
+    dialect = db.engine.dialect.name
+    if rows and dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else pg_insert
+        stmt = insert(StocktakeLine)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['session_id', 'bin_location_id', 'product_id'],
+            set_={'counted_quantity': stmt.excluded.counted_quantity, 'counted_by': stmt.excluded.counted_by}
+        )
+        db.session.execute(stmt, rows)
+    elif rows:
+        for row in rows:
+            updated = StocktakeLine.query.filter_by(
+                session_id=session_id, bin_location_id=row['bin_location_id'], product_id=row['product_id']
+            ).update({'counted_quantity': row['counted_quantity'], 'counted_by': row['counted_by']})
+            if not updated:
+                db.session.add(StocktakeLine(**row))
+    db.session.commit()
+    
+    return jsonify({
+        'message': 'Counts recorded!',
+        'recorded': len(rows),
+        'errors': errors
+    })
+
+@app.route('/api/stocktake/sessions/<session_id>', methods=['GET'])
+@token_required
+def get_stocktake_session(current_user, session_id):
+    stocktake_session, error = _stocktake_session(session_id)
+    if error:
+        return error
+    
+    # Variances are computed in the database over the whole session
+    variance = StocktakeLine.counted_quantity - StocktakeLine.expected_quantity
+    lines, counted, mismatched, net, absolute = db.session.query(
+        func.count(),
+        func.count(StocktakeLine.counted_quantity),
+        func.coalesce(func.sum(case((variance != 0, 1), else_=0)), 0),
+        func.coalesce(func.sum(variance), 0),
+        func.coalesce(func.sum(func.abs(variance)), 0)
+    ).filter(StocktakeLine.session_id == session_id).one()
+    
+    rows = db.session.query(
+        Product.part_number, BinLocation.bin_code,
+        StocktakeLine.expected_quantity, StocktakeLine.counted_quantity
+    ).join(Product, Product.id == StocktakeLine.product_id)\
+        .join(BinLocation, BinLocation.id == StocktakeLine.bin_location_id)\
+        .filter(StocktakeLine.session_id == session_id, variance != 0)\
+        .order_by(BinLocation.bin_code, Product.part_number)
+    
+    return jsonify({
+        'id': stocktake_session.id,
+        'zone': stocktake_session.zone,
+        'status': stocktake_session.status,
+        'opened_at': stocktake_session.opened_at.isoformat(),
+        'lines': lines,
+        'counted': counted,
+        'variance_lines': mismatched,
+        'net_variance': net,
+        'absolute_variance': absolute,
+        'variances': [{
+            'part_number': part_number,
+            'bin_code': bin_code,
+            'expected_quantity': expected,
+            'counted_quantity': counted_quantity,
+            'variance': counted_quantity - expected
+        } for part_number, bin_code, expected, counted_quantity in rows]
+    })
+
+@app.route('/api/stocktake/sessions/<session_id>/approve', methods=['POST'])
+@token_required
+@retry_on_conflict(db.session)
+def approve_stocktake_session(current_user, session_id):
+    if current_user.role not in ['admin', 'manager']:
+        return jsonify({'message': 'Insufficient permissions!'}), 403
+    stocktake_session, error = _stocktake_session(session_id, 'open')
+    if error:
+        return error
+    
+    # Claim the session so a concurrent approval posts nothing twice
+    now = datetime.utcnow()
+    claimed = db.session.query(StocktakeSession)\
+        .filter_by(id=session_id, status='open')\
+        .update({'status': 'approved', 'closed_by': current_user.id, 'closed_at': now},
+                synchronize_session=False)
+    if not claimed:
+        db.session.rollback()
+        return jsonify({'message': 'Stocktake session is no longer open!'}), 409
+    
+    counted = db.session.query(
+        StocktakeLine.product_id, StocktakeLine.bin_location_id,
+        StocktakeLine.expected_quantity, StocktakeLine.counted_quantity
+    ).filter(StocktakeLine.session_id == session_id, StocktakeLine.counted_quantity.isnot(None)).all()
+    variances = {(p, b): c - e for p, b, e, c in counted if c != e}
+    
+    # Current stock items of the variance lines; the variance is applied on
+    # top of whatever moved since the snapshot
+    items = {}
+    if variances:
+        stock_rows = db.session.query(
+            StockItem.id, StockItem.product_id, StockItem.bin_location_id, StockItem.quantity
+        ).join(StockItem.bin_location)\
+            .filter(BinLocation.zone == stocktake_session.zone)\
+            .order_by(StockItem.date_received, StockItem.id)
+        for item_id, product_id, bin_id, quantity in stock_rows:
+            if (product_id, bin_id) in variances:
+                items.setdefault((product_id, bin_id), []).append([item_id, quantity])
+    
+    updates = []
+    created = []
+    movements = []
+    product_deltas = {}
+    bin_deltas = {}
+    for (product_id, bin_id), variance in variances.items():
+        held = items.get((product_id, bin_id), [])
+        applied = 0
+        if variance > 0:
+            if held:
+                updates.append({'item_id': held[-1][0], 'delta': variance})
+            else:
+                created.append({'id': str(uuid.uuid4()), 'product_id': product_id,
+                                'bin_location_id': bin_id, 'quantity': variance})
+            applied = variance
+        else:
+            # shortfalls come out of the oldest stock first, never below zero
+            for item in held:
+                take_qty = min(item[1], applied - variance)
+                if take_qty:
+                    updates.append({'item_id': item[0], 'delta': -take_qty})
+                    applied -= take_qty
+                if applied == variance:
+                    break
+        if not applied:
+            continue
+        movements.append({
+            'id': str(uuid.uuid4()),
+            'product_id': product_id,
+            'to_bin_id': bin_id if applied > 0 else None,
+            'from_bin_id': bin_id if applied < 0 else None,
+            'quantity': abs(applied),
+            'movement_type': 'adjustment',
+            'reference_number': session_id,
+            'user_id': current_user.id,
+            'movement_date': now,
+            'notes': f'Stocktake adjustment: {applied}'
+        })
+        product_deltas[product_id] = product_deltas.get(product_id, 0) + applied
+        bin_deltas[bin_id] = bin_deltas.get(bin_id, 0) + applied
+        putaway_index.record(db.session, product_id, bin_id, applied)
+    
+    # Conditional, like every other stock write: a shortfall worked out from
+    # quantities another request has since taken conflicts (and the claim
+    # rolls back with it) instead of driving the item negative
+    for update in updates:
+        if adjust(db.session, StockItem, update['item_id'], update['delta']) is None:
+            raise StockConflict(update['item_id'])
+    if created:
+        db.session.execute(StockItem.__table__.insert(), created)
+    _add_to_totals(ProductStockTotal, 'product_id', product_deltas)
+    _add_to_totals(BinStockTotal, 'bin_location_id', bin_deltas)
+    movement_ledger.add_rows(db.session, movements)
+    
+    # One Stocktake record per counted line, as single counts leave
+    if counted:
+        db.session.execute(Stocktake.__table__.insert(), [{
+            'id': str(uuid.uuid4()),
+            'product_id': product_id,
+            'bin_location_id': bin_id,
+            'expected_quantity': expected,
+            'counted_quantity': counted_quantity,
+            'variance': counted_quantity - expected,
+            'user_id': current_user.id,
+            'stocktake_date': now,
+            'status': 'resolved'
+        } for product_id, bin_id, expected, counted_quantity in counted])
+    db.session.commit()
+    dashboard.invalidate()
+    
+    return jsonify({
+        'message': 'Stocktake session approved!',
+        'counted': len(counted),
+        'adjusted': len(movements),
+        'net_adjustment': sum(product_deltas.values())
+    })
+
+@app.route('/api/stocktake/sessions/<session_id>/cancel', methods=['POST'])
+@token_required
+def cancel_stocktake_session(current_user, session_id):
+    if current_user.role not in ['admin', 'manager']:
+        return jsonify({'message': 'Insufficient permissions!'}), 403
+    
+    cancelled = db.session.query(StocktakeSession)\
+        .filter_by(id=session_id, status='open')\
+        .update({'status': 'cancelled', 'closed_by': current_user.id, 'closed_at': datetime.utcnow()},
+                synchronize_session=False)
+    db.session.commit()
+    if not cancelled:
+        _, error = _stocktake_session(session_id, 'open')
+        return error
+    return jsonify({'message': 'Stocktake session cancelled!'})
+
+@app.route('/api/cycle-count/schedule', methods=['GET'])
+@token_required
+def cycle_count_schedule(current_user):
+    try:
+        day = datetime.strptime(request.args['date'], '%Y-%m-%d').date() if request.args.get('date') else None
+    except ValueError:
+        return jsonify({'message': 'date must be YYYY-MM-DD!'}), 400
+    
+    # the rollup is refreshed from cron, see refresh-movement-rollup
+    classes = cycle_counts.classify(day)
+    due = cycle_counts.schedule(day, classes)
+    
+    # Names and bins of the listed products, one query each
+    ids = [product_id for product_id, _, _ in due]
+    products = dict(db.session.query(Product.id, Product.part_number).filter(Product.id.in_(ids)))
+    bins = {}
+    held = db.session.query(StockItem.product_id, BinLocation.bin_code)\
+        .join(StockItem.bin_location)\
+        .filter(StockItem.product_id.in_(ids), StockItem.quantity > 0)\
+        .order_by(BinLocation.bin_code)
+    for product_id, bin_code in held:
+        bins.setdefault(product_id, []).append(bin_code)
+    
+    return jsonify({
+        'date': (day or datetime.utcnow().date()).isoformat(),
+        'classes': cycle_counts.summary(classes),
+        'items': [{
+            'part_number': products.get(product_id),
+            'class': abc,
+            'last_counted': last.isoformat() if last else None,
+            'bins': bins.get(product_id, [])
+        } for product_id, abc, last in due]
+    })
+
 # Reports and Analytics
 @app.route('/api/reports/stock-levels', methods=['GET'])
 @token_required
+@table_versions.cached('product', 'product_stock_total')
 def stock_level_report(current_user):
-    products = Product.query.all()
+    products = db.session.query(Product, ProductStockTotal.quantity)\
+        .outerjoin(ProductStockTotal, ProductStockTotal.product_id == Product.id)\
+        .all()
     
     report_data = []
-    for product in products:
-        total_stock = sum(si.quantity for si in product.stock_items)
+    for product, total_stock in products:
+        total_stock = total_stock or 0
         status = 'normal'
         
         if total_stock <= product.min_stock_level:
@@ -492,73 +1475,79 @@ def stock_level_report(current_user):
 def movement_report(current_user):
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
+    fmt = request.args.get('format', 'json')
+    if fmt != 'json' and fmt not in FORMATS:
+        return jsonify({'message': 'Unsupported format!'}), 400
     
-    query = StockMovement.query
+    # Related names come from the same query rather than per-row lazy loads
+    from_bin = aliased(BinLocation)
+    to_bin = aliased(BinLocation)
+    query = db.session.query(
+        StockMovement.id,
+        Product.part_number,
+        Product.description,
+        StockMovement.movement_type,
+        StockMovement.quantity,
+        from_bin.bin_code.label('from_bin'),
+        to_bin.bin_code.label('to_bin'),
+        User.username.label('user'),
+        StockMovement.movement_date,
+        StockMovement.reference_number,
+        StockMovement.notes
+    ).join(Product, Product.id == StockMovement.product_id)\
+        .join(User, User.id == StockMovement.user_id)\
+        .outerjoin(from_bin, from_bin.id == StockMovement.from_bin_id)\
+        .outerjoin(to_bin, to_bin.id == StockMovement.to_bin_id)
     
     if start_date:
         query = query.filter(StockMovement.movement_date >= datetime.strptime(start_date, '%Y-%m-%d'))
     if end_date:
         query = query.filter(StockMovement.movement_date <= datetime.strptime(end_date, '%Y-%m-%d'))
     
-    movements = query.order_by(StockMovement.movement_date.desc()).all()
-    
-    return jsonify([{
-        'id': m.id,
-        'part_number': m.product.part_number,
-        'description': m.product.description,
-        'movement_type': m.movement_type,
-        'quantity': m.quantity,
-        'from_bin': m.from_bin.bin_code if m.from_bin else None,
-        'to_bin': m.to_bin.bin_code if m.to_bin else None,
-        'user': m.user.username,
-        'movement_date': m.movement_date.isoformat(),
-        'reference_number': m.reference_number,
-        'notes': m.notes
-    } for m in movements])
+    query = query.order_by(StockMovement.movement_date.desc(), StockMovement.id.desc())
+    
+    if fmt in FORMATS:
+        rows = (_movement_row(m) for m in query.yield_per(1000))
+        return stream_response(rows, fmt, MOVEMENT_REPORT_FIELDS, filename='movements')
+    
+    # JSON is paged by keyset on (movement_date, id), newest first
+    limit = page_size(request.args.get('limit'))
+    cursor = decode_cursor(request.args.get('cursor'))
+    if cursor:
+        try:
+            if not (isinstance(cursor, list) and len(cursor) == 2 and isinstance(cursor[1], str)):
+                raise ValueError
+            last_date, last_id = datetime.fromisoformat(cursor[0]), cursor[1]
+        except (TypeError, ValueError):
+            return jsonify({'message': 'Invalid cursor!'}), 400
+        query = query.filter(
+            (StockMovement.movement_date < last_date) |
+            ((StockMovement.movement_date == last_date) & (StockMovement.id < last_id))
+        )
+    movements = query.limit(limit + 1).all()
+    
+    response = jsonify([_movement_row(m) for m in movements[:limit]])
+    if len(movements) > limit:
+        last = movements[limit - 1]
+        response.headers['X-Next-Cursor'] = encode_cursor([last.movement_date.isoformat(), last.id])
+    return response
+
+MOVEMENT_REPORT_FIELDS = [
+    'id', 'part_number', 'description', 'movement_type', 'quantity', 'from_bin',
+    'to_bin', 'user', 'movement_date', 'reference_number', 'notes'
+]
+
+def _movement_row(m):
+    row = dict(m._mapping)
+    row['movement_date'] = m.movement_date.isoformat()
+    return row
 
 # Dashboard Data
 @app.route('/api/dashboard', methods=['GET'])
 @token_required
 def dashboard_data(current_user):
-    total_products = Product.query.count()
-    total_bins = BinLocation.query.count()
-    
-    # Calculate stock accuracy (simplified)
-    total_stocktakes = Stocktake.query.count()
-    accurate_stocktakes = Stocktake.query.filter_by(variance=0).count()
-    accuracy_rate = (accurate_stocktakes / total_stocktakes * 100) if total_stocktakes > 0 else 100
-    
-    # Recent discrepancies
-    recent_discrepancies = Stocktake.query.filter(Stocktake.variance != 0)\
-        .order_by(Stocktake.stocktake_date.desc())\
-        .limit(10).all()
-    
-    # Low stock alerts
-    products = Product.query.all()
-    low_stock_alerts = []
-    for product in products:
-        total_stock = sum(si.quantity for si in product.stock_items)
-        if total_stock <= product.min_stock_level:
-            low_stock_alerts.append({
-                'part_number': product.part_number,
-                'description': product.description,
-                'current_stock': total_stock,
-                'min_stock_level': product.min_stock_level
-            })
-    
-    return jsonify({
-        'total_products': total_products,
-        'total_bins': total_bins,
-        'stock_accuracy': round(accuracy_rate, 2),
-        'total_discrepancies': Stocktake.query.filter(Stocktake.variance != 0).count(),
-        'recent_discrepancies': [{
-            'part_number': rd.product.part_number,
-            'bin_location': rd.bin_location.bin_code,
-            'variance': rd.variance,
-            'date': rd.stocktake_date.isoformat()
-        } for rd in recent_discrepancies],
-        'low_stock_alerts': low_stock_alerts
-    })
+    force = request.args.get('refresh') in ('1', 'true') and current_user.role == 'admin'
+    return jsonify(dashboard.get(force=force))
 
 # Initialize Database
 @app.route('/api/init-db', methods=['POST'])
@@ -616,8 +1605,23 @@ def init_db():
             db.session.add(product)
     
     db.session.commit()
+    product_search.install()
+    rebuild_stock_totals()
+    slotting.recompute()
+    product_resolver.invalidate()
+    bin_resolver.invalidate()
+    dashboard.invalidate()
     
     return jsonify({'message': 'Database initialized successfully!'})
 
+if app.config['RESOLVER_PRELOAD']:
+    with app.app_context():
+        try:
+            product_resolver.preload()
+            bin_resolver.preload()
+        except DBAPIError:
+            # tables not created yet; /api/init-db fills the caches lazily
+            db.session.rollback()
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
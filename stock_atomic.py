@@ -0,0 +1,81 @@
+"""Atomic stock quantity updates.
+
+Quantities are changed with a single conditional UPDATE instead of a
+read-check-write in Python, so concurrent dispatches from the same bin can
+neither drive stock negative nor overwrite each other's changes:
+
+    UPDATE stock_item SET quantity = quantity - :q WHERE id = :id AND quantity >= :q
+
+Writers that still collide at the database level (SQLite "database is
+locked", Postgres serialization failures, a unique-key violation when two
+requests insert the same row), or that raise :class:`StockConflict` after
+finding stock changed underneath them, are retried a bounded number of times
+by :func:`retry_on_conflict`. The retry reads again, so it updates the row the
+other writer inserted.
+"""
+
+import random
+import time
+from functools import wraps
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF = 0.05  # seconds, doubled per attempt
+
+
+class StockConflict(Exception):
+    """A conditional stock update matched no row because stock changed concurrently."""
+
+
+def _apply(session, model, item_id, delta, condition=None):
+    stmt = update(model).where(model.id == item_id)
+    if condition is not None:
+        stmt = stmt.where(condition)
+    stmt = stmt.values(quantity=model.quantity + delta)
+    if session.get_bind().dialect.update_returning:
+        return session.execute(
+            stmt.returning(model.quantity),
+            execution_options={'synchronize_session': False}
+        ).scalar()
+    result = session.execute(stmt, execution_options={'synchronize_session': False})
+    if result.rowcount != 1:
+        return None
+    return session.query(model.quantity).filter(model.id == item_id).scalar()
+
+
+def adjust(session, model, item_id, delta):
+    """Add `delta` to stock item `item_id` unless that would make it negative.
+
+    Returns the new quantity, or None when there was not enough stock.
+    """
+    condition = model.quantity >= -delta if delta < 0 else None
+    return _apply(session, model, item_id, delta, condition)
+
+
+def take(session, model, item_id, qty):
+    """Remove `qty` from stock item `item_id`; None if it holds less than that."""
+    return adjust(session, model, item_id, -qty)
+
+
+def put(session, model, item_id, qty):
+    """Add `qty` to stock item `item_id` and return the new quantity."""
+    return adjust(session, model, item_id, qty)
+
+
+def retry_on_conflict(session, attempts=RETRY_ATTEMPTS, backoff=RETRY_BACKOFF):
+    """Re-run the wrapped function when its writes conflict with another writer."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            for attempt in range(attempts):
+                try:
+                    return fn(*args, **kwargs)
+                except (IntegrityError, OperationalError, StockConflict):
+                    session.rollback()
+                    if attempt == attempts - 1:
+                        raise
+                    time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+        return wrapper
+    return decorator
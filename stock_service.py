@@ -47,14 +47,147 @@ SAMPLE_DATA = [
 ]
 
 
+def _ngrams(text: str, n: int):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class StockSearchIndex:
+    """Inverted n-gram index over ``partNumber`` and ``description``.
+
+    Every 1-, 2- and 3-gram of both (lower-cased) fields maps to the set of
+    entries containing it. Queries of up to three characters are answered
+    straight from one posting set; longer queries intersect the postings of
+    their trigrams and confirm the survivors with a substring check, so the
+    results are identical to the linear scan in :func:`search_stock`.
+
+    Entries are keyed by insertion position, like the list the scan walks, so
+    items sharing a part number (or lacking one) are all kept; results keep
+    insertion order.
+    """
+
+    GRAM = 3
+
+    def __init__(self, data=None):
+        self._items = {}
+        self._fields = {}
+        self._grams = {}
+        self._by_part = {}
+        self._postings = {}
+        self._seq = 0
+        for item in data or []:
+            self.add(item)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, part_number):
+        return part_number in self._by_part
+
+    def _index_grams(self, fields):
+        return {
+            text[i:i + n]
+            for text in fields
+            for n in range(1, self.GRAM + 1)
+            for i in range(len(text) - n + 1)
+        }
+
+    def add(self, item):
+        """Index `item` after every existing entry and return its key."""
+        key = self._seq
+        self._seq += 1
+        self._index(key, item)
+        return key
+
+    def keys(self, part_number):
+        """Keys of the entries with `part_number`, oldest first."""
+        return sorted(self._by_part.get(part_number, ()))
+
+    def update(self, key, item):
+        """Re-index entry `key` with `item`; its position in results is preserved."""
+        if key not in self._items:
+            raise KeyError(key)
+        self._unindex(key)
+        self._index(key, item)
+
+    def remove(self, key):
+        """Drop entry `key` from the index. Returns False if it was not indexed."""
+        if key not in self._items:
+            return False
+        self._unindex(key)
+        return True
+
+    def _index(self, key, item):
+        part_number = item.get("partNumber", "")
+        fields = ((part_number or "").lower(), (item.get("description", "") or "").lower())
+        grams = self._index_grams(fields)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(key)
+        self._by_part.setdefault(part_number, set()).add(key)
+        self._items[key] = item
+        self._fields[key] = fields
+        self._grams[key] = grams
+
+    def _unindex(self, key):
+        for gram in self._grams.pop(key):
+            posting = self._postings[gram]
+            posting.discard(key)
+            if not posting:
+                del self._postings[gram]
+        part_number = self._items.pop(key).get("partNumber", "")
+        keys = self._by_part[part_number]
+        keys.discard(key)
+        if not keys:
+            del self._by_part[part_number]
+        del self._fields[key]
+
+    def search(self, query: str):
+        """Return indexed items whose part number or description contains `query`."""
+        q = (query or "").strip().lower()
+        if not q:
+            return []
+
+        if len(q) <= self.GRAM:
+            keys = self._postings.get(q, ())
+        else:
+            postings = []
+            for gram in _ngrams(q, self.GRAM):
+                posting = self._postings.get(gram)
+                if not posting:
+                    return []
+                postings.append(posting)
+            postings.sort(key=len)
+            candidates = postings[0].intersection(*postings[1:])
+            keys = [
+                k for k in candidates
+                if q in self._fields[k][0] or q in self._fields[k][1]
+            ]
+
+        return [self._items[k] for k in sorted(keys)]
+
+
+_default_index = None
+
+
+def get_default_index():
+    """Return the shared index over SAMPLE_DATA, building it on first use."""
+    global _default_index
+    if _default_index is None:
+        _default_index = StockSearchIndex(SAMPLE_DATA)
+    return _default_index
+
+
 def search_stock(query: str, data=None):
     """Return list of stock items matching `query` in part number or description.
 
     Matching is case-insensitive and will return any item where the query is
-    contained in the part number or description.
+    contained in the part number or description. Without `data` (or when
+    `data` is a :class:`StockSearchIndex`) the lookup is served by the index;
+    a plain list is scanned linearly.
     """
     if data is None:
-        data = SAMPLE_DATA
+        data = get_default_index()
+    if isinstance(data, StockSearchIndex):
+        return data.search(query)
 
     q = (query or "").strip()
     if not q:
@@ -0,0 +1,121 @@
+"""Point-in-time stock positions.
+
+Snapshots store the quantity of every non-empty (product, bin) pair as of a
+movement id: the snapshot's ``movement_id`` is the highest StockMovement id it
+includes. The position at any moment is rebuilt from the snapshot closest to
+it, plus the movements up to that moment that the snapshot does not include,
+minus the ones it includes that came later. A historical query therefore
+costs the activity around the gap rather than a replay of the whole ledger.
+
+Snapshots are built from the movement ledger (the previous snapshot plus the
+movements since), not from the stock items, so they stay consistent with the
+ledger however writes interleave with taking one: a movement is in a snapshot
+exactly when its id is, including rows the write-behind ledger inserts late.
+``taken_at`` is stamped after the read, so every movement a snapshot includes
+is timestamped no later than it.
+
+That needs movement ids to become visible in id order. On Postgres they do
+not: the sequence hands out ids at insert, and a transaction holding a lower
+id can commit after a higher one. Were the snapshot to read its high-water
+mark in between, the late row would fall below the mark, outside both the
+snapshot and every replay. :func:`take_snapshot` therefore locks
+``stock_movement`` in SHARE mode first, which waits for the transactions
+inserting movements to finish and holds new inserts back until the snapshot
+commits. SQLite has one writer at a time, so its ids already commit in order.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import func, text
+
+from db import db
+from models import StockMovement, StockSnapshot, StockSnapshotLine
+
+
+def take_snapshot():
+    """Record the quantity per (product, bin) up to the latest movement and return the snapshot."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(text(f'LOCK TABLE {StockMovement.__tablename__} IN SHARE MODE'))
+    previous = StockSnapshot.query.filter(StockSnapshot.movement_id.isnot(None))\
+        .order_by(StockSnapshot.movement_id.desc()).first()
+    high = db.session.query(func.max(StockMovement.id)).scalar() or 0
+
+    position = {}
+    low = 0
+    if previous is not None:
+        low = previous.movement_id
+        for line in StockSnapshotLine.query.filter_by(snapshot_id=previous.id):
+            position[(line.product_id, line.bin_id)] = line.quantity
+    for key, delta in _movement_deltas(StockMovement.id > low, StockMovement.id <= high).items():
+        position[key] = position.get(key, 0) + delta
+
+    snapshot = StockSnapshot(movement_id=high, taken_at=datetime.utcnow())
+    db.session.add(snapshot)
+    db.session.flush()
+    lines = [
+        {'snapshot_id': snapshot.id, 'product_id': product_id, 'bin_id': bin_id, 'quantity': qty}
+        for (product_id, bin_id), qty in position.items() if qty
+    ]
+    if lines:
+        db.session.execute(StockSnapshotLine.__table__.insert(), lines)
+    db.session.commit()
+    return snapshot
+
+
+def _movement_deltas(*conditions, product_id=None, bin_id=None):
+    """Net quantity change per (product, bin) from the movements matching `conditions`."""
+    deltas = {}
+    for bin_column, sign in ((StockMovement.to_bin_id, 1), (StockMovement.from_bin_id, -1)):
+        query = db.session.query(StockMovement.product_id, bin_column, func.sum(StockMovement.quantity))\
+            .filter(bin_column.isnot(None), *conditions)
+        if product_id is not None:
+            query = query.filter(StockMovement.product_id == product_id)
+        if bin_id is not None:
+            query = query.filter(bin_column == bin_id)
+        for pid, bid, qty in query.group_by(StockMovement.product_id, bin_column):
+            deltas[(pid, bid)] = deltas.get((pid, bid), 0) + sign * qty
+    return deltas
+
+
+def stock_as_of(ts, product_id=None, bin_id=None):
+    """Return ``(snapshot, {(product_id, bin_id): quantity})`` as it stood at `ts`.
+
+    `snapshot` is the one the position was derived from, or None when it was
+    replayed from the start of the ledger.
+    """
+    snapshots = StockSnapshot.query.filter(StockSnapshot.movement_id.isnot(None))
+    before = snapshots.filter(StockSnapshot.taken_at <= ts)\
+        .order_by(StockSnapshot.taken_at.desc()).first()
+    after = snapshots.filter(StockSnapshot.taken_at > ts)\
+        .order_by(StockSnapshot.taken_at.asc()).first()
+
+    # walk back from a later snapshot when it is closer than the earlier one
+    if after and (before is None or after.taken_at - ts < ts - before.taken_at):
+        snapshot = after
+    else:
+        snapshot = before
+
+    position = {}
+    if snapshot is None:
+        deltas = [(_movement_deltas(StockMovement.timestamp <= ts, product_id=product_id, bin_id=bin_id), 1)]
+    else:
+        lines = StockSnapshotLine.query.filter_by(snapshot_id=snapshot.id)
+        if product_id is not None:
+            lines = lines.filter_by(product_id=product_id)
+        if bin_id is not None:
+            lines = lines.filter_by(bin_id=bin_id)
+        for line in lines:
+            position[(line.product_id, line.bin_id)] = line.quantity
+        high = snapshot.movement_id
+        # not in the snapshot but done by `ts`
+        deltas = [(_movement_deltas(StockMovement.id > high, StockMovement.timestamp <= ts,
+                                    product_id=product_id, bin_id=bin_id), 1)]
+        if snapshot.taken_at > ts:
+            # in the snapshot but done after `ts` (walking forward there are
+            # none: they are all timestamped no later than the snapshot)
+            deltas.append((_movement_deltas(StockMovement.id <= high, StockMovement.timestamp > ts,
+                                            product_id=product_id, bin_id=bin_id), -1))
+    for changes, sign in deltas:
+        for key, delta in changes.items():
+            position[key] = position.get(key, 0) + sign * delta
+    return snapshot, {key: qty for key, qty in position.items() if qty}
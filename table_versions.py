@@ -0,0 +1,168 @@
+"""Per-table version counters for conditional list and report responses.
+
+Every transaction that writes to a tracked table (through the ORM or through
+``session.execute`` of an insert/update/delete, as the atomic stock updates
+and bulk imports do) bumps that table's version once, just before it commits,
+so the version changes exactly when the data does and is shared by every
+worker process.
+
+A table's version is the sum of ``shards`` counter rows, and a transaction
+bumps one of them at random. Bumping a single row would make every writer to
+a table wait on that row's lock until the previous writer commits, which
+serialises them on Postgres; with the counter split, concurrent writers
+rarely pick the same row. The sum still goes up by exactly one per commit.
+
+:meth:`TableVersions.cached` turns the versions of the tables a view reads
+into an ``ETag``: a matching ``If-None-Match`` gets a 304 without running the
+view, and the serialised body is kept per (endpoint, query string) until one
+of its tables moves on.
+"""
+
+import random
+from functools import wraps
+from itertools import chain
+
+from flask import current_app, make_response, request
+from sqlalchemy import event, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from resolvers import LRUCache
+
+# response headers that are part of a cached list response
+CACHED_HEADERS = ('X-Next-Cursor',)
+
+DEFAULT_SHARDS = 16
+
+
+class TableVersions:
+    def __init__(self, model, tables, cache_size=256, shards=DEFAULT_SHARDS):
+        self.model = model
+        self.table = model.__table__
+        self.tables = frozenset(tables)
+        self.shards = shards
+        self.bodies = LRUCache(cache_size)
+        self._commit_listeners = []
+
+    def init_app(self, app, database):
+        self.db = database
+        self.bodies.maxsize = app.config.get('RESPONSE_CACHE_SIZE', self.bodies.maxsize)
+        self.shards = app.config.get('TABLE_VERSION_SHARDS', self.shards)
+        event.listen(database.session, 'after_flush', self._after_flush)
+        event.listen(database.session, 'do_orm_execute', self._on_execute)
+        event.listen(database.session, 'before_commit', self._before_commit)
+        event.listen(database.session, 'after_commit', self._after_commit)
+        event.listen(database.session, 'after_rollback', self._discard)
+
+    def on_commit(self, fn):
+        """Call ``fn(session, versions)`` after each commit that bumped versions.
+
+        `versions` maps each table the transaction wrote to its version as the
+        transaction saw it, its own bump included; one more than the version
+        last seen means no other writer committed to that table in between,
+        except possibly one committing at the same moment, whose bump then
+        shows up as a version ahead of the one reported.
+        """
+        self._commit_listeners.append(fn)
+        return fn
+
+    # Change tracking
+
+    def _touch(self, session, name):
+        if name in self.tables:
+            session.info.setdefault('table_versions', set()).add(name)
+
+    def _after_flush(self, session, flush_context):
+        for obj in chain(session.new, session.dirty, session.deleted):
+            table = getattr(obj, '__table__', None)
+            if table is not None and (obj not in session.dirty or session.is_modified(obj)):
+                self._touch(session, table.name)
+
+    def _on_execute(self, state):
+        if state.is_insert or state.is_update or state.is_delete:
+            table = getattr(state.statement, 'table', None)
+            if table is not None:
+                self._touch(state.session, table.name)
+
+    def _before_commit(self, session):
+        # flush first so changes still pending in the identity map are seen
+        session.flush()
+        touched = session.info.pop('table_versions', None)
+        if not touched:
+            return
+        # fixed order so two writers never wait on each other's version rows
+        for name in sorted(touched):
+            self._bump(session, name, random.randrange(self.shards))
+        if self._commit_listeners:
+            session.info['table_versions_committed'] = dict(session.execute(
+                select(self.table.c.name, func.sum(self.table.c.version))
+                .where(self.table.c.name.in_(touched))
+                .group_by(self.table.c.name)
+            ).all())
+
+    def _bump(self, session, name, shard):
+        t = self.table
+        dialect = session.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            # an upsert, so two writers creating the same shard row cannot collide
+            insert = sqlite_insert if dialect == 'sqlite' else pg_insert
+            session.execute(insert(t).values(name=name, shard=shard, version=1).on_conflict_do_update(
+                index_elements=[t.c.name, t.c.shard],
+                set_={'version': t.c.version + 1},
+            ))
+            return
+        result = session.execute(
+            t.update().where(t.c.name == name, t.c.shard == shard).values(version=t.c.version + 1)
+        )
+        if result.rowcount == 0:
+            session.execute(t.insert().values(name=name, shard=shard, version=1))
+
+    def _after_commit(self, session):
+        session.info.pop('table_versions', None)
+        committed = session.info.pop('table_versions_committed', None)
+        if committed:
+            for fn in self._commit_listeners:
+                fn(session, committed)
+
+    def _discard(self, session):
+        session.info.pop('table_versions', None)
+        session.info.pop('table_versions_committed', None)
+
+    # Reading
+
+    def current(self, tables):
+        """Return the versions of `tables` as a tuple (0 for a table never written)."""
+        rows = dict(
+            self.db.session.query(self.table.c.name, func.sum(self.table.c.version))
+            .filter(self.table.c.name.in_(tables))
+            .group_by(self.table.c.name)
+        )
+        return tuple(rows.get(name, 0) for name in tables)
+
+    def cached(self, *tables):
+        """Serve the wrapped view conditionally on the versions of `tables`."""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                versions = self.current(tables)
+                etag = 'v' + '-'.join(str(v) for v in versions)
+                if request.if_none_match.contains(etag):
+                    response = current_app.response_class(status=304)
+                    response.set_etag(etag)
+                    return response
+
+                key = (request.endpoint, request.query_string)
+                entry = self.bodies.get(key)
+                if entry is not None and entry[0] == versions:
+                    _, body, mimetype, headers = entry
+                    response = current_app.response_class(body, mimetype=mimetype, headers=headers)
+                else:
+                    response = make_response(fn(*args, **kwargs))
+                    if response.status_code != 200 or response.is_streamed:
+                        return response
+                    headers = {h: response.headers[h] for h in CACHED_HEADERS if h in response.headers}
+                    self.bodies.put(key, (versions, response.get_data(), response.mimetype, headers))
+                response.set_etag(etag)
+                return response
+            return wrapper
+        return decorator
@@ -0,0 +1,141 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def stock_db_path(tmp_path_factory):
+    return str(tmp_path_factory.mktemp('stock') / 'stock.db')
+
+
+@pytest.fixture(scope='session')
+def stock_module(stock_db_path):
+    """The single-module app in stock.py, on a SQLite file of its own.
+
+    stock.py configures itself from the environment at import time, so it is
+    imported once per test session.
+    """
+    os.environ['DATABASE_URL'] = f'sqlite:///{stock_db_path}'
+    os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+    import stock
+    stock.app.config['TESTING'] = True
+    return stock
+
+
+@pytest.fixture
+def stock_client(stock_module, stock_db_path):
+    """A test client on a freshly initialised stock.py database."""
+    stock = stock_module
+    with stock.app.app_context():
+        stock.db.session.remove()
+        stock.db.engine.dispose()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(stock_db_path + suffix):
+            os.remove(stock_db_path + suffix)
+    # in-process caches keyed by table versions, which restart with the file
+    stock.table_versions.bodies.invalidate()
+    stock.putaway_index._seen = None
+    stock.token_cache.invalidate()
+    client = stock.app.test_client()
+    assert client.post('/api/init-db').status_code == 200
+    return client
+
+
+@pytest.fixture
+def stock_headers(stock_module, stock_client):
+    """Authorization header for the seeded admin user."""
+    stock = stock_module
+    with stock.app.app_context():
+        user = stock.User.query.filter_by(username='admin').one()
+        token = jwt.encode({'user_id': user.id, 'exp': datetime.utcnow() + timedelta(hours=1)},
+                           stock.app.config['SECRET_KEY'], algorithm='HS256')
+    return {'Authorization': f'Bearer {token}'}
+
+
+@pytest.fixture
+def statements(stock_module, stock_client):
+    """List that collects the SQL statements stock.py runs during the test."""
+    stock = stock_module
+    seen = []
+
+    def record(conn, cursor, statement, *args):
+        seen.append(statement)
+
+    with stock.app.app_context():
+        engine = stock.db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield seen
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+@pytest.fixture(scope='session')
+def wms_db_path(tmp_path_factory):
+    return str(tmp_path_factory.mktemp('wms') / 'wms.db')
+
+
+@pytest.fixture(scope='session')
+def wms_app(wms_db_path):
+    """The blueprint app from app.py, on a SQLite file of its own.
+
+    The blueprints and their caches are module-level singletons, so the app
+    is created once per test session.
+    """
+    os.environ['DATABASE_URL'] = f'sqlite:///{wms_db_path}'
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    # tokens carry a dict identity, which newer PyJWT rejects as a subject
+    app.config['JWT_VERIFY_SUB'] = False
+    return app
+
+
+@pytest.fixture
+def wms_client(wms_app, wms_db_path):
+    """A test client on a freshly initialised blueprint-app database."""
+    from db import db
+    from auth import token_cache
+    from models import bin_resolver, product_resolver, table_versions
+    with wms_app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(wms_db_path + suffix):
+            os.remove(wms_db_path + suffix)
+    table_versions.bodies.invalidate()
+    token_cache.invalidate()
+    product_resolver.invalidate()
+    bin_resolver.invalidate()
+    client = wms_app.test_client()
+    assert client.post('/api/init-db').status_code == 200
+    return client
+
+
+@pytest.fixture
+def wms_headers(wms_app, wms_client):
+    """Authorization header for the seeded admin user."""
+    from flask_jwt_extended import create_access_token
+    from models import User
+    with wms_app.app_context():
+        user = User.query.filter_by(username='admin').one()
+        token = create_access_token(identity={'id': user.id, 'username': user.username, 'role': user.role})
+    return {'Authorization': f'Bearer {token}'}
+
+
+@pytest.fixture
+def wms_employee_headers(wms_app, wms_client):
+    """Authorization header for an employee, the least privileged role."""
+    from flask_jwt_extended import create_access_token
+    from db import db
+    from models import User
+    with wms_app.app_context():
+        user = User(username='picker', password_hash='-', role='employee')
+        db.session.add(user)
+        db.session.commit()
+        token = create_access_token(identity={'id': user.id, 'username': user.username, 'role': user.role})
+    return {'Authorization': f'Bearer {token}'}
@@ -0,0 +1,54 @@
+def test_bearer_tokens_are_cached(wms_app, wms_client, wms_headers):
+    from auth import token_cache
+
+    assert wms_client.get('/api/auth/cache-stats', headers=wms_headers).status_code == 200
+    assert token_cache.get(wms_headers['Authorization'][7:]) is not None
+
+
+def test_tokens_from_other_locations_are_verified_but_not_cached(wms_app, wms_client, wms_headers, monkeypatch):
+    from auth import token_cache
+
+    monkeypatch.setitem(wms_app.config, 'JWT_TOKEN_LOCATION', ['headers', 'query_string'])
+    token = wms_headers['Authorization'][7:]
+    response = wms_client.get('/api/auth/cache-stats', query_string={'jwt': token})
+    assert response.status_code == 200, response.json
+    assert token_cache.stats()['size'] == 0
+
+    assert wms_client.get('/api/auth/cache-stats', query_string={'jwt': 'bad'}).status_code in (401, 422)
+
+
+def test_login_upgrades_an_outdated_hash(wms_app, wms_client, monkeypatch):
+    from auth import password_hasher
+    from models import User
+    from password_hashing import WerkzeugScheme
+
+    with wms_app.app_context():
+        old_hash = User.query.filter_by(username='admin').one().password_hash
+    monkeypatch.setattr(password_hasher, 'scheme', WerkzeugScheme('pbkdf2:sha256:1000'))
+
+    response = wms_client.post('/api/auth/login', json={'username': 'admin', 'password': 'adminpass'})
+    assert response.status_code == 200
+    assert response.json['role'] == 'admin'
+    with wms_app.app_context():
+        new_hash = User.query.filter_by(username='admin').one().password_hash
+    assert new_hash != old_hash and new_hash.startswith('pbkdf2:sha256:1000$')
+
+    assert wms_client.post('/api/auth/login', json={'username': 'admin', 'password': 'adminpass'}).status_code == 200
+    assert wms_client.post('/api/auth/login', json={'username': 'admin', 'password': 'wrong'}).status_code == 401
+
+
+def test_stock_login_reads_the_user_once_and_upgrades_the_hash(stock_module, stock_client, statements, monkeypatch):
+    stock = stock_module
+    with stock.app.app_context():
+        old_hash = stock.User.query.filter_by(username='admin').one().password_hash
+    monkeypatch.setattr(stock.password_hasher.scheme, 'rounds', stock.password_hasher.scheme.rounds + 1)
+    statements.clear()
+
+    response = stock_client.post('/api/auth/login', json={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 200
+    assert response.json['user']['username'] == 'admin'
+    assert response.json['user']['role'] == 'admin'
+    # no reload of the expired user after the rollback
+    assert len([s for s in statements if s.lstrip().upper().startswith('SELECT') and 'FROM user' in s]) == 1
+    with stock.app.app_context():
+        assert stock.User.query.filter_by(username='admin').one().password_hash != old_hash
@@ -0,0 +1,97 @@
+"""Movement rollup behind the cycle-count schedule in stock.py."""
+
+from datetime import datetime, timedelta
+
+
+def _move(stock, when, quantity=1):
+    product = stock.Product.query.filter_by(part_number='BMG-12345').one()
+    user = stock.User.query.filter_by(username='admin').one()
+    stock.db.session.add(stock.StockMovement(product_id=product.id, quantity=quantity, movement_type='receive',
+                                             user_id=user.id, movement_date=when))
+    stock.db.session.commit()
+
+
+def _rolled_up(stock):
+    return stock.db.session.query(stock.db.func.sum(stock.MovementRollup.movements)).scalar() or 0
+
+
+def test_refresh_picks_up_late_and_back_dated_movements(stock_module, stock_client):
+    stock = stock_module
+    now = datetime.utcnow()
+    with stock.app.app_context():
+        _move(stock, now)
+        stock.cycle_counts.refresh_rollup()
+        assert _rolled_up(stock) == 1
+
+        # dated inside the re-rolled lag, then long before it
+        _move(stock, now - timedelta(days=stock.cycle_counts.lag - 1))
+        _move(stock, now - timedelta(days=stock.cycle_counts.lag + 30))
+        stock.cycle_counts.refresh_rollup()
+        assert _rolled_up(stock) == 2
+        stock.cycle_counts.refresh_rollup()
+        assert _rolled_up(stock) == 2
+
+        stock.cycle_counts.refresh_rollup(full=True)
+        assert _rolled_up(stock) == 3
+
+
+def test_schedule_endpoint_does_not_write_the_rollup(stock_module, stock_client, stock_headers):
+    stock = stock_module
+    with stock.app.app_context():
+        _move(stock, datetime.utcnow())
+    response = stock_client.get('/api/cycle-count/schedule', headers=stock_headers)
+    assert response.status_code == 200, response.json
+    with stock.app.app_context():
+        assert _rolled_up(stock) == 0
+
+
+def _stocked(stock, *part_numbers):
+    ids = []
+    for part_number in part_numbers:
+        product = stock.Product.query.filter_by(part_number=part_number).one()
+        stock.db.session.add(stock.ProductStockTotal(product_id=product.id, quantity=5))
+        ids.append(product.id)
+    stock.db.session.commit()
+    return ids
+
+
+def test_equal_movers_are_not_all_class_c(stock_module, stock_client):
+    stock = stock_module
+    today = datetime.utcnow().date()
+    with stock.app.app_context():
+        only, = _stocked(stock, 'BMG-12345')
+        stock.db.session.add(stock.MovementRollup(product_id=only, day=today, quantity=3, movements=1))
+        stock.db.session.commit()
+        classes = stock.cycle_counts.classify(today)
+    # the warehouse's one active product
+    assert list(classes['abc']) == [0]
+
+    with stock.app.app_context():
+        other, = _stocked(stock, 'BMG-67890')
+        stock.db.session.add(stock.MovementRollup(product_id=other, day=today, quantity=3, movements=1))
+        stock.db.session.commit()
+        classes = stock.cycle_counts.classify(today)
+    # two equal movers: half the score ranks above the second, still under the A cut-off
+    assert list(classes['abc']) == [0, 0]
+
+    with stock.app.app_context():
+        stock.db.session.query(stock.MovementRollup).delete()
+        stock.db.session.commit()
+        classes = stock.cycle_counts.classify(today)
+    # nothing moved: nothing outranks anything else
+    assert list(classes['abc']) == [2, 2]
+
+
+def test_last_counted_is_a_day_ordinal(stock_module, stock_client):
+    stock = stock_module
+    counted_at = datetime(2026, 3, 14, 17, 30)
+    with stock.app.app_context():
+        counted, never = _stocked(stock, 'BMG-12345', 'BMG-67890')
+        stock.db.session.add(stock.Stocktake(
+            product_id=counted, bin_location_id=stock.BinLocation.query.first().id, expected_quantity=5,
+            counted_quantity=5, variance=0, user_id=stock.User.query.first().id, stocktake_date=counted_at,
+        ))
+        stock.db.session.commit()
+        classes = stock.cycle_counts.classify(counted_at.date())
+    last = dict(zip(classes['product_id'], classes['last_counted']))
+    assert (last[counted], last[never]) == (counted_at.date().toordinal(), -1)
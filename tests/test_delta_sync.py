@@ -0,0 +1,118 @@
+"""Delta sync for offline scanners (blueprint app)."""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from delta_sync import SYNC_OVERLAP
+from list_query import decode_cursor, encode_cursor
+
+LONG_AGO = datetime(2020, 1, 1)
+
+
+def _sync(client, headers, cursor=None, limit=None):
+    params = {}
+    if cursor:
+        params['cursor'] = cursor
+    if limit:
+        params['limit'] = limit
+    response = client.get('/api/sync', query_string=params, headers=headers)
+    assert response.status_code == 200, response.json
+    return response.json
+
+
+def _age_everything(wms_app):
+    from db import db
+    from models import BinLocation, Product, StockItem
+    with wms_app.app_context():
+        for model in (Product, BinLocation, StockItem):
+            db.session.execute(model.__table__.update().values(updated_at=LONG_AGO))
+        db.session.commit()
+
+
+def test_full_download_pages_over_every_row_once(wms_app, wms_client, wms_headers):
+    from db import db
+    from models import Product
+    with wms_app.app_context():
+        db.session.add_all(Product(part_number=f'SYNC-{i}') for i in range(7))
+        db.session.commit()
+
+    seen = {'products': [], 'bins': [], 'items': []}
+    cursor, pages = None, 0
+    while True:
+        page = _sync(wms_client, wms_headers, cursor, limit=3)
+        pages += 1
+        for name in seen:
+            seen[name].extend(row[0] for row in page[name]['rows'])
+        cursor = page['cursor']
+        if not page['more']:
+            break
+    assert page['products']['fields'] == ['id', 'part_number', 'description']
+    assert sorted(seen['products']) == list(range(1, 9))  # the seeded product and the seven
+    assert len(seen['bins']) == 1
+    assert pages == 3
+    assert set(decode_cursor(cursor)) == {'since'}
+
+
+def test_rows_stamped_within_the_overlap_are_sent_again(wms_app, wms_client, wms_headers):
+    from db import db
+    from models import Product
+    _age_everything(wms_app)
+    cursor = _sync(wms_client, wms_headers)['cursor']
+    since = datetime.fromisoformat(decode_cursor(cursor)['since'])
+
+    with wms_app.app_context():
+        db.session.add_all([Product(part_number='LATE-1'), Product(part_number='OLD-1')])
+        db.session.flush()
+        # stamped before the cursor but committed after it, and far before it
+        db.session.execute(Product.__table__.update().where(Product.part_number == 'LATE-1')
+                           .values(updated_at=since - SYNC_OVERLAP / 2))
+        db.session.execute(Product.__table__.update().where(Product.part_number == 'OLD-1')
+                           .values(updated_at=since - SYNC_OVERLAP * 2))
+        db.session.commit()
+
+    page = _sync(wms_client, wms_headers, cursor)
+    assert [row[1] for row in page['products']['rows']] == ['LATE-1']
+    assert page['bins']['rows'] == [] and page['items']['rows'] == []
+
+
+def test_deleted_rows_leave_tombstones(wms_app, wms_client, wms_headers):
+    from db import db
+    from models import BinLocation
+    with wms_app.app_context():
+        db.session.add(BinLocation(code='GONE-1'))
+        db.session.commit()
+    _age_everything(wms_app)
+    cursor = _sync(wms_client, wms_headers)['cursor']
+
+    with wms_app.app_context():
+        gone = BinLocation.query.filter_by(code='GONE-1').one()
+        gone_id = gone.id
+        db.session.delete(gone)
+        db.session.commit()
+
+    page = _sync(wms_client, wms_headers, cursor)
+    assert page['deleted'] == [['bins', gone_id]]
+    # a full download has nothing to delete
+    assert _sync(wms_client, wms_headers)['deleted'] == []
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64 json',
+    encode_cursor(['since']),
+    encode_cursor({'since': 12}),
+    encode_cursor({'since': 'yesterday'}),
+    encode_cursor({'until': datetime.utcnow().isoformat(), 'stage': 'x'}),
+    encode_cursor({'until': datetime.utcnow().isoformat(), 'stage': 0, 'after': ['2020-01-01T00:00:00']}),
+    encode_cursor({'until': datetime.utcnow().isoformat(), 'stage': 0, 'after': ['2020-01-01T00:00:00', {}]}),
+    encode_cursor({'until': datetime.utcnow().isoformat(), 'stage': 0, 'after': [1, 2]}),
+])
+def test_malformed_cursor_is_a_400(wms_app, wms_client, wms_headers, cursor):
+    response = wms_client.get('/api/sync', query_string={'cursor': cursor}, headers=wms_headers)
+    assert response.status_code == 400
+    assert response.json == {'error': 'invalid cursor'}
+
+
+def test_limit_must_be_an_integer(wms_app, wms_client, wms_headers):
+    response = wms_client.get('/api/sync', query_string={'limit': 'all'}, headers=wms_headers)
+    assert response.status_code == 400
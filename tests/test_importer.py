@@ -0,0 +1,87 @@
+"""CSV import of products, bins and opening stock into the blueprint app."""
+
+import io
+from datetime import date
+
+
+def _import(client, headers, kind, text, multipart=False):
+    if multipart:
+        return client.post(f'/api/import/{kind}', headers=headers, content_type='multipart/form-data',
+                           data={'file': (io.BytesIO(text.encode()), f'{kind}.csv')})
+    return client.post(f'/api/import/{kind}', headers=headers, data=text.encode(), content_type='text/csv')
+
+
+def test_products_insert_new_and_reject_existing(wms_app, wms_client, wms_headers):
+    from models import Product
+
+    response = _import(wms_client, wms_headers, 'products', (
+        'part_number,description\n'
+        'NEW-001,First\n'
+        'BMG-12345,Already there\n'
+        'NEW-001,Again\n'
+        ',No part number\n'
+        'NEW-002,Second\n'
+    ))
+    assert response.status_code == 200, response.json
+    assert response.json == {'inserted': 2, 'merged': 0, 'failed': 3, 'errors': [
+        {'line': 3, 'error': 'part_number exists'},
+        {'line': 4, 'error': 'duplicate part_number in file'},
+        {'line': 5, 'error': 'part_number required'},
+    ]}
+    with wms_app.app_context():
+        assert Product.query.filter_by(part_number='NEW-002').one().description == 'Second'
+        assert Product.query.filter_by(part_number='BMG-12345').one().description == 'Ball Bearing 6305-2RS'
+
+
+def test_bins_insert_new_and_reject_existing(wms_app, wms_client, wms_headers):
+    response = _import(wms_client, wms_headers, 'bins', (
+        'code,capacity\n'
+        'Z-01-01,40\n'
+        'A-12-04,10\n'
+        'Z-01-02,lots\n'
+        'Z-01-03,\n'
+    ), multipart=True)
+    assert response.status_code == 200, response.json
+    assert (response.json['inserted'], response.json['failed']) == (2, 2)
+    assert response.json['errors'] == [{'line': 3, 'error': 'code exists'}, {'line': 4, 'error': 'invalid capacity'}]
+
+
+def test_stock_inserts_new_lots_and_merges_into_existing_ones(wms_app, wms_client, wms_headers):
+    from models import BinLocation, StockItem, StockMovement
+
+    response = wms_client.post('/api/stock/receive', headers=wms_headers,
+                               json={'part_number': 'BMG-12345', 'bin_code': 'A-12-04', 'quantity': 5, 'batch': 'L1'})
+    assert response.status_code == 200, response.json
+
+    response = _import(wms_client, wms_headers, 'stock', (
+        'part_number,bin_code,quantity,batch,expiry_date\n'
+        'BMG-12345,A-12-04,3,L1,\n'
+        'BMG-12345,A-12-04,7,L2,2031-01-31\n'
+        'BMG-12345,A-12-04,1,L2,\n'
+        'NOPE-1,A-12-04,1,,\n'
+        'BMG-12345,Z-99-99,1,,\n'
+        'BMG-12345,A-12-04,0,L3,\n'
+        'BMG-12345,A-12-04,2,L4,31/01/2031\n'
+    ))
+    assert response.status_code == 200, response.json
+    assert (response.json['inserted'], response.json['merged'], response.json['failed']) == (1, 1, 5)
+    assert response.json['errors'] == [
+        {'line': 4, 'error': 'duplicate stock line in file'},
+        {'line': 5, 'error': 'product not found'},
+        {'line': 6, 'error': 'bin not found'},
+        {'line': 7, 'error': 'quantity must be positive'},
+        {'line': 8, 'error': 'invalid expiry_date, expected YYYY-MM-DD'},
+    ]
+
+    with wms_app.app_context():
+        lots = StockItem.query.join(BinLocation).with_entities(StockItem.batch, StockItem.quantity, StockItem.expiry_date)\
+            .order_by(StockItem.batch).all()
+        assert [tuple(lot) for lot in lots] == [('L1', 8, None), ('L2', 7, date(2031, 1, 31))]
+        imported = StockMovement.query.filter_by(reason='import').order_by(StockMovement.batch).all()
+        assert [(m.batch, m.quantity) for m in imported] == [('L1', 3), ('L2', 7)]
+
+
+def test_import_needs_a_manager(wms_app, wms_client, wms_employee_headers):
+    response = _import(wms_client, wms_employee_headers, 'products', 'part_number\nX-1\n')
+    assert response.status_code == 403
+    assert _import(wms_client, {}, 'products', 'part_number\nX-1\n').status_code == 401
@@ -0,0 +1,67 @@
+"""Keyset-paged list endpoints (blueprint app)."""
+
+import pytest
+
+
+def _pages(client, path, **params):
+    rows, cursor = [], None
+    while True:
+        query = dict(params, **({'cursor': cursor} if cursor else {}))
+        response = client.get(path, query_string=query)
+        assert response.status_code == 200, response.json
+        rows.extend(response.json)
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return rows
+
+
+@pytest.fixture
+def products(wms_app, wms_client):
+    from db import db
+    from models import Product
+    with wms_app.app_context():
+        # few distinct descriptions, so pages split runs of equal sort keys
+        db.session.add_all(Product(part_number=f'LQ-{i:03d}', description=[None, 'b', 'a'][i % 3])
+                           for i in range(40))
+        db.session.commit()
+        return sorted(p.id for p in Product.query)
+
+
+@pytest.mark.parametrize('sort', ['id', '-id', 'part_number', 'description', '-description'])
+def test_paging_visits_every_row_once_in_order(wms_client, products, sort):
+    rows = _pages(wms_client, '/api/products', sort=sort, limit=7)
+    assert sorted(r['id'] for r in rows) == products
+
+    key = sort.lstrip('-')
+    keys = [((r[key] or '') if key == 'description' else r[key], r['id']) for r in rows]
+    assert keys == sorted(keys, reverse=sort.startswith('-'))
+
+
+def test_fields_and_filters_narrow_the_rows(wms_client, products):
+    response = wms_client.get('/api/products', query_string={'fields': 'part_number', 'part_number': 'LQ-01'})
+    assert response.status_code == 200
+    assert response.json == [{'part_number': f'LQ-{i:03d}'} for i in range(10, 20)]
+
+
+@pytest.mark.parametrize('params, error', [
+    ({'sort': 'created_at'}, 'sort must be one of: id, part_number, description'),
+    ({'sort': '-password'}, 'sort must be one of: id, part_number, description'),
+    ({'fields': 'id,created_at'}, 'unknown field(s): created_at'),
+    ({'created_at': '2020-01-01'}, 'unknown filter(s): created_at'),
+    ({'description': 'a', 'zone': 'A'}, 'unknown filter(s): description, zone'),
+])
+def test_only_allow_listed_sorts_fields_and_filters(wms_client, products, params, error):
+    response = wms_client.get('/api/products', query_string=params)
+    assert response.status_code == 400
+    assert response.json == {'error': error}
+
+
+def test_bad_filter_values_and_cursors_are_rejected(wms_client, products):
+    response = wms_client.get('/api/stock/items', query_string={'min_quantity': 'many'})
+    assert response.json == {'error': 'min_quantity must be an integer'}
+
+    first = wms_client.get('/api/products', query_string={'sort': 'id', 'limit': 1})
+    cursor = first.headers['X-Next-Cursor']
+    response = wms_client.get('/api/products', query_string={'sort': 'part_number', 'cursor': cursor})
+    assert response.status_code == 400
+    assert response.json == {'error': 'cursor does not match this sort'}
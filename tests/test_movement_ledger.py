@@ -0,0 +1,91 @@
+import logging
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+from movement_ledger import MovementLedger
+
+
+@pytest.fixture
+def ledger_app(tmp_path):
+    """A throwaway app with a movement table and a ledger in 'wait' mode."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "ledger.db"}'
+    app.config['MOVEMENT_LEDGER'] = 'wait'
+    app.config['MOVEMENT_LEDGER_WAIT_MS'] = 300
+    database = SQLAlchemy(app)
+
+    class Movement(database.Model):
+        id = database.Column(database.Integer, primary_key=True)
+        quantity = database.Column(database.Integer, nullable=False)
+
+    ledger = MovementLedger(Movement)
+    ledger.init_app(app, database)
+    with app.app_context():
+        database.create_all()
+    yield app, database, Movement, ledger
+    ledger.drain()
+
+
+def _commit_movement(app, database, Movement, ledger, quantity):
+    with app.app_context():
+        ledger.add(database.session, Movement(quantity=quantity))
+        database.session.commit()
+
+
+def _quantities(app, database, Movement):
+    with app.app_context():
+        return sorted(q for (q,) in database.session.query(Movement.quantity))
+
+
+def test_wait_mode_writes_before_commit_returns(ledger_app):
+    app, database, Movement, ledger = ledger_app
+    _commit_movement(*ledger_app, 1)
+    _commit_movement(*ledger_app, 2)
+    assert _quantities(app, database, Movement) == [1, 2]
+
+
+def test_rolled_back_movements_are_discarded(ledger_app):
+    app, database, Movement, ledger = ledger_app
+    with app.app_context():
+        database.session.query(Movement).count()  # as a request would, before writing
+        ledger.add(database.session, Movement(quantity=1))
+        database.session.rollback()
+        database.session.commit()
+    ledger.drain()
+    assert _quantities(app, database, Movement) == []
+
+
+def test_failed_write_does_not_fail_the_request_and_is_retried(ledger_app, caplog):
+    app, database, Movement, ledger = ledger_app
+    with app.app_context():
+        Movement.__table__.drop(database.engine)
+
+    with caplog.at_level(logging.WARNING, logger='movement_ledger'):
+        _commit_movement(*ledger_app, 7)  # must neither raise nor hang
+    assert 'not yet written' in caplog.text
+
+    with app.app_context():
+        Movement.__table__.create(database.engine)
+    ledger.drain()
+    assert _quantities(app, database, Movement) == [7]
+
+
+def test_writer_restarts_after_drain(ledger_app):
+    app, database, Movement, ledger = ledger_app
+    _commit_movement(*ledger_app, 1)
+    ledger.drain()
+    _commit_movement(*ledger_app, 2)
+    assert _quantities(app, database, Movement) == [1, 2]
+
+
+def test_forked_child_gets_its_own_writer(ledger_app):
+    app, database, Movement, ledger = ledger_app
+    _commit_movement(*ledger_app, 1)
+    parent_thread = ledger._thread
+    ledger._reset()  # what os.register_at_fork runs in the child
+    assert ledger._thread is None and ledger._conn is None
+    _commit_movement(*ledger_app, 2)
+    assert ledger._thread is not parent_thread and ledger._thread.is_alive()
+    assert _quantities(app, database, Movement) == [1, 2]
@@ -0,0 +1,51 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def _seed_movements(stock, count):
+    with stock.app.app_context():
+        user = stock.User.query.filter_by(username='admin').one()
+        product = stock.Product.query.first()
+        start = datetime(2024, 1, 1)
+        for i in range(count):
+            # pairs share a timestamp so the id tie-break is exercised
+            stock.db.session.add(stock.StockMovement(
+                product_id=product.id, quantity=i + 1, movement_type='adjustment',
+                user_id=user.id, movement_date=start + timedelta(minutes=i // 2),
+            ))
+        stock.db.session.commit()
+
+
+def test_movement_report_pages_cover_every_movement_once(stock_module, stock_client, stock_headers):
+    _seed_movements(stock_module, 25)
+    seen, cursor = [], None
+    while True:
+        response = stock_client.get('/api/reports/movements', headers=stock_headers,
+                                    query_string={'limit': 4, 'cursor': cursor or ''})
+        assert response.status_code == 200
+        seen.extend(row['id'] for row in response.json)
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen)) == 25
+
+
+def _cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+@pytest.mark.parametrize('cursor', [
+    _cursor(['not a date', 'id']),
+    _cursor([12, 'id']),
+    _cursor(['2024-01-01T00:00:00']),
+    _cursor(['2024-01-01T00:00:00', 7]),
+    _cursor({'date': '2024-01-01'}),
+])
+def test_movement_report_rejects_malformed_cursor(stock_module, stock_client, stock_headers, cursor):
+    _seed_movements(stock_module, 3)
+    response = stock_client.get('/api/reports/movements', headers=stock_headers, query_string={'cursor': cursor})
+    assert response.status_code == 400
+    assert response.json == {'message': 'Invalid cursor!'}
@@ -0,0 +1,59 @@
+"""Pick route planning."""
+
+import random
+import time
+
+import numpy as np
+import pytest
+
+from pick_route import Layout, plan, two_opt, walk_length
+
+ZONES = 'ABCD'
+LAYOUT = Layout(ZONES, aisles_per_zone=20, shelves_per_aisle=40)
+BINS = [(z, a, s) for z in ZONES for a in range(1, 21) for s in range(1, 41)]
+
+
+@pytest.mark.parametrize('lines', [1, 2, 10, 50, 200])
+def test_route_visits_every_bin_and_is_no_longer_than_input_order(lines):
+    rng = random.Random(lines)
+    for _ in range(5):
+        order = rng.sample(BINS, lines)
+        index, distance = plan(order, LAYOUT)
+        assert sorted(index) == list(range(lines))
+        assert distance == pytest.approx(walk_length([order[i] for i in index], LAYOUT))
+        assert distance <= walk_length(order, LAYOUT) + 1e-9
+
+
+def test_empty_order():
+    assert plan([], LAYOUT) == ([], 0.0)
+
+
+def test_two_opt_stops_at_its_deadline():
+    order = random.Random(0).sample(BINS, 800)
+    lanes, depths = LAYOUT.coordinates(order)
+    dist = LAYOUT.distances(lanes, depths)
+    tour = np.arange(1, len(order) + 1)
+    start = time.perf_counter()
+    result = two_opt(tour.copy(), dist, deadline=start + 0.01)
+    # one pass over the tour at most past the deadline
+    assert time.perf_counter() - start < 0.5
+    assert sorted(result) == list(tour)
+
+
+def test_plan_of_200_lines_keeps_to_its_budget():
+    order = random.Random(1).sample(BINS, 200)
+    start = time.perf_counter()
+    plan(order, LAYOUT, budget=0.03)
+    # the budget covers 2-opt; building the distances and start tours comes on top
+    assert time.perf_counter() - start < 0.25
+
+
+@pytest.mark.parametrize('line', [
+    {'part_number': ['BMG-12345'], 'quantity': 1},
+    {'part_number': 'BMG-12345'},
+    'junk',
+])
+def test_route_endpoint_rejects_malformed_lines(stock_client, stock_headers, line):
+    response = stock_client.post('/api/pick/route', json={'lines': [line]}, headers=stock_headers)
+    assert response.status_code == 400
+    assert response.json == {'message': 'Each line needs a part_number and an integer quantity!'}
@@ -0,0 +1,63 @@
+from sqlalchemy import text
+
+
+def _search(stock, term):
+    with stock.app.app_context():
+        matches = stock.product_search.matches(term)
+        rows = stock.db.session.query(stock.Product.part_number)\
+            .join(matches, matches.c.product_id == stock.Product.id).all()
+        return sorted(r[0] for r in rows)
+
+
+def _add(stock, *part_numbers):
+    with stock.app.app_context():
+        for part_number in part_numbers:
+            stock.db.session.add(stock.Product(part_number=part_number, description=f'Widget {part_number}'))
+        stock.db.session.commit()
+
+
+def test_search_follows_inserts_updates_and_deletes(stock_module, stock_client):
+    stock = stock_module
+    _add(stock, 'WID-001', 'WID-002', 'WID-003')
+    assert _search(stock, 'wid-00') == ['WID-001', 'WID-002', 'WID-003']
+
+    with stock.app.app_context():
+        product = stock.Product.query.filter_by(part_number='WID-002').one()
+        product.part_number = 'GAD-002'
+        product.description = 'Gadget'
+        stock.Product.query.filter_by(part_number='WID-003').delete()
+        stock.db.session.commit()
+
+    assert _search(stock, 'wid-00') == ['WID-001']
+    assert _search(stock, 'gadget') == ['GAD-002']
+    assert _search(stock, 'widget wid-003') == []
+
+
+def test_search_does_not_depend_on_product_rowids(stock_module, stock_client):
+    # product has a text primary key, so its rowids are implicit and VACUUM
+    # or a dump and restore may renumber them; simulate that directly
+    stock = stock_module
+    _add(stock, *(f'ROW-{i:03d}' for i in range(20)))
+    with stock.app.app_context():
+        stock.db.session.execute(text('UPDATE product SET rowid = rowid + 1000'))
+        stock.db.session.commit()
+
+    assert _search(stock, 'row-01') == [f'ROW-{i:03d}' for i in range(10, 20)]
+
+
+def test_install_is_repeatable(stock_module, stock_client):
+    stock = stock_module
+    _add(stock, 'REP-001')
+    with stock.app.app_context():
+        stock.product_search.install()
+        stock.product_search.install()
+    assert _search(stock, 'rep-001') == ['REP-001']
+
+
+def test_blueprint_search_does_not_claim_a_correct_bin(wms_app, wms_client, wms_headers):
+    response = wms_client.post('/api/stock/receive', headers=wms_headers,
+                               json={'part_number': 'BMG-12345', 'bin_code': 'A-12-04', 'quantity': 3})
+    assert response.status_code == 200, response.json
+    response = wms_client.get('/api/search?q=BMG-12345')
+    assert response.json['results'] == [{'partNumber': 'BMG-12345', 'description': 'Ball Bearing 6305-2RS',
+                                          'currentBin': 'A-12-04', 'quantity': 3}]
@@ -0,0 +1,87 @@
+import pytest
+
+
+@pytest.fixture
+def bins(stock_module, stock_client):
+    """Put every bin under maintenance except the ones given as {code: capacity}."""
+    stock = stock_module
+
+    def configure(capacities):
+        with stock.app.app_context():
+            stock.BinLocation.query.update({'status': 'maintenance'})
+            for code, capacity in capacities.items():
+                stock.BinLocation.query.filter_by(bin_code=code).update(
+                    {'status': 'available', 'capacity': capacity})
+            stock.db.session.commit()
+        stock.putaway_index._seen = None
+
+    return configure
+
+
+def _suggest(client, headers, qty, part_number='BMG-12345', **params):
+    response = client.get('/api/putaway/suggest', headers=headers,
+                          query_string={'part_number': part_number, 'qty': qty, **params})
+    assert response.status_code == 200, response.json
+    return [(s['bin_code'], s['free_capacity'], s['reason']) for s in response.json['suggestions']]
+
+
+def _receive(client, headers, bin_code, qty, part_number='BMG-12345'):
+    response = client.post('/api/stock/receive', json={
+        'part_number': part_number, 'bin_code': bin_code, 'quantity': qty,
+    }, headers=headers)
+    assert response.status_code == 201, response.json
+
+
+def test_bins_without_room_are_cut_off(stock_client, stock_headers, bins):
+    bins({'B-01-01': 10, 'B-01-02': 30, 'B-01-03': 50, 'C-01-01': 80})
+
+    assert _suggest(stock_client, stock_headers, 30, zone='B') == [
+        ('B-01-02', 30, 'free capacity'),
+        ('B-01-03', 50, 'free capacity'),
+    ]
+    assert _suggest(stock_client, stock_headers, 31, zone='B') == [('B-01-03', 50, 'free capacity')]
+    assert _suggest(stock_client, stock_headers, 51, zone='B') == []
+    assert _suggest(stock_client, stock_headers, 81) == []
+
+
+def test_bins_and_zones_holding_the_product_come_first(stock_client, stock_headers, bins):
+    bins({'A-01-01': 100, 'C-01-01': 100, 'C-01-02': 40, 'D-01-01': 20})
+    _receive(stock_client, stock_headers, 'C-01-01', 10)
+
+    assert _suggest(stock_client, stock_headers, 5) == [
+        ('C-01-01', 90, 'holds product'),
+        ('C-01-02', 40, 'free capacity'),
+        ('A-01-01', 100, 'free capacity'),
+        ('D-01-01', 20, 'free capacity'),
+    ]
+    # with nothing stored, zones are taken in order and bins by best fit
+    assert _suggest(stock_client, stock_headers, 5, part_number='BMG-67890') == [
+        ('A-01-01', 100, 'free capacity'),
+        ('C-01-02', 40, 'free capacity'),
+        ('C-01-01', 90, 'free capacity'),
+        ('D-01-01', 20, 'free capacity'),
+    ]
+    assert _suggest(stock_client, stock_headers, 5, limit=2) == [
+        ('C-01-01', 90, 'holds product'),
+        ('C-01-02', 40, 'free capacity'),
+    ]
+
+
+def test_receive_that_fills_a_bin_drops_it(stock_module, stock_client, stock_headers, bins):
+    bins({'C-01-01': 20, 'C-01-02': 40})
+    assert _suggest(stock_client, stock_headers, 15) == [
+        ('C-01-01', 20, 'free capacity'),
+        ('C-01-02', 40, 'free capacity'),
+    ]
+
+    _receive(stock_client, stock_headers, 'C-01-01', 10, part_number='BMG-67890')
+    assert _suggest(stock_client, stock_headers, 15) == [('C-01-02', 40, 'free capacity')]
+    assert _suggest(stock_client, stock_headers, 10, part_number='BMG-67890') == [
+        ('C-01-01', 10, 'holds product'),
+        ('C-01-02', 40, 'free capacity'),
+    ]
+
+    _receive(stock_client, stock_headers, 'C-01-02', 40)
+    assert _suggest(stock_client, stock_headers, 1) == [('C-01-01', 10, 'free capacity')]
+    # applied from the receive commits, not from a rebuild
+    assert stock_module.putaway_index._seen is not None
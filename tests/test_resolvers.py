@@ -0,0 +1,81 @@
+from resolvers import LRUCache
+
+
+def test_lru_evicts_least_recently_used_at_maxsize():
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1  # 'b' is now the least recently used
+    cache.put('c', 3)
+
+    assert len(cache) == 2
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'hit_rate': 0.75, 'size': 2, 'maxsize': 2}
+
+
+def test_resolve_many_queries_once_for_the_misses(stock_module, statements):
+    stock = stock_module
+    with stock.app.app_context():
+        stock.bin_resolver.invalidate()
+        cached = stock.bin_resolver.resolve('A-01-01')
+        del statements[:]
+
+        found = stock.bin_resolver.resolve_many(['A-01-01', 'A-01-02', 'B-02-03', 'A-01-02', 'NOPE', None])
+        assert sorted(found) == ['A-01-01', 'A-01-02', 'B-02-03']
+        assert found['A-01-01'] == cached
+        assert found['B-02-03'].zone == 'B'
+        assert len(statements) == 1
+
+        del statements[:]
+        assert stock.bin_resolver.resolve_many(['A-01-02', 'B-02-03']) == {
+            code: found[code] for code in ('A-01-02', 'B-02-03')}
+        assert statements == []
+
+
+def test_committed_rename_invalidates(stock_module, stock_client):
+    stock = stock_module
+    with stock.app.app_context():
+        ref = stock.bin_resolver.resolve('A-01-01')
+        assert stock.bin_resolver.resolve('Z-99-99') is None
+
+        bin_location = stock.db.session.get(stock.BinLocation, ref.id)
+        bin_location.bin_code = 'Z-99-99'
+        stock.db.session.flush()
+        assert stock.bin_resolver.resolve('A-01-01') == ref  # not committed yet
+        stock.db.session.rollback()
+        assert stock.bin_resolver.resolve('A-01-01') == ref
+
+        bin_location = stock.db.session.get(stock.BinLocation, ref.id)
+        bin_location.bin_code = 'Z-99-99'
+        stock.db.session.commit()
+        assert stock.bin_resolver.resolve('A-01-01') is None
+        assert stock.bin_resolver.resolve('Z-99-99').id == ref.id
+
+        # other columns a snapshot carries
+        product = stock.Product.query.filter_by(part_number='BMG-12345').one()
+        assert stock.product_resolver.resolve('BMG-12345').min_stock_level == 10
+        product.min_stock_level = 25
+        stock.db.session.commit()
+        assert stock.product_resolver.resolve('BMG-12345').min_stock_level == 25
+
+
+def test_committed_delete_invalidates(wms_app, wms_client, wms_headers):
+    from db import db
+    from models import BinLocation, Product, bin_resolver, product_resolver
+
+    assert wms_client.post('/api/bins', json={'code': 'X-1', 'capacity': 5},
+                           headers=wms_headers).status_code == 201
+    with wms_app.app_context():
+        ref = bin_resolver.resolve('X-1')
+        db.session.delete(db.session.get(BinLocation, ref.id))
+        db.session.commit()
+        assert bin_resolver.resolve('X-1') is None
+
+        product = Product.query.filter_by(part_number='BMG-12345').one()
+        assert product_resolver.resolve('BMG-12345').id == product.id
+        db.session.delete(product)
+        db.session.commit()
+        assert product_resolver.resolve('BMG-12345') is None
+    assert wms_client.post('/api/products', json={'part_number': 'BMG-12345'},
+                           headers=wms_headers).status_code == 201
@@ -0,0 +1,56 @@
+"""Pick velocity and re-slotting in stock.py."""
+
+import pytest
+from sqlalchemy import text
+
+from stock_atomic import StockConflict
+
+
+def _dispatch(client, headers, part_number, bin_code, quantity):
+    return client.post('/api/stock/dispatch', headers=headers, json={
+        'part_number': part_number, 'bin_code': bin_code, 'quantity': quantity,
+    })
+
+
+def _seed(stock, quantity=100):
+    with stock.app.app_context():
+        product = stock.Product.query.first()
+        bin_location = stock.BinLocation.query.first()
+        stock.db.session.add(stock.StockItem(product_id=product.id, bin_location_id=bin_location.id,
+                                             quantity=quantity))
+        stock.db.session.commit()
+        return product.id, product.part_number, bin_location.bin_code
+
+
+def test_dispatches_add_up_in_velocity(stock_module, stock_client, stock_headers):
+    stock = stock_module
+    product_id, part_number, bin_code = _seed(stock)
+    for _ in range(3):
+        assert _dispatch(stock_client, stock_headers, part_number, bin_code, 2).status_code == 200
+
+    with stock.app.app_context():
+        score = stock.db.session.get(stock.ProductVelocity, product_id).score
+        # six units picked just now, in picks per day
+        assert stock.slotting.velocity(score) == pytest.approx(6 / stock.slotting.tau, rel=1e-3)
+
+
+def test_record_pick_does_not_overwrite_a_concurrent_pick(stock_module, stock_client, stock_headers, monkeypatch):
+    stock = stock_module
+    product_id, part_number, bin_code = _seed(stock)
+    assert _dispatch(stock_client, stock_headers, part_number, bin_code, 1).status_code == 200
+
+    import slotting
+    log_add = slotting._log_add
+
+    def racing(a, b):
+        # another request records its pick between our read and our write
+        with stock.db.engine.begin() as conn:
+            conn.execute(text('UPDATE product_velocity SET score = score + 1 WHERE product_id = :id'),
+                         {'id': product_id})
+        return log_add(a, b)
+
+    monkeypatch.setattr(slotting, '_log_add', racing)
+    with stock.app.app_context():
+        with pytest.raises(StockConflict):
+            stock.slotting.record_pick(stock.db.session, product_id, 1)
+        stock.db.session.rollback()
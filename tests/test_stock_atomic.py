@@ -0,0 +1,128 @@
+"""Concurrent stock updates on a SQLite file, from several threads at once."""
+
+import random
+import threading
+
+from sqlalchemy.exc import OperationalError
+
+THREADS = 8
+
+
+def _run(target, count=THREADS):
+    errors = []
+
+    def guarded(i):
+        try:
+            target(i)
+        except Exception as e:  # surfaced below, with the thread's traceback lost
+            errors.append(e)
+
+    threads = [threading.Thread(target=guarded, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors, errors
+
+
+def test_take_put_adjust_conserve_stock(wms_app, wms_client):
+    from db import db
+    from models import BinLocation, Product, StockItem
+    from stock_atomic import adjust, put, retry_on_conflict, take
+
+    with wms_app.app_context():
+        product = Product.query.filter_by(part_number='BMG-12345').one()
+        bins = [BinLocation(code=f'S-{i:02d}', capacity=1000) for i in range(4)]
+        db.session.add_all(bins)
+        db.session.flush()
+        items = [StockItem(product_id=product.id, bin_id=b.id, quantity=100) for b in bins]
+        db.session.add_all(items)
+        db.session.commit()
+        ids = [item.id for item in items]
+
+    @retry_on_conflict(db.session)
+    def move(src, dst, qty, use_adjust):
+        left = adjust(db.session, StockItem, src, -qty) if use_adjust else take(db.session, StockItem, src, qty)
+        if left is None:
+            db.session.rollback()
+            return False
+        assert left >= 0
+        if use_adjust:
+            adjust(db.session, StockItem, dst, qty)
+        else:
+            put(db.session, StockItem, dst, qty)
+        db.session.commit()
+        return True
+
+    def worker(i):
+        rng = random.Random(i)
+        with wms_app.app_context():
+            for _ in range(60):
+                src, dst = rng.sample(ids, 2)
+                try:
+                    move(src, dst, rng.randint(1, 40), rng.random() < 0.5)
+                except OperationalError:
+                    pass  # gave up after the retries; nothing was written
+
+    _run(worker)
+
+    with wms_app.app_context():
+        quantities = [q for (q,) in db.session.query(StockItem.quantity).filter(StockItem.id.in_(ids))]
+    assert sum(quantities) == 400
+    assert min(quantities) >= 0
+
+
+def _post(wms_app, headers, path, body):
+    return wms_app.test_client().post(path, json=body, headers=headers)
+
+
+def test_concurrent_receives_of_a_new_lot_share_one_stock_item(wms_app, wms_client, wms_headers):
+    from models import StockItem, StockMovement
+
+    ok = []
+
+    def worker(i):
+        for _ in range(10):
+            response = _post(wms_app, wms_headers, '/api/stock/receive', {
+                'part_number': 'BMG-12345', 'bin_code': 'A-12-04', 'quantity': 1, 'batch': 'LOT-1',
+            })
+            if response.status_code == 200:
+                ok.append(1)
+
+    _run(worker)
+
+    with wms_app.app_context():
+        items = StockItem.query.filter_by(batch='LOT-1').all()
+        movements = StockMovement.query.filter_by(reason='receive', batch='LOT-1').count()
+    assert len(items) == 1
+    assert items[0].quantity == movements == len(ok)
+    assert len(ok) > 0
+
+
+def test_mixed_stock_operations_conserve_stock(wms_app, wms_client, wms_headers):
+    from models import BinLocation, StockItem, StockMovement
+
+    assert wms_client.post('/api/bins', json={'code': 'B-01', 'capacity': 10000}, headers=wms_headers).status_code == 201
+    assert wms_client.post('/api/stock/receive', json={
+        'part_number': 'BMG-12345', 'bin_code': 'A-12-04', 'quantity': 1000,
+    }, headers=wms_headers).status_code == 200
+
+    def worker(i):
+        line = {'part_number': 'BMG-12345', 'quantity': 1 + i % 3}
+        for _ in range(20):
+            if i % 3 == 0:
+                _post(wms_app, wms_headers, '/api/stock/dispatch', dict(line, bin_code='A-12-04'))
+            elif i % 3 == 1:
+                _post(wms_app, wms_headers, '/api/stock/transfer', dict(line, from_bin='A-12-04', to_bin='B-01'))
+            else:
+                _post(wms_app, wms_headers, '/api/stock/batch', {'lines': [dict(line, op='dispatch', bin_code='A-12-04')]})
+
+    _run(worker)
+
+    with wms_app.app_context():
+        held = {code: qty for code, qty in StockItem.query.join(BinLocation).with_entities(BinLocation.code, StockItem.quantity)}
+        dispatched = sum(m.quantity for m in StockMovement.query.filter_by(reason='dispatch'))
+        transferred = sum(m.quantity for m in StockMovement.query.filter_by(reason='transfer'))
+    assert held['A-12-04'] + held.get('B-01', 0) + dispatched == 1000
+    assert held.get('B-01', 0) == transferred
+    assert min(held.values()) >= 0
@@ -0,0 +1,160 @@
+import pytest
+
+
+def _batch(client, headers, lines, atomic=False):
+    return client.post('/api/stock/batch', json={'lines': lines, 'atomic': atomic}, headers=headers)
+
+
+def test_batch_applies_receive_dispatch_and_transfer(wms_app, wms_client, wms_headers):
+    assert wms_client.post('/api/bins', json={'code': 'B-01-01', 'capacity': 100}, headers=wms_headers).status_code == 201
+    response = _batch(wms_client, wms_headers, [
+        {'op': 'receive', 'part_number': 'BMG-12345', 'bin_code': 'A-12-04', 'quantity': 10},
+        {'op': 'dispatch', 'part_number': 'BMG-12345', 'bin_code': 'A-12-04', 'quantity': 3},
+        {'op': 'transfer', 'part_number': 'BMG-12345', 'from_bin': 'A-12-04', 'to_bin': 'B-01-01', 'quantity': 2},
+    ], atomic=True)
+    assert response.status_code == 200, response.json
+    assert response.json['applied'] == 3
+    assert [r.get('remaining') for r in response.json['results']][1] == 7
+    assert response.json['results'][2]['from_remaining'] == 5
+
+
+@pytest.mark.parametrize('line, error', [
+    ('junk', 'op must be receive, dispatch or transfer'),
+    (['receive'], 'op must be receive, dispatch or transfer'),
+    (None, 'op must be receive, dispatch or transfer'),
+    ({'op': 'receive', 'part_number': ['BMG-12345'], 'bin_code': 'A-12-04', 'quantity': 1}, 'product not found'),
+    ({'op': 'receive', 'part_number': {'a': 1}, 'bin_code': 'A-12-04', 'quantity': 1}, 'product not found'),
+    ({'op': 'receive', 'part_number': 'BMG-12345', 'bin_code': ['A-12-04'], 'quantity': 1}, 'bin not found'),
+    ({'op': 'transfer', 'part_number': 'BMG-12345', 'from_bin': {}, 'to_bin': 'A-12-04', 'quantity': 1}, 'bin not found'),
+    ({'op': 'receive', 'part_number': 'BMG-12345', 'bin_code': 'A-12-04', 'quantity': 1, 'batch': ['L1']}, 'invalid batch'),
+])
+def test_batch_reports_malformed_lines(wms_app, wms_client, wms_headers, line, error):
+    good = {'op': 'receive', 'part_number': 'BMG-12345', 'bin_code': 'A-12-04', 'quantity': 4}
+    response = _batch(wms_client, wms_headers, [line, good])
+    assert response.status_code == 200, response.json
+    assert response.json['failed'] == 1
+    assert response.json['applied'] == 1
+    assert response.json['results'][0] == {'line': 0, 'error': error}
+
+    response = _batch(wms_client, wms_headers, [line], atomic=True)
+    assert response.status_code == 400
+    assert response.json['results'] == [{'line': 0, 'error': error}]
+
+
+def test_batch_dispatch_splits_across_lots_like_dispatch(wms_app, wms_client, wms_headers):
+    from datetime import date, timedelta
+    from models import StockMovement
+
+    soon, later, past = (date.today() + timedelta(days=d) for d in (10, 40, -1))
+    for batch, expiry, qty in (('LATE', later, 5), ('SOON', soon, 3), ('GONE', past, 50)):
+        response = wms_client.post('/api/stock/receive', headers=wms_headers, json={
+            'part_number': 'BMG-12345', 'bin_code': 'A-12-04', 'quantity': qty,
+            'batch': batch, 'expiry_date': expiry.isoformat(),
+        })
+        assert response.status_code == 200, response.json
+
+    line = {'op': 'dispatch', 'part_number': 'BMG-12345', 'bin_code': 'A-12-04', 'quantity': 6}
+    response = _batch(wms_client, wms_headers, [line], atomic=True)
+    assert response.status_code == 200, response.json
+    result = response.json['results'][0]
+    assert [(a['batch'], a['quantity'], a['remaining']) for a in result['allocations']] == [('SOON', 3, 0), ('LATE', 3, 2)]
+    assert result['remaining'] == 2
+
+    # the expired lot is never allocated, so 3 more is too much
+    response = _batch(wms_client, wms_headers, [dict(line, quantity=3)], atomic=True)
+    assert response.json['results'] == [{'line': 0, 'error': 'insufficient stock'}]
+
+    response = _batch(wms_client, wms_headers, [dict(line, quantity=1, policy='lifo')])
+    assert response.json['results'][0]['error'] == 'policy must be one of fefo, fifo'
+
+    with wms_app.app_context():
+        dispatched = StockMovement.query.filter_by(reason='dispatch').order_by(StockMovement.id).all()
+        assert [(m.batch, m.quantity) for m in dispatched] == [('SOON', 3), ('LATE', 3)]
+
+
+def test_batch_dispatch_without_a_bin_allocates_across_bins(wms_app, wms_client, wms_headers):
+    assert wms_client.post('/api/bins', json={'code': 'B-01-01', 'capacity': 100}, headers=wms_headers).status_code == 201
+    response = _batch(wms_client, wms_headers, [
+        {'op': 'receive', 'part_number': 'BMG-12345', 'bin_code': 'A-12-04', 'quantity': 4, 'batch': 'L1'},
+        {'op': 'receive', 'part_number': 'BMG-12345', 'bin_code': 'B-01-01', 'quantity': 4, 'batch': 'L2'},
+        # lots received earlier in the same batch are allocated too
+        {'op': 'dispatch', 'part_number': 'BMG-12345', 'quantity': 6, 'policy': 'fifo'},
+        {'op': 'dispatch', 'part_number': 'BMG-12345', 'quantity': 3},
+    ])
+    assert response.status_code == 200, response.json
+    dispatched, short = response.json['results'][2:]
+    assert [(a['bin'], a['batch'], a['quantity'], a['remaining']) for a in dispatched['allocations']] == [
+        ('A-12-04', 'L1', 4, 0), ('B-01-01', 'L2', 2, 2)]
+    assert short == {'line': 3, 'error': 'insufficient stock'}
+    assert response.json['applied'] == 4  # two receives, two dispatch splits
+
+    # the failed line rolls the whole atomic batch back, including what was written for allocation
+    response = _batch(wms_client, wms_headers, [
+        {'op': 'dispatch', 'part_number': 'BMG-12345', 'quantity': 1},
+        {'op': 'dispatch', 'part_number': 'BMG-12345', 'quantity': 5},
+    ], atomic=True)
+    assert response.status_code == 400
+    with wms_app.app_context():
+        from models import StockItem
+        assert sorted(q for (q,) in StockItem.query.with_entities(StockItem.quantity)) == [0, 2]
+
+
+def _receive(client, headers, bin_code, batch, expiry, qty):
+    response = client.post('/api/stock/receive', headers=headers, json={
+        'part_number': 'BMG-12345', 'bin_code': bin_code, 'quantity': qty,
+        'batch': batch, 'expiry_date': expiry.isoformat(),
+    })
+    assert response.status_code == 200, response.json
+
+
+def test_transfer_keeps_lots_apart_for_fefo(wms_app, wms_client, wms_headers):
+    from datetime import date, timedelta
+    from models import StockMovement
+
+    soon, later = date.today() + timedelta(days=5), date.today() + timedelta(days=50)
+    assert wms_client.post('/api/bins', json={'code': 'B-01-01', 'capacity': 100}, headers=wms_headers).status_code == 201
+    _receive(wms_client, wms_headers, 'A-12-04', 'SOON', soon, 4)
+    _receive(wms_client, wms_headers, 'B-01-01', 'LATE', later, 10)
+
+    # LOT SOON moves into a bin holding LOT LATE and stays a lot of its own
+    response = wms_client.post('/api/stock/transfer', headers=wms_headers, json={
+        'part_number': 'BMG-12345', 'from_bin': 'A-12-04', 'to_bin': 'B-01-01', 'quantity': 4,
+    })
+    assert response.status_code == 200, response.json
+    assert response.json['allocations'] == [{'batch': 'SOON', 'expiry_date': soon.isoformat(), 'quantity': 4,
+                                             'from_remaining': 0, 'to_quantity': 4}]
+
+    response = wms_client.post('/api/stock/dispatch', headers=wms_headers, json={
+        'part_number': 'BMG-12345', 'bin_code': 'B-01-01', 'quantity': 5, 'policy': 'fefo',
+    })
+    assert response.status_code == 200, response.json
+    assert [(a['batch'], a['quantity']) for a in response.json['allocations']] == [('SOON', 4), ('LATE', 1)]
+
+    with wms_app.app_context():
+        moved = StockMovement.query.filter_by(reason='transfer').one()
+        assert (moved.batch, moved.quantity) == ('SOON', 4)
+
+
+def test_batch_receive_and_transfer_carry_batch_and_expiry(wms_app, wms_client, wms_headers):
+    from datetime import date, timedelta
+    from models import BinLocation, StockItem
+
+    soon, later = date.today() + timedelta(days=5), date.today() + timedelta(days=50)
+    assert wms_client.post('/api/bins', json={'code': 'B-01-01', 'capacity': 100}, headers=wms_headers).status_code == 201
+    _receive(wms_client, wms_headers, 'B-01-01', 'LATE', later, 10)
+    response = _batch(wms_client, wms_headers, [
+        {'op': 'receive', 'part_number': 'BMG-12345', 'bin_code': 'A-12-04', 'quantity': 4,
+         'batch': 'SOON', 'expiry_date': soon.isoformat()},
+        {'op': 'transfer', 'part_number': 'BMG-12345', 'from_bin': 'A-12-04', 'to_bin': 'B-01-01', 'quantity': 3},
+        {'op': 'receive', 'part_number': 'BMG-12345', 'bin_code': 'A-12-04', 'quantity': 1, 'expiry_date': 'soon'},
+    ])
+    assert response.status_code == 200, response.json
+    assert response.json['results'][1]['allocations'][0]['batch'] == 'SOON'
+    assert response.json['results'][2]['error'] == 'invalid expiry_date, expected YYYY-MM-DD'
+
+    with wms_app.app_context():
+        lots = StockItem.query.join(BinLocation).with_entities(
+            BinLocation.code, StockItem.batch, StockItem.expiry_date, StockItem.quantity
+        ).order_by(BinLocation.code, StockItem.batch).all()
+    assert [tuple(lot) for lot in lots] == [
+        ('A-12-04', 'SOON', soon, 1), ('B-01-01', 'LATE', later, 10), ('B-01-01', 'SOON', soon, 3)]
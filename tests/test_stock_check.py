@@ -0,0 +1,73 @@
+import base64
+import json
+
+import pytest
+
+
+def _seed(stock, products, bins_each):
+    with stock.app.app_context():
+        bins = stock.BinLocation.query.order_by(stock.BinLocation.bin_code).limit(bins_each).all()
+        for i in range(products):
+            product = stock.Product(part_number=f'TST-{i:05d}', description='Test bearing')
+            stock.db.session.add(product)
+            stock.db.session.flush()
+            for b in bins:
+                stock.db.session.add(stock.StockItem(product_id=product.id, bin_location_id=b.id, quantity=5))
+        stock.db.session.commit()
+
+
+def _check(client, headers, **body):
+    return client.post('/api/stock/check', json={'search_term': 'test bearing', **body}, headers=headers)
+
+
+@pytest.mark.parametrize('limit', [5, 50, 200])
+def test_check_stock_statement_count_does_not_grow_with_page(stock_module, stock_client, stock_headers,
+                                                             statements, limit):
+    _seed(stock_module, products=100, bins_each=3)
+    _check(stock_client, stock_headers, limit=1)  # authenticate once; the token is then cached
+    statements.clear()
+
+    response = _check(stock_client, stock_headers, limit=limit)
+
+    assert response.status_code == 200
+    assert len(response.json) == limit
+    assert len([s for s in statements if s.lstrip().upper().startswith('SELECT')]) == 1
+
+
+def test_check_stock_pages_cover_every_row_once(stock_module, stock_client, stock_headers):
+    _seed(stock_module, products=40, bins_each=3)
+    rows, cursor = [], None
+    while True:
+        response = _check(stock_client, stock_headers, limit=7, cursor=cursor)
+        assert response.status_code == 200
+        rows.extend(response.json)
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+    assert len(rows) == 120
+    assert len({(r['part_number'], r['current_bin']) for r in rows}) == 120
+
+
+def _cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+@pytest.mark.parametrize('cursor', [
+    _cursor([1.0, 'TST-00001']),
+    _cursor({'rank': 1}),
+    _cursor(['x', 'TST-00001', 'id']),
+    _cursor([1.0, ['TST'], 'id']),
+    _cursor('text'),
+])
+def test_check_stock_rejects_malformed_cursor(stock_module, stock_client, stock_headers, cursor):
+    _seed(stock_module, products=3, bins_each=1)
+    response = _check(stock_client, stock_headers, cursor=cursor)
+    assert response.status_code == 400
+    assert response.json == {'message': 'Invalid cursor!'}
+
+
+def test_check_stock_ignores_undecodable_cursor(stock_module, stock_client, stock_headers):
+    _seed(stock_module, products=3, bins_each=1)
+    response = _check(stock_client, stock_headers, cursor='not a cursor!')
+    assert response.status_code == 200
+    assert len(response.json) == 3
@@ -0,0 +1,55 @@
+"""Streaming stock export (blueprint app)."""
+
+import csv
+import gzip
+import io
+import json
+
+from routes_stock import EXPORT_FIELDS
+
+
+def _seed(wms_app, count):
+    from datetime import date
+    from db import db
+    from models import BinLocation, Product, StockItem
+    with wms_app.app_context():
+        product = Product.query.filter_by(part_number='BMG-12345').one()
+        bins = [BinLocation(code=f'EX-{i:03d}') for i in range(count)]
+        db.session.add_all(bins)
+        db.session.flush()
+        db.session.add_all(StockItem(product_id=product.id, bin_id=b.id, quantity=i + 1, batch=f'B{i}',
+                                     expiry_date=date(2030, 1, 1) if i % 2 else None)
+                           for i, b in enumerate(bins))
+        db.session.commit()
+
+
+def test_csv_export_streams_every_item(wms_app, wms_client, wms_headers):
+    _seed(wms_app, 25)
+    response = wms_client.get('/api/stock/export', headers=wms_headers)
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == EXPORT_FIELDS
+    assert len(rows) == 1 + 25
+    assert rows[2][EXPORT_FIELDS.index('expiry_date')] == '2030-01-01'
+    assert [int(r[0]) for r in rows[1:]] == sorted(int(r[0]) for r in rows[1:])
+
+
+def test_ndjson_export_is_gzipped_on_request(wms_app, wms_client, wms_headers):
+    _seed(wms_app, 10)
+    response = wms_client.get('/api/stock/export?format=ndjson',
+                              headers=dict(wms_headers, **{'Accept-Encoding': 'gzip'}))
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    lines = gzip.decompress(response.get_data()).decode().splitlines()
+    rows = [json.loads(line) for line in lines]
+    assert len(rows) == 10
+    assert all(list(row) == EXPORT_FIELDS for row in rows)
+    assert rows[0]['part_number'] == 'BMG-12345'
+
+
+def test_export_format_and_role(wms_app, wms_client, wms_headers, wms_employee_headers):
+    assert wms_client.get('/api/stock/export?format=xlsx', headers=wms_headers).status_code == 400
+    assert wms_client.get('/api/stock/export', headers=wms_employee_headers).status_code == 403
+    assert wms_client.get('/api/stock/export').status_code == 401
@@ -0,0 +1,75 @@
+import random
+import string
+
+import pytest
+
+from stock_service import SAMPLE_DATA, StockSearchIndex, search_stock
+
+
+def _random_items(rng, n):
+    items = []
+    for i in range(n):
+        item = {"description": "".join(rng.choice("abc -") for _ in range(rng.randint(0, 12)))}
+        if rng.random() < 0.9:
+            # few distinct part numbers, so plenty of duplicates
+            item["partNumber"] = "P-" + "".join(rng.choice("12x") for _ in range(rng.randint(0, 3)))
+        items.append(item)
+    return items
+
+
+def _queries(rng):
+    yield from ["", "   ", "p", "P-1", "x", "ab", "abc", "bca ", "p-12x", "zzzz", "c -a"]
+    for _ in range(200):
+        yield "".join(rng.choice("abcp-12x ") for _ in range(rng.randint(1, 6)))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_index_matches_linear_scan(seed):
+    rng = random.Random(seed)
+    items = _random_items(rng, 300)
+    index = StockSearchIndex(items)
+    assert len(index) == len(items)
+    for q in _queries(rng):
+        assert index.search(q) == search_stock(q, items), q
+
+
+def test_index_keeps_duplicate_and_missing_part_numbers():
+    items = [
+        {"partNumber": "BMG-1", "description": "first"},
+        {"partNumber": "BMG-1", "description": "second"},
+        {"description": "no part number"},
+        {"description": "also no part number"},
+    ]
+    index = StockSearchIndex(items)
+    assert index.search("bmg-1") == items[:2]
+    assert index.search("part number") == items[2:]
+    assert index.keys("BMG-1") == [0, 1]
+
+
+def test_update_and_remove_follow_the_scan():
+    items = [dict(item) for item in SAMPLE_DATA]
+    index = StockSearchIndex(items)
+
+    first = index.keys("BMG-12345")[0]
+    items[0] = dict(items[0], description="Thrust Bearing 51105")
+    index.update(first, items[0])
+    assert index.search("thrust") == search_stock("thrust", items) == [items[0]]
+    assert index.search("bearing") == search_stock("bearing", items)
+
+    assert index.remove(first)
+    assert not index.remove(first)
+    del items[0]
+    assert "BMG-12345" not in index
+    for q in ("bmg", "bearing", "thrust", "12345"):
+        assert index.search(q) == search_stock(q, items)
+
+    items.append(dict(SAMPLE_DATA[0]))
+    index.add(items[-1])
+    assert index.search("bmg") == search_stock("bmg", items)
+    assert index.search("bmg")[-1] is items[-1]
+
+
+def test_search_stock_defaults_to_sample_index():
+    assert search_stock("bmg") == SAMPLE_DATA
+    assert search_stock(" 6305 ") == [SAMPLE_DATA[0]]
+    assert search_stock("") == []
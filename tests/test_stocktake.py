@@ -0,0 +1,68 @@
+"""Stocktake sessions in stock.py."""
+
+import pytest
+
+
+@pytest.fixture
+def session_id(stock_client, stock_headers):
+    response = stock_client.post('/api/stocktake/sessions', json={'zone': 'A'}, headers=stock_headers)
+    assert response.status_code == 201, response.json
+    return response.json['id']
+
+
+@pytest.mark.parametrize('count, message', [
+    ({'part_number': ['BMG-12345'], 'bin_code': 'A-01-01', 'counted_quantity': 1}, 'Product not found!'),
+    ({'part_number': {'a': 1}, 'bin_code': 'A-01-01', 'counted_quantity': 1}, 'Product not found!'),
+    ({'part_number': 'BMG-12345', 'bin_code': ['A-01-01'], 'counted_quantity': 1}, 'Bin location not in this zone!'),
+    ({'part_number': 'BMG-12345', 'bin_code': 'B-01-01', 'counted_quantity': 1}, 'Bin location not in this zone!'),
+    ({'part_number': 'BMG-12345', 'bin_code': 'A-01-01', 'counted_quantity': '1'},
+     'counted_quantity must be a non-negative integer!'),
+    ('junk', 'Product not found!'),
+])
+def test_malformed_counts_are_reported_per_line(stock_client, stock_headers, session_id, count, message):
+    good = {'part_number': 'BMG-12345', 'bin_code': 'A-01-01', 'counted_quantity': 4}
+    response = stock_client.post(f'/api/stocktake/sessions/{session_id}/counts',
+                                 json={'counts': [count, good]}, headers=stock_headers)
+    assert response.status_code == 200, response.json
+    assert response.json['recorded'] == 1
+    assert response.json['errors'] == [{'index': 0, 'message': message}]
+
+
+def test_approval_never_drives_stock_negative(stock_module, stock_client, stock_headers, monkeypatch):
+    stock = stock_module
+    with stock.app.app_context():
+        product = stock.Product.query.filter_by(part_number='BMG-12345').one()
+        bin_location = stock.BinLocation.query.filter_by(bin_code='A-01-01').one()
+        item = stock.StockItem(product_id=product.id, bin_location_id=bin_location.id, quantity=10)
+        stock.db.session.add(item)
+        stock.db.session.commit()
+        item_id = item.id
+
+    response = stock_client.post('/api/stocktake/sessions', json={'zone': 'A'}, headers=stock_headers)
+    session_id = response.json['id']
+    response = stock_client.post(f'/api/stocktake/sessions/{session_id}/counts', headers=stock_headers,
+                                 json={'counts': [{'part_number': 'BMG-12345', 'bin_code': 'A-01-01',
+                                                   'counted_quantity': 4}]})
+    assert response.json['recorded'] == 1
+
+    adjust = stock.adjust
+    dispatched = []
+
+    def racing(session, model, item_id, delta):
+        if not dispatched:
+            # 8 taken between the approval's read and its write; SQLite
+            # serialises writers, so it happens in the approval's transaction
+            session.execute(model.__table__.update().where(model.id == item_id)
+                            .values(quantity=model.quantity - 8))
+            dispatched.append(item_id)
+        return adjust(session, model, item_id, delta)
+
+    monkeypatch.setattr(stock, 'adjust', racing)
+    response = stock_client.post(f'/api/stocktake/sessions/{session_id}/approve', headers=stock_headers)
+    assert response.status_code == 200, response.json
+
+    # the conflict rolled back the claim (and the take) and the retry applied the count
+    assert len(dispatched) == 1
+    with stock.app.app_context():
+        assert stock.db.session.get(stock.StockItem, item_id).quantity == 4
+        assert stock.db.session.get(stock.StocktakeSession, session_id).status == 'approved'
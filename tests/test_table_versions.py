@@ -0,0 +1,69 @@
+import threading
+
+
+def _receive(client, headers, qty=1):
+    response = client.post('/api/stock/receive', json={
+        'part_number': 'BMG-12345', 'bin_code': 'A-12-04', 'quantity': qty,
+    }, headers=headers)
+    assert response.status_code == 200
+
+
+def test_etag_follows_writes(wms_app, wms_client, wms_headers):
+    first = wms_client.get('/api/stock/items', headers=wms_headers)
+    etag = first.headers['ETag']
+    assert wms_client.get('/api/stock/items', headers={**wms_headers, 'If-None-Match': etag}).status_code == 304
+
+    _receive(wms_client, wms_headers)
+    changed = wms_client.get('/api/stock/items', headers={**wms_headers, 'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.json[0]['quantity'] == 1
+
+
+def test_every_commit_adds_exactly_one_across_shards(wms_app, wms_client, wms_headers):
+    from db import db
+    from models import TableVersion, table_versions
+
+    _receive(wms_client, wms_headers)
+    with wms_app.app_context():
+        (start,) = table_versions.current(['stock_item'])
+
+    def worker():
+        client = wms_app.test_client()
+        for _ in range(10):
+            _receive(client, wms_headers)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    with wms_app.app_context():
+        assert table_versions.current(['stock_item']) == (start + 40,)
+        shards = db.session.query(TableVersion.shard).filter_by(name='stock_item').count()
+    assert shards > 1
+
+
+def test_putaway_index_follows_committed_versions(stock_module, stock_client, stock_headers):
+    stock = stock_module
+    with stock.app.app_context():
+        bin_code = stock.BinLocation.query.order_by(stock.BinLocation.bin_code).first().bin_code
+
+    def suggest():
+        response = stock_client.get('/api/putaway/suggest', headers=stock_headers,
+                                    query_string={'part_number': 'BMG-12345', 'qty': 1})
+        assert response.status_code == 200, response.json
+        return response.json
+
+    suggest()  # builds the index
+    for _ in range(3):
+        assert stock_client.post('/api/stock/receive', json={
+            'part_number': 'BMG-12345', 'bin_code': bin_code, 'quantity': 5,
+        }, headers=stock_headers).status_code == 201
+    # applied from the commits, with no rebuild in between
+    assert stock.putaway_index._seen is not None
+    suggestions = suggest()
+    with stock.app.app_context():
+        stock.putaway_index._load()  # what a rebuild would find
+    assert suggest() == suggestions
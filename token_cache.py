@@ -0,0 +1,106 @@
+"""Short-lived cache of verified bearer tokens.
+
+Checking a token means verifying its signature and loading its user from the
+database on every request. A :class:`TokenCache` remembers the outcome per
+token, keyed by the token's SHA-256 so the cache never holds a usable
+credential, until the token expires or ``ttl`` seconds pass, whichever comes
+first.
+
+Commits that change a watched user's role or active flag, or delete the user,
+drop that user's entries at once; other worker processes see the change
+within ``ttl``.
+"""
+
+import hashlib
+import time
+
+from sqlalchemy import event, inspect
+
+from resolvers import LRUCache
+
+
+def _key(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class TokenCache(LRUCache):
+    def __init__(self, maxsize=10000, ttl=60):
+        super().__init__(maxsize)
+        self.ttl = ttl
+        self._by_user = {}
+
+    def get(self, token):
+        key = _key(token)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[2] <= time.time():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token, user_id, value, expires_at=None):
+        """Cache `value` for `token` until `expires_at` (epoch seconds) or the TTL."""
+        expires = time.time() + self.ttl
+        if expires_at is not None:
+            expires = min(expires, expires_at)
+        key = _key(token)
+        with self._lock:
+            self._drop(key)
+            self._data[key] = (value, user_id, expires)
+            self._by_user.setdefault(user_id, set()).add(key)
+            while len(self._data) > self.maxsize:
+                self._drop(next(iter(self._data)))
+
+    def _drop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            keys = self._by_user.get(entry[1])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_user[entry[1]]
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._data.clear()
+                self._by_user.clear()
+            else:
+                self._drop(_key(key))
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._drop(key)
+
+    # Invalidation on user changes
+
+    def watch(self, database, model, fields=('role', 'is_active')):
+        """Drop a user's tokens once a commit changes `fields` of, or deletes, a `model` row."""
+        fields = [f for f in fields if hasattr(model, f)]
+
+        def after_flush(session, flush_context):
+            for obj in session.dirty:
+                if isinstance(obj, model):
+                    attrs = inspect(obj).attrs
+                    if any(attrs[f].history.has_changes() for f in fields):
+                        session.info.setdefault('token_cache_users', set()).add(obj.id)
+            for obj in session.deleted:
+                if isinstance(obj, model):
+                    session.info.setdefault('token_cache_users', set()).add(obj.id)
+
+        def after_commit(session):
+            for user_id in session.info.pop('token_cache_users', ()):
+                self.invalidate_user(user_id)
+
+        def after_rollback(session):
+            session.info.pop('token_cache_users', None)
+
+        event.listen(database.session, 'after_flush', after_flush)
+        event.listen(database.session, 'after_commit', after_commit)
+        event.listen(database.session, 'after_rollback', after_rollback)